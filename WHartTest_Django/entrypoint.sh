@@ -7,11 +7,15 @@ set -e
 echo "Applying database migrations..."
 python manage.py migrate --noinput
 
-# 2. 创建默认管理员用户
+# 2. 为仅存在于 checkpoints 中的历史会话补登记 ChatSession（会话列表只查询该表，可重复执行）
+echo "Reconciling chat sessions from checkpoints..."
+python manage.py reconcile_chat_sessions || echo "Chat session reconciliation failed, the scheduled task will retry."
+
+# 3. 创建默认管理员用户
 #    (使用 Dockerfile 中发现的 init_admin 命令)
 echo "Creating default admin user if it does not exist..."
 python manage.py init_admin
 
-# 3. 启动 supervisord 来管理所有服务
+# 4. 启动 supervisord 来管理所有服务
 echo "Starting supervisord..."
 exec supervisord -c /app/supervisord.conf
\ No newline at end of file
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import KnowledgeBase, Document, DocumentChunk, QueryLog
+from .models import KnowledgeBase, Document, DocumentChunk, QueryLog, EmbeddingCache, ServiceHealthCheck
 
 
 @admin.register(KnowledgeBase)
@@ -59,6 +59,14 @@ class DocumentChunkAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'created_at']
 
 
+@admin.register(EmbeddingCache)
+class EmbeddingCacheAdmin(admin.ModelAdmin):
+    list_display = ['content_hash', 'embedding_service', 'model_name', 'created_at']
+    list_filter = ['embedding_service', 'model_name', 'created_at']
+    search_fields = ['content_hash']
+    readonly_fields = ['created_at']
+
+
 @admin.register(QueryLog)
 class QueryLogAdmin(admin.ModelAdmin):
     list_display = ['knowledge_base', 'user', 'query_preview', 'total_time', 'created_at']
@@ -69,3 +77,9 @@ class QueryLogAdmin(admin.ModelAdmin):
     def query_preview(self, obj):
         return obj.query[:50] + '...' if len(obj.query) > 50 else obj.query
     query_preview.short_description = '查询预览'
+
+
+@admin.register(ServiceHealthCheck)
+class ServiceHealthCheckAdmin(admin.ModelAdmin):
+    list_display = ['service', 'status', 'model_name', 'latency_ms', 'checked_at']
+    readonly_fields = ['service', 'status', 'endpoint', 'model_name', 'latency_ms', 'dimension', 'error_message', 'checked_at']
@@ -0,0 +1,117 @@
+"""
+知识库模型服务健康检查
+由 Celery beat 定时探测嵌入与 Reranker 服务，结果写入 ServiceHealthCheck，
+请求路径创建客户端时不再同步调用远程服务
+"""
+import logging
+import time
+from typing import Any, Dict
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from .models import KnowledgeGlobalConfig, ServiceHealthCheck
+
+logger = logging.getLogger(__name__)
+
+PROBE_TEXT = "模型功能测试"
+PROBE_TIMEOUT = 10
+
+
+def probe_embedding(config) -> Dict[str, Any]:
+    """探测嵌入服务：执行一次查询向量化"""
+    from .services import VectorStoreManager
+
+    result = {
+        'endpoint': config.api_base_url or '',
+        'model_name': config.model_name or '',
+    }
+    started = time.monotonic()
+    try:
+        embeddings = VectorStoreManager.create_embeddings(config)
+        vector = embeddings.embed_query(PROBE_TEXT)
+        result.update(status='healthy', dimension=len(vector))
+    except Exception as e:
+        result.update(status='unhealthy', error_message=str(e))
+    result['latency_ms'] = int((time.monotonic() - started) * 1000)
+    return result
+
+
+def probe_reranker(config) -> Dict[str, Any]:
+    """探测 Reranker 服务：对单个文档执行一次重排序"""
+    from .services import VectorStoreManager
+
+    url, model_name = VectorStoreManager.resolve_reranker_config(config)
+    if not url:
+        return {'status': 'disabled', 'endpoint': '', 'model_name': ''}
+
+    result = {'endpoint': url, 'model_name': model_name or ''}
+    headers = {}
+    if getattr(config, 'reranker_api_key', None):
+        headers['Authorization'] = f'Bearer {config.reranker_api_key}'
+
+    started = time.monotonic()
+    try:
+        response = requests.post(
+            url,
+            json={'model': model_name, 'query': PROBE_TEXT, 'documents': [PROBE_TEXT], 'top_n': 1},
+            headers=headers,
+            timeout=PROBE_TIMEOUT,
+        )
+        response.raise_for_status()
+        result['status'] = 'healthy'
+    except Exception as e:
+        result.update(status='unhealthy', error_message=str(e))
+    result['latency_ms'] = int((time.monotonic() - started) * 1000)
+    return result
+
+
+def run_health_checks() -> Dict[str, Dict[str, Any]]:
+    """探测所有模型服务并保存结果"""
+    config = KnowledgeGlobalConfig.get_config()
+    results = {
+        'embedding': probe_embedding(config),
+        'reranker': probe_reranker(config),
+    }
+
+    checked_at = timezone.now()
+    for service, result in results.items():
+        ServiceHealthCheck.objects.update_or_create(
+            service=service,
+            defaults={
+                'status': result['status'],
+                'endpoint': result.get('endpoint', ''),
+                'model_name': result.get('model_name', ''),
+                'latency_ms': result.get('latency_ms'),
+                'dimension': result.get('dimension'),
+                'error_message': result.get('error_message'),
+                'checked_at': checked_at,
+            },
+        )
+        if result['status'] == 'unhealthy':
+            logger.warning(f"⚠️ {service} 服务健康检查失败: {result.get('error_message')}")
+        else:
+            logger.info(f"✅ {service} 服务健康检查: {result['status']}, 耗时 {result.get('latency_ms')}ms")
+    return results
+
+
+def get_health_status() -> Dict[str, Any]:
+    """读取最近一次健康检查结果（不触发远程调用）"""
+    interval = getattr(settings, 'KNOWLEDGE_HEALTH_CHECK_INTERVAL', 300)
+    now = timezone.now()
+    status = {}
+    for check in ServiceHealthCheck.objects.all():
+        age = (now - check.checked_at).total_seconds()
+        status[check.service] = {
+            'status': check.status,
+            'endpoint': check.endpoint,
+            'model_name': check.model_name,
+            'latency_ms': check.latency_ms,
+            'dimension': check.dimension,
+            'error': check.error_message,
+            'checked_at': check.checked_at.isoformat(),
+            # 超过两个检查周期未更新，说明 beat 或 worker 未运行
+            'stale': age > interval * 2,
+        }
+    return status
@@ -94,7 +94,7 @@ class Command(BaseCommand):
         try:
             # 1. 清理旧数据
             self.stdout.write('  🗑️  清理旧的向量存储...')
-            VectorStoreManager.clear_cache(kb.id)
+            VectorStoreManager.drop_collection(kb.id)
             
             # 2. 获取已完成的文档
             docs = kb.documents.filter(status='completed')
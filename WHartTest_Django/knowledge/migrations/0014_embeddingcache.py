@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0013_alter_knowledgeglobalconfig_api_base_url_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='内容哈希')),
+                ('embedding_service', models.CharField(max_length=50, verbose_name='嵌入服务')),
+                ('model_name', models.CharField(max_length=100, verbose_name='模型名称')),
+                ('dense_vector', models.JSONField(default=list, verbose_name='稠密向量')),
+                ('sparse_indices', models.JSONField(blank=True, null=True, verbose_name='稀疏向量索引')),
+                ('sparse_values', models.JSONField(blank=True, null=True, verbose_name='稀疏向量权重')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '嵌入缓存',
+                'verbose_name_plural': '嵌入缓存',
+                'unique_together': {('content_hash', 'embedding_service', 'model_name')},
+            },
+        ),
+    ]
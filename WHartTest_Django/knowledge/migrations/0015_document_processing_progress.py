@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 17:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0014_embeddingcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='processing_stage',
+            field=models.CharField(blank=True, choices=[('queued', '排队中'), ('loading', '加载文档'), ('splitting', '文档分块'), ('embedding', '向量化'), ('upserting', '写入向量库'), ('saving', '保存分块'), ('done', '处理完成')], max_length=20, null=True, verbose_name='处理阶段'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='progress',
+            field=models.PositiveSmallIntegerField(default=0, help_text='0-100', verbose_name='处理进度'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='task_id',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='处理任务ID'),
+        ),
+    ]
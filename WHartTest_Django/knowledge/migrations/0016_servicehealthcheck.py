@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0015_document_processing_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceHealthCheck',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(choices=[('embedding', '嵌入服务'), ('reranker', '重排序服务')], max_length=20, unique=True, verbose_name='服务')),
+                ('status', models.CharField(choices=[('healthy', '正常'), ('unhealthy', '异常'), ('disabled', '未启用')], max_length=20, verbose_name='状态')),
+                ('endpoint', models.CharField(blank=True, default='', max_length=500, verbose_name='服务地址')),
+                ('model_name', models.CharField(blank=True, default='', max_length=100, verbose_name='模型名称')),
+                ('latency_ms', models.PositiveIntegerField(blank=True, null=True, verbose_name='响应耗时(毫秒)')),
+                ('dimension', models.PositiveIntegerField(blank=True, null=True, verbose_name='向量维度')),
+                ('error_message', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('checked_at', models.DateTimeField(verbose_name='检查时间')),
+            ],
+            options={
+                'verbose_name': '服务健康检查',
+                'verbose_name_plural': '服务健康检查',
+            },
+        ),
+    ]
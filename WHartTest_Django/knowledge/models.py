@@ -184,6 +184,16 @@ class Document(models.Model):
         ('failed', '处理失败'),
     ]
 
+    PROCESSING_STAGE_CHOICES = [
+        ('queued', '排队中'),
+        ('loading', '加载文档'),
+        ('splitting', '文档分块'),
+        ('embedding', '向量化'),
+        ('upserting', '写入向量库'),
+        ('saving', '保存分块'),
+        ('done', '处理完成'),
+    ]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     knowledge_base = models.ForeignKey(
         KnowledgeBase,
@@ -214,6 +224,15 @@ class Document(models.Model):
         default='pending'
     )
     error_message = models.TextField(_('错误信息'), blank=True, null=True)
+    processing_stage = models.CharField(
+        _('处理阶段'),
+        max_length=20,
+        choices=PROCESSING_STAGE_CHOICES,
+        blank=True,
+        null=True
+    )
+    progress = models.PositiveSmallIntegerField(_('处理进度'), default=0, help_text=_('0-100'))
+    task_id = models.CharField(_('处理任务ID'), max_length=100, blank=True, null=True)
 
     # 元数据
     file_size = models.PositiveIntegerField(_('文件大小(字节)'), null=True, blank=True)
@@ -281,6 +300,62 @@ class DocumentChunk(models.Model):
         return f"{self.document.title} - 分块 {self.chunk_index}"
 
 
+class EmbeddingCache(models.Model):
+    """
+    嵌入向量缓存模型，按分块内容哈希、嵌入服务和模型缓存稠密/稀疏向量
+    文档重新处理时，内容未变化的分块直接复用缓存，无需再次调用嵌入服务
+    """
+    content_hash = models.CharField(_('内容哈希'), max_length=64)
+    embedding_service = models.CharField(_('嵌入服务'), max_length=50)
+    model_name = models.CharField(_('模型名称'), max_length=100)
+
+    dense_vector = models.JSONField(_('稠密向量'), default=list)
+    # BM25 稀疏向量（FastEmbed 不可用时为空）
+    sparse_indices = models.JSONField(_('稀疏向量索引'), null=True, blank=True)
+    sparse_values = models.JSONField(_('稀疏向量权重'), null=True, blank=True)
+
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('嵌入缓存')
+        verbose_name_plural = _('嵌入缓存')
+        unique_together = ['content_hash', 'embedding_service', 'model_name']
+
+    def __str__(self):
+        return f"{self.embedding_service}/{self.model_name} - {self.content_hash}"
+
+
+class ServiceHealthCheck(models.Model):
+    """
+    外部模型服务健康检查结果，由后台定时任务探测并写入
+    """
+    SERVICE_CHOICES = [
+        ('embedding', _('嵌入服务')),
+        ('reranker', _('重排序服务')),
+    ]
+    STATUS_CHOICES = [
+        ('healthy', _('正常')),
+        ('unhealthy', _('异常')),
+        ('disabled', _('未启用')),
+    ]
+
+    service = models.CharField(_('服务'), max_length=20, choices=SERVICE_CHOICES, unique=True)
+    status = models.CharField(_('状态'), max_length=20, choices=STATUS_CHOICES)
+    endpoint = models.CharField(_('服务地址'), max_length=500, blank=True, default='')
+    model_name = models.CharField(_('模型名称'), max_length=100, blank=True, default='')
+    latency_ms = models.PositiveIntegerField(_('响应耗时(毫秒)'), null=True, blank=True)
+    dimension = models.PositiveIntegerField(_('向量维度'), null=True, blank=True)
+    error_message = models.TextField(_('错误信息'), blank=True, null=True)
+    checked_at = models.DateTimeField(_('检查时间'))
+
+    class Meta:
+        verbose_name = _('服务健康检查')
+        verbose_name_plural = _('服务健康检查')
+
+    def __str__(self):
+        return f"{self.service} - {self.status}"
+
+
 class QueryLog(models.Model):
     """
     查询日志模型，记录知识库查询历史
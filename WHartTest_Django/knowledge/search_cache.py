@@ -0,0 +1,174 @@
+"""
+知识库检索缓存
+- 查询向量缓存：按嵌入服务/模型/查询文本缓存，避免重复调用嵌入 API
+- 检索结果缓存：按知识库/查询/k/阈值缓存，文档变化时失效
+  文档保存/删除信号递增共享缓存中的知识库版本号，版本号在缓存键中，
+  其他进程（如处理文档的 Celery worker）产生的变化同样使缓存失效
+"""
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """线程安全的 LRU + TTL 缓存，记录命中率"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_where(self, predicate) -> int:
+        """删除满足条件的条目，返回删除数量"""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+query_embedding_cache = TTLCache(
+    maxsize=getattr(settings, 'KNOWLEDGE_QUERY_EMBEDDING_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'KNOWLEDGE_QUERY_EMBEDDING_CACHE_TTL', 3600),
+)
+
+search_result_cache = TTLCache(
+    maxsize=getattr(settings, 'KNOWLEDGE_SEARCH_RESULT_CACHE_SIZE', 256),
+    ttl=getattr(settings, 'KNOWLEDGE_SEARCH_RESULT_CACHE_TTL', 60),
+)
+
+
+def _version_cache():
+    return caches[getattr(settings, 'KNOWLEDGE_SEARCH_VERSION_CACHE', 'default')]
+
+
+def _version_key(knowledge_base_id) -> str:
+    return f"knowledge:kb:{knowledge_base_id}:search_version"
+
+
+def get_knowledge_base_versions(knowledge_base_ids: Iterable) -> Optional[Tuple]:
+    """
+    读取知识库的数据版本号（共享缓存中一次批量读取，不查询数据库）
+    共享缓存不可用时返回 None，此时不使用结果缓存
+    """
+    keys = [_version_key(kb_id) for kb_id in knowledge_base_ids]
+    try:
+        values = _version_cache().get_many(keys)
+    except Exception as e:
+        logger.warning(f"⚠️ 读取知识库版本号失败，跳过检索结果缓存: {e}")
+        return None
+    return tuple(values.get(key, 0) for key in keys)
+
+
+def bump_knowledge_base_version(knowledge_base_id):
+    """递增知识库版本号，所有进程中该知识库的检索结果缓存随之失效"""
+    key = _version_key(knowledge_base_id)
+    cache = _version_cache()
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # 计数器尚不存在（或已被淘汰），以时间戳初始化，避免回到曾经用过的版本号
+            if not cache.add(key, time.time_ns(), timeout=None):
+                cache.incr(key)
+    except Exception as e:
+        logger.warning(f"⚠️ 更新知识库 {knowledge_base_id} 版本号失败: {e}")
+
+
+def make_result_key(knowledge_base_ids: Iterable, model_name: str, query: str,
+                    k: int, score_threshold: float) -> Optional[Tuple]:
+    """
+    构造检索结果缓存键，第一个元素为知识库ID元组，用于按知识库失效
+    键中包含知识库版本号，版本变化后旧条目不再命中；无法读取版本号时返回 None（不缓存）
+    """
+    kb_ids = tuple(sorted(str(kb_id) for kb_id in knowledge_base_ids))
+    versions = get_knowledge_base_versions(kb_ids)
+    if versions is None:
+        return None
+    return (kb_ids, versions, model_name, query, k, float(score_threshold))
+
+
+def get_cached_results(key: Optional[Tuple]) -> Optional[list]:
+    if key is None:
+        return None
+    results = search_result_cache.get(key)
+    return copy.deepcopy(results) if results is not None else None
+
+
+def set_cached_results(key: Optional[Tuple], results: list):
+    if key is None:
+        return
+    search_result_cache.set(key, copy.deepcopy(results))
+
+
+def invalidate_knowledge_base(knowledge_base_id) -> int:
+    """清除包含该知识库的所有检索结果缓存"""
+    kb_id = str(knowledge_base_id)
+    return search_result_cache.discard_where(lambda key: kb_id in key[0])
+
+
+def clear_all():
+    """清空所有检索缓存（嵌入/重排配置变化时调用）"""
+    query_embedding_cache.clear()
+    search_result_cache.clear()
+
+
+def cache_stats() -> Dict[str, Any]:
+    """检索缓存命中率统计"""
+    return {
+        'query_embedding': query_embedding_cache.stats(),
+        'search_result': search_result_cache.stats(),
+    }
@@ -147,12 +147,14 @@ class DocumentSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'knowledge_base', 'knowledge_base_name', 'title',
             'document_type', 'file', 'url', 'content', 'status',
-            'error_message', 'file_size', 'page_count', 'word_count',
+            'error_message', 'processing_stage', 'progress',
+            'file_size', 'page_count', 'word_count',
             'file_extension', 'chunk_count', 'uploader', 'uploader_name',
             'uploaded_at', 'processed_at'
         ]
         read_only_fields = [
-            'id', 'uploader', 'file_size', 'page_count', 'word_count',
+            'id', 'uploader', 'processing_stage', 'progress',
+            'file_size', 'page_count', 'word_count',
             'file_extension', 'uploaded_at', 'processed_at'
         ]
 
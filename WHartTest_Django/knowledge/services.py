@@ -5,7 +5,9 @@
 import os
 import time
 import hashlib
-from typing import List, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Callable
 import nltk
 from django.conf import settings
 
@@ -31,6 +33,7 @@ os.environ['HF_HUB_DISABLE_SYMLINKS_WARNING'] = '1'
 os.environ['HF_HUB_TIMEOUT'] = '1'
 os.environ['REQUESTS_TIMEOUT'] = '1'
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from langchain_community.document_loaders import (
     PyPDFLoader, Docx2txtLoader, UnstructuredPowerPointLoader,
@@ -51,10 +54,13 @@ from qdrant_client.models import (
     NamedSparseVector,
     models,
 )
+from qdrant_client.http.exceptions import UnexpectedResponse
 from langchain_core.documents import Document as LangChainDocument
-from .models import KnowledgeBase, Document, DocumentChunk, QueryLog, KnowledgeGlobalConfig
+from .models import KnowledgeBase, Document, DocumentChunk, QueryLog, KnowledgeGlobalConfig, EmbeddingCache
+from . import search_cache
 import logging
 import requests
+from requests.adapters import HTTPAdapter
 import uuid
 from typing import List, Optional, Dict
 from langchain.embeddings.base import Embeddings
@@ -143,55 +149,144 @@ class SparseBM25Encoder:
         return results[0] if results else None
 
 
+def _is_transient_embedding_error(error) -> bool:
+    """网络异常、超时、429 与 5xx 响应视为瞬时错误，交由文档处理任务重试"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status_code = error.response.status_code
+        return status_code == 429 or status_code >= 500
+    return isinstance(error, (requests.RequestException, ConnectionError, TimeoutError))
+
+
 class CustomAPIEmbeddings(Embeddings):
-    """自定义HTTP API嵌入服务"""
-    
-    def __init__(self, api_base_url: str, api_key: str = None, custom_headers: dict = None, model_name: str = 'text-embedding'):
+    """自定义HTTP API嵌入服务（支持批量、并发请求与失败批次重试）"""
+
+    def __init__(self, api_base_url: str, api_key: str = None, custom_headers: dict = None,
+                 model_name: str = 'text-embedding', batch_size: int = None,
+                 max_workers: int = None, max_retries: int = None):
         self.api_base_url = api_base_url.rstrip('/')
         self.api_key = api_key
         self.custom_headers = custom_headers or {}
         self.model_name = model_name
-        
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """嵌入多个文档"""
-        return [self.embed_query(text) for text in texts]
-    
-    def embed_query(self, text: str) -> List[float]:
-        """嵌入单个查询"""
+        # 批量参数：每个请求打包的文本数、并发批次数、失败批次的重试次数
+        self.batch_size = max(1, batch_size or getattr(settings, 'KNOWLEDGE_EMBEDDING_BATCH_SIZE', 32))
+        self.max_workers = max(1, max_workers or getattr(settings, 'KNOWLEDGE_EMBEDDING_MAX_WORKERS', 4))
+        self.max_retries = max_retries if max_retries is not None else getattr(
+            settings, 'KNOWLEDGE_EMBEDDING_MAX_RETRIES', 2
+        )
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """获取复用连接池的 HTTP 会话（线程安全，延迟创建）"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=self.max_workers,
+                        pool_maxsize=self.max_workers,
+                    )
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def _build_headers(self) -> Dict[str, str]:
+        """构建请求头"""
         headers = {
             'Content-Type': 'application/json',
             **self.custom_headers
         }
-        
         if self.api_key:
             headers['Authorization'] = f'Bearer {self.api_key}'
-        
+        return headers
+
+    def _request_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """发送一次嵌入请求，返回与输入顺序一致的向量列表"""
         data = {
-            'input': text,
+            # 单条输入保持字符串格式，兼容只接受字符串的自定义服务
+            'input': texts if len(texts) > 1 else texts[0],
             'model': self.model_name  # 使用配置的模型名
         }
-        
-        try:
-            response = requests.post(
-                self.api_base_url,  # 直接使用完整的API URL
-                json=data,
-                headers=headers,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            if 'data' in result and len(result['data']) > 0:
-                return result['data'][0]['embedding']
+
+        response = self.session.post(
+            self.api_base_url,  # 直接使用完整的API URL
+            json=data,
+            headers=self._build_headers(),
+            timeout=30 + 2 * len(texts)
+        )
+        response.raise_for_status()
+
+        result = response.json()
+        items = result.get('data') if isinstance(result, dict) else None
+        if not items or len(items) != len(texts):
+            raise ValueError(f"API响应格式错误: 期望 {len(texts)} 条向量, 实际返回 {len(items or [])} 条")
+
+        # OpenAI 兼容接口通过 index 标识顺序，不保证按输入顺序返回
+        if all('index' in item for item in items):
+            items = sorted(items, key=lambda item: item['index'])
+        return [item['embedding'] for item in items]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量嵌入多个文档：按 batch_size 打包、并发发送，仅重试失败的批次"""
+        if not texts:
+            return []
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        batch_results: List[Optional[List[List[float]]]] = [None] * len(batches)
+        pending = list(range(len(batches)))
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            if not pending:
+                break
+            if attempt > 0:
+                logger.warning(f"⚠️ 嵌入请求重试 {attempt}/{self.max_retries}: {len(pending)} 个失败批次")
+                time.sleep(min(2 ** (attempt - 1), 8))
+
+            failed = []
+            if len(pending) == 1 or self.max_workers == 1:
+                for index in pending:
+                    try:
+                        batch_results[index] = self._request_embeddings(batches[index])
+                    except Exception as e:
+                        last_error = e
+                        failed.append(index)
             else:
-                raise ValueError(f"API响应格式错误: {result}")
-                
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                    futures = {
+                        executor.submit(self._request_embeddings, batches[index]): index
+                        for index in pending
+                    }
+                    for future in as_completed(futures):
+                        index = futures[future]
+                        try:
+                            batch_results[index] = future.result()
+                        except Exception as e:
+                            last_error = e
+                            failed.append(index)
+            pending = sorted(failed)
+
+        if pending:
+            message = f"自定义API嵌入失败: {len(pending)}/{len(batches)} 个批次重试后仍失败: {last_error}"
+            if _is_transient_embedding_error(last_error):
+                # 保留原始异常类型，使文档处理任务识别为瞬时错误并重试
+                logger.error(f"❌ {message}")
+                raise last_error
+            raise RuntimeError(message) from last_error
+
+        logger.info(f"✅ 批量嵌入完成: {len(texts)} 条文本, {len(batches)} 个批次, 并发数 {self.max_workers}")
+        return [embedding for batch in batch_results for embedding in batch]
+
+    def embed_query(self, text: str) -> List[float]:
+        """嵌入单个查询"""
+        try:
+            return self._request_embeddings([text])[0]
         except Exception as e:
             raise RuntimeError(f"自定义API嵌入失败: {str(e)}")
 
 
-
-
 class DocumentProcessor:
     """文档处理器 - 支持结构化解析"""
 
@@ -736,11 +831,15 @@ class VectorStoreManager:
     # 向量名称常量
     DENSE_VECTOR_NAME = "dense"
     SPARSE_VECTOR_NAME = "bm25"
-    # RRF 融合参数
+    # RRF 融合参数（本地融合与服务端融合结果的归一化分数均按该常数计算）
     RRF_K = 60
     # Reranker 配置
     RERANKER_MODEL = "bge-reranker-v2-m3"
     RERANKER_ENABLED = True  # 可通过环境变量控制
+    # 嵌入缓存单次查询的哈希数量
+    EMBEDDING_CACHE_QUERY_BATCH = 500
+    # Qdrant 批量更新操作的单批数量
+    QDRANT_BATCH_SIZE = 256
 
     # 类级别的缓存
     _vector_store_cache = {}
@@ -750,6 +849,9 @@ class VectorStoreManager:
     _reranker_config_cache_time = 0
     _global_config_cache = None
     _global_config_cache_time = 0
+    _shared_qdrant_client = None
+    # Qdrant 是否支持 Query API（None 表示尚未确定）
+    _query_api_supported = None
 
     def __init__(self, knowledge_base: KnowledgeBase):
         self.knowledge_base = knowledge_base
@@ -777,39 +879,42 @@ class VectorStoreManager:
         """清理全局配置缓存"""
         cls._global_config_cache = None
         cls._global_config_cache_time = 0
+        # 嵌入模型或 Reranker 配置可能已变化，查询向量和检索结果一并失效
+        search_cache.clear_all()
 
     def _get_embeddings_instance(self):
-        """获取嵌入模型实例，使用全局配置"""
+        """
+        获取嵌入模型实例，使用全局配置
+        创建时不调用远程服务，服务可用性由后台健康检查（knowledge.health_check）探测
+        """
         config = self.global_config
         cache_key = f"{config.embedding_service}_{config.api_base_url}_{config.model_name}"
         
         if cache_key not in self._embeddings_cache:
-            embedding_service = config.embedding_service
-            
             try:
-                if embedding_service == 'openai':
-                    self._embeddings_cache[cache_key] = self._create_openai_embeddings(config)
-                elif embedding_service == 'azure_openai':
-                    self._embeddings_cache[cache_key] = self._create_azure_embeddings(config)
-                elif embedding_service == 'ollama':
-                    self._embeddings_cache[cache_key] = self._create_ollama_embeddings(config)
-                elif embedding_service == 'xinference':
-                    self._embeddings_cache[cache_key] = self._create_xinference_embeddings(config)
-                elif embedding_service == 'custom':
-                    self._embeddings_cache[cache_key] = self._create_custom_api_embeddings(config)
-                else:
-                    raise ValueError(f"不支持的嵌入服务: {embedding_service}")
-                    
-                # 测试嵌入功能
-                test_embedding = self._embeddings_cache[cache_key].embed_query("模型功能测试")
-                logger.info(f"✅ 嵌入模型测试成功: {embedding_service}, 维度: {len(test_embedding)}")
-                
+                self._embeddings_cache[cache_key] = self.create_embeddings(config)
             except Exception as e:
-                logger.error(f"❌ 嵌入服务 {embedding_service} 初始化失败: {str(e)}")
+                logger.error(f"❌ 嵌入服务 {config.embedding_service} 初始化失败: {str(e)}")
                 raise
                 
         return self._embeddings_cache[cache_key]
 
+    @classmethod
+    def create_embeddings(cls, config):
+        """根据配置创建嵌入模型实例（不缓存）"""
+        embedding_service = config.embedding_service
+        if embedding_service == 'openai':
+            return cls._create_openai_embeddings(config)
+        elif embedding_service == 'azure_openai':
+            return cls._create_azure_embeddings(config)
+        elif embedding_service == 'ollama':
+            return cls._create_ollama_embeddings(config)
+        elif embedding_service == 'xinference':
+            return cls._create_xinference_embeddings(config)
+        elif embedding_service == 'custom':
+            return cls._create_custom_api_embeddings(config)
+        raise ValueError(f"不支持的嵌入服务: {embedding_service}")
+
     def _get_sparse_encoder(self) -> Optional[SparseBM25Encoder]:
         """获取 BM25 稀疏编码器（带缓存）"""
         cache_key = self.SPARSE_VECTOR_NAME
@@ -826,7 +931,8 @@ class VectorStoreManager:
         
         return self._sparse_encoder_cache[cache_key]
     
-    def _create_openai_embeddings(self, config):
+    @classmethod
+    def _create_openai_embeddings(cls, config):
         """创建OpenAI Embeddings实例"""
         try:
             from langchain_openai import OpenAIEmbeddings
@@ -845,7 +951,8 @@ class VectorStoreManager:
         logger.info(f"🚀 初始化OpenAI嵌入模型: {kwargs['model']}")
         return OpenAIEmbeddings(**kwargs)
     
-    def _create_azure_embeddings(self, config):
+    @classmethod
+    def _create_azure_embeddings(cls, config):
         """创建Azure OpenAI Embeddings实例"""
         try:
             from langchain_openai import AzureOpenAIEmbeddings
@@ -867,7 +974,8 @@ class VectorStoreManager:
         logger.info(f"🚀 初始化Azure OpenAI嵌入模型: {kwargs['model']}")
         return AzureOpenAIEmbeddings(**kwargs)
 
-    def _create_ollama_embeddings(self, config):
+    @classmethod
+    def _create_ollama_embeddings(cls, config):
         """创建Ollama Embeddings实例"""
         try:
             from langchain_ollama import OllamaEmbeddings
@@ -886,7 +994,8 @@ class VectorStoreManager:
         logger.info(f"🚀 初始化Ollama嵌入模型: {kwargs['model']}")
         return OllamaEmbeddings(**kwargs)
 
-    def _create_xinference_embeddings(self, config):
+    @classmethod
+    def _create_xinference_embeddings(cls, config):
         """创建Xinference Embeddings实例"""
         if not config.api_base_url:
             base_url = 'http://localhost:9997'
@@ -903,8 +1012,11 @@ class VectorStoreManager:
 
     def _get_reranker_config(self) -> tuple:
         """获取 Reranker 配置（独立于 Embedding）"""
-        config = self.global_config
+        return self.resolve_reranker_config(self.global_config)
 
+    @staticmethod
+    def resolve_reranker_config(config) -> tuple:
+        """根据全局配置解析 Reranker 地址与模型，未启用时返回 (None, None)"""
         # 检查是否启用 Reranker
         reranker_service = getattr(config, 'reranker_service', 'none')
         if reranker_service == 'none':
@@ -994,7 +1106,8 @@ class VectorStoreManager:
             logger.warning(f"⚠️ Reranker 调用异常: {e}, 降级为 RRF 排序")
             return candidates[:top_k]
 
-    def _create_custom_api_embeddings(self, config):
+    @classmethod
+    def _create_custom_api_embeddings(cls, config):
         """创建自定义API Embeddings实例"""
         if not config.api_base_url:
             raise ValueError("自定义API需要配置api_base_url")
@@ -1080,23 +1193,12 @@ class VectorStoreManager:
 
     @classmethod
     def clear_cache(cls, knowledge_base_id=None):
-        """清理向量存储缓存"""
+        """清理向量存储缓存（仅清理进程内缓存，不删除 Qdrant 数据）"""
         if knowledge_base_id:
             cache_key = str(knowledge_base_id)
             if cache_key in cls._vector_store_cache:
                 del cls._vector_store_cache[cache_key]
                 logger.info(f"已清理知识库 {cache_key} 的向量存储缓存")
-
-            # 清理 Qdrant 集合
-            try:
-                qdrant_url = os.environ.get('QDRANT_URL', 'http://localhost:8918')
-                client = QdrantClient(url=qdrant_url)
-                collection_name = f"kb_{knowledge_base_id}"
-                if client.collection_exists(collection_name):
-                    client.delete_collection(collection_name)
-                    logger.info(f"已删除 Qdrant 集合: {collection_name}")
-            except Exception as e:
-                logger.warning(f"清理 Qdrant 集合失败: {e}")
         else:
             # 清理所有缓存
             cls._vector_store_cache.clear()
@@ -1104,22 +1206,50 @@ class VectorStoreManager:
             cls._sparse_encoder_cache.clear()
             logger.info("已清理所有向量存储缓存")
 
+    @classmethod
+    def _get_shared_qdrant_client(cls) -> QdrantClient:
+        """获取进程内共享的 Qdrant 客户端（用于无需嵌入模型的维护操作）"""
+        if cls._shared_qdrant_client is None:
+            cls._shared_qdrant_client = QdrantClient(url=os.environ.get('QDRANT_URL', 'http://localhost:8918'))
+        return cls._shared_qdrant_client
+
+    @classmethod
+    def drop_collection(cls, knowledge_base_id):
+        """删除知识库的 Qdrant 集合（仅用于删除/重建整个知识库）"""
+        cls.clear_cache(knowledge_base_id)
+        try:
+            client = cls._get_shared_qdrant_client()
+            collection_name = f"kb_{knowledge_base_id}"
+            if client.collection_exists(collection_name):
+                client.delete_collection(collection_name)
+                logger.info(f"已删除 Qdrant 集合: {collection_name}")
+        except Exception as e:
+            logger.warning(f"清理 Qdrant 集合失败: {e}")
+
+    @classmethod
+    def delete_documents_vectors(cls, knowledge_base_id, document_ids: List[Any]):
+        """按 payload 中的 document_id 过滤删除一个或多个文档的向量（单次 Qdrant 调用）"""
+        document_ids = [str(document_id) for document_id in document_ids]
+        if not document_ids:
+            return
+
+        client = cls._get_shared_qdrant_client()
+        collection_name = f"kb_{knowledge_base_id}"
+        if not client.collection_exists(collection_name):
+            return
+
+        client.delete(
+            collection_name=collection_name,
+            points_selector=models.FilterSelector(filter=models.Filter(must=[
+                models.FieldCondition(key="document_id", match=models.MatchAny(any=document_ids))
+            ])),
+        )
+        logger.info(f"✅ 已从 Qdrant 集合 {collection_name} 删除 {len(document_ids)} 个文档的向量")
+
     def _create_vector_store(self):
         """创建 Qdrant 向量存储（支持稠密+稀疏混合）"""
         collection_name = self._get_collection_name()
         
-        # 获取嵌入向量维度
-        test_embedding = self.embeddings.embed_query("测试")
-        vector_size = len(test_embedding)
-        
-        # 配置命名向量（用于混合检索）
-        vectors_config = {
-            self.DENSE_VECTOR_NAME: VectorParams(
-                size=vector_size,
-                distance=Distance.COSINE
-            )
-        }
-        
         # 配置稀疏向量
         sparse_vectors_config = None
         if self.sparse_encoder:
@@ -1132,6 +1262,14 @@ class VectorStoreManager:
         # 确保集合存在
         try:
             if not self.qdrant_client.collection_exists(collection_name):
+                # 仅在新建集合时需要嵌入向量维度
+                vector_size = len(self.embeddings.embed_query("测试"))
+                vectors_config = {
+                    self.DENSE_VECTOR_NAME: VectorParams(
+                        size=vector_size,
+                        distance=Distance.COSINE
+                    )
+                }
                 self.qdrant_client.create_collection(
                     collection_name=collection_name,
                     vectors_config=vectors_config,
@@ -1162,117 +1300,409 @@ class VectorStoreManager:
         
         return qdrant_store
 
-    def add_documents(self, documents: List[LangChainDocument], document_obj: Document) -> List[str]:
-        """添加文档到向量存储（稠密+稀疏混合）"""
+    def add_documents(self, documents: List[LangChainDocument], document_obj: Document,
+                      progress_callback: Optional[Callable[..., None]] = None) -> List[str]:
+        """
+        添加文档到向量存储（稠密+稀疏混合）
+        按固定窗口流式执行 分块 → 向量化 → 写入 Qdrant → 保存分块，峰值内存不随文档大小增长，
+        已写入的分块在后续分块向量化完成前即可被检索
+
+        Args:
+            progress_callback: 进度回调 (stage, fraction)，fraction 为已处理的源文档比例
+        """
+        report = progress_callback or (lambda stage, fraction=None: None)
         try:
             # 确保集合存在（触发 vector_store 属性会创建集合）
             _ = self.vector_store
-            
-            # 文档分块
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=self.knowledge_base.chunk_size,
-                chunk_overlap=self.knowledge_base.chunk_overlap
-            )
-            chunks = text_splitter.split_documents(documents)
-            
-            # 生成唯一的 vector_ids
-            vector_ids = [str(uuid.uuid4()) for _ in chunks]
-            chunk_texts = [chunk.page_content for chunk in chunks]
-            
-            # 计算稠密向量
-            dense_embeddings = self.embeddings.embed_documents(chunk_texts)
-            
-            # 计算稀疏向量（如果可用）
-            sparse_embeddings = None
-            if self.sparse_encoder:
-                sparse_embeddings = self.sparse_encoder.encode_documents(chunk_texts)
-            
-            # 构建 PointStruct 列表
-            points: List[PointStruct] = []
-            for i, (chunk, vector_id, dense_vector) in enumerate(zip(chunks, vector_ids, dense_embeddings)):
-                payload = dict(chunk.metadata or {})
-                payload.update({
-                    "page_content": chunk.page_content,
-                    "document_id": str(document_obj.id),
-                    "chunk_index": i,
-                    "vector_id": vector_id,
-                    "knowledge_base_id": str(self.knowledge_base.id),
-                })
-                
-                # 构建向量配置
-                vectors = {self.DENSE_VECTOR_NAME: dense_vector}
-                
-                # 添加稀疏向量（如果可用）
-                sparse_vectors = None
-                if sparse_embeddings and sparse_embeddings[i]:
-                    sparse_vec = sparse_embeddings[i]
-                    sparse_vectors = {
-                        self.SPARSE_VECTOR_NAME: SparseVector(
-                            indices=sparse_vec.indices.tolist(),
-                            values=sparse_vec.values.tolist(),
+            collection_name = self._get_collection_name()
+
+            report('splitting')
+            vector_ids: List[str] = []
+            has_sparse = False
+            for window, consumed in self._iter_chunk_windows(documents):
+                start_index = len(vector_ids)
+                window_ids = [str(uuid.uuid4()) for _ in window]
+                window_hashes = [self._compute_chunk_hash(chunk.page_content) for chunk in window]
+
+                # 计算稠密/稀疏向量（优先复用嵌入缓存）
+                dense_embeddings, sparse_embeddings = self._embed_chunks(
+                    [chunk.page_content for chunk in window], window_hashes
+                )
+                has_sparse = has_sparse or bool(sparse_embeddings)
+
+                # 写入 Qdrant
+                self.qdrant_client.upsert(
+                    collection_name=collection_name,
+                    points=[
+                        self._build_point(
+                            chunk, start_index + n, window_ids[n], dense_embeddings[n],
+                            sparse_embeddings[n] if sparse_embeddings else None, document_obj
                         )
-                    }
-                
-                point = PointStruct(
-                    id=vector_id,
-                    vector=vectors,
-                    payload=payload,
+                        for n, chunk in enumerate(window)
+                    ],
                 )
-                
-                # Qdrant SDK 需要单独设置 sparse_vectors
-                if sparse_vectors:
-                    point = PointStruct(
-                        id=vector_id,
-                        vector={
-                            self.DENSE_VECTOR_NAME: dense_vector,
-                            self.SPARSE_VECTOR_NAME: SparseVector(
-                                indices=sparse_embeddings[i].indices.tolist(),
-                                values=sparse_embeddings[i].values.tolist(),
-                            )
-                        },
-                        payload=payload,
-                    )
-                
-                points.append(point)
-            
-            # 批量写入 Qdrant
-            self.qdrant_client.upsert(
-                collection_name=self._get_collection_name(),
-                points=points,
-            )
-            
-            mode = "稀疏+稠密" if sparse_embeddings else "纯稠密"
-            logger.info(f"✅ 已写入 {len(points)} 个分块到 Qdrant（{mode}）")
 
-            # 保存分块信息到数据库
-            self._save_chunks_to_db(chunks, vector_ids, document_obj)
+                # 保存分块信息到数据库
+                self._save_chunks_to_db(window, window_ids, document_obj, start_index=start_index, hashes=window_hashes)
 
+                vector_ids.extend(window_ids)
+                report('embedding', consumed / max(len(documents), 1))
+
+            mode = "稀疏+稠密" if has_sparse else "纯稠密"
+            logger.info(f"✅ 已写入 {len(vector_ids)} 个分块到 Qdrant（{mode}）")
             return vector_ids
         except Exception as e:
             logger.error(f"添加文档到向量存储失败: {e}")
             raise
 
-    def _save_chunks_to_db(self, chunks: List[LangChainDocument], vector_ids: List[str], document_obj: Document):
-        """保存分块信息到数据库"""
-        chunk_objects = []
-        for i, (chunk, vector_id) in enumerate(zip(chunks, vector_ids)):
-            # 计算内容哈希
-            content_hash = hashlib.md5(chunk.page_content.encode()).hexdigest()
-
-            chunk_obj = DocumentChunk(
-                document=document_obj,
-                chunk_index=i,
-                content=chunk.page_content,
-                vector_id=vector_id,
-                embedding_hash=content_hash,
-                start_index=chunk.metadata.get('start_index'),
-                end_index=chunk.metadata.get('end_index'),
-                page_number=chunk.metadata.get('page')
+    def _iter_chunk_windows(self, documents: List[LangChainDocument]):
+        """
+        逐个源文档切分并按固定窗口产出分块
+
+        Yields:
+            (window_chunks, consumed_documents)：当前窗口的分块，以及已切分完成的源文档数
+        """
+        text_splitter = self._get_text_splitter()
+        window_size = max(1, getattr(settings, 'KNOWLEDGE_INGEST_WINDOW_SIZE', 128))
+        window: List[LangChainDocument] = []
+        consumed = 0
+        for consumed, document in enumerate(documents, start=1):
+            for chunk in text_splitter.split_documents([document]):
+                window.append(chunk)
+                if len(window) >= window_size:
+                    yield window, consumed
+                    window = []
+        if window:
+            yield window, consumed
+
+    def reindex_document(self, documents: List[LangChainDocument], document_obj: Document,
+                         progress_callback: Optional[Callable[..., None]] = None) -> Dict[str, int]:
+        """
+        增量重建文档索引：对比新旧分块哈希，仅写入新增/变化的分块、删除消失的分块，
+        内容未变的分块保留原向量并原地更新 chunk_index，处理期间文档始终可检索
+        """
+        report = progress_callback or (lambda stage, fraction=None: None)
+        try:
+            # 确保集合存在
+            _ = self.vector_store
+            collection_name = self._get_collection_name()
+
+            report('splitting')
+            chunks = self._split_documents(documents)
+            chunk_hashes = [self._compute_chunk_hash(chunk.page_content) for chunk in chunks]
+
+            # 按嵌入哈希索引现有分块（相同内容可能出现多次，按原顺序依次匹配；
+            # 嵌入服务/模型变化后哈希不同，所有分块走重新向量化路径）
+            existing_chunks = list(document_obj.chunks.order_by('chunk_index'))
+            existing_by_hash: Dict[str, List[DocumentChunk]] = {}
+            removed: List[DocumentChunk] = []
+            for chunk_obj in existing_chunks:
+                if chunk_obj.vector_id and chunk_obj.embedding_hash:
+                    existing_by_hash.setdefault(chunk_obj.embedding_hash, []).append(chunk_obj)
+                else:
+                    removed.append(chunk_obj)
+
+            kept: List[tuple] = []
+            added_indexes: List[int] = []
+            for i, content_hash in enumerate(chunk_hashes):
+                candidates = existing_by_hash.get(self._compute_embedding_hash(content_hash))
+                if candidates:
+                    kept.append((i, candidates.pop(0)))
+                else:
+                    added_indexes.append(i)
+            for candidates in existing_by_hash.values():
+                removed.extend(candidates)
+            moved = [(i, chunk_obj) for i, chunk_obj in kept if chunk_obj.chunk_index != i]
+
+            # 1. 按窗口写入新增/变化的分块
+            added_vector_ids = {i: str(uuid.uuid4()) for i in added_indexes}
+            if added_indexes:
+                report('embedding')
+                window_size = max(1, getattr(settings, 'KNOWLEDGE_INGEST_WINDOW_SIZE', 128))
+                for start in range(0, len(added_indexes), window_size):
+                    window = added_indexes[start:start + window_size]
+                    dense_embeddings, sparse_embeddings = self._embed_chunks(
+                        [chunks[i].page_content for i in window],
+                        [chunk_hashes[i] for i in window],
+                    )
+                    self.qdrant_client.upsert(
+                        collection_name=collection_name,
+                        points=[
+                            self._build_point(
+                                chunks[i], i, added_vector_ids[i], dense_embeddings[n],
+                                sparse_embeddings[n] if sparse_embeddings else None, document_obj
+                            )
+                            for n, i in enumerate(window)
+                        ],
+                    )
+                    report('embedding', (start + len(window)) / len(added_indexes))
+
+            # 2. 更新位置发生变化的分块的 payload（不重新计算向量）
+            if moved:
+                report('upserting')
+                operations = [
+                    models.SetPayloadOperation(set_payload=models.SetPayload(
+                        payload=self._build_payload(chunks[i], i, chunk_obj.vector_id, document_obj),
+                        points=[chunk_obj.vector_id],
+                    ))
+                    for i, chunk_obj in moved
+                ]
+                for start in range(0, len(operations), self.QDRANT_BATCH_SIZE):
+                    self.qdrant_client.batch_update_points(
+                        collection_name=collection_name,
+                        update_operations=operations[start:start + self.QDRANT_BATCH_SIZE],
+                    )
+
+            # 3. 删除已消失的分块
+            removed_vector_ids = [chunk_obj.vector_id for chunk_obj in removed if chunk_obj.vector_id]
+            if removed_vector_ids:
+                self.qdrant_client.delete(
+                    collection_name=collection_name,
+                    points_selector=models.PointIdsList(points=removed_vector_ids),
+                )
+
+            # 4. 同步数据库分块记录
+            report('saving')
+            with transaction.atomic():
+                if removed:
+                    DocumentChunk.objects.filter(id__in=[chunk_obj.id for chunk_obj in removed]).delete()
+
+                if moved:
+                    # 先移到临时区间再写回目标索引，避免 (document, chunk_index) 唯一约束冲突
+                    offset = len(existing_chunks) + len(chunks)
+                    for i, chunk_obj in moved:
+                        chunk_obj.chunk_index = offset + i
+                    DocumentChunk.objects.bulk_update([c for _, c in moved], ['chunk_index'], batch_size=500)
+                    for i, chunk_obj in moved:
+                        metadata = chunks[i].metadata
+                        chunk_obj.chunk_index = i
+                        chunk_obj.start_index = metadata.get('start_index')
+                        chunk_obj.end_index = metadata.get('end_index')
+                        chunk_obj.page_number = metadata.get('page')
+                    DocumentChunk.objects.bulk_update(
+                        [c for _, c in moved],
+                        ['chunk_index', 'start_index', 'end_index', 'page_number'],
+                        batch_size=500,
+                    )
+
+                if added_indexes:
+                    DocumentChunk.objects.bulk_create([
+                        self._build_chunk_object(chunks[i], i, added_vector_ids[i], chunk_hashes[i], document_obj)
+                        for i in added_indexes
+                    ], batch_size=500)
+
+            stats = {
+                'total': len(chunks),
+                'added': len(added_indexes),
+                'removed': len(removed),
+                'moved': len(moved),
+                'unchanged': len(kept) - len(moved),
+            }
+            logger.info(
+                f"✅ 增量重建完成: 共 {stats['total']} 个分块, 新增 {stats['added']}, "
+                f"删除 {stats['removed']}, 移动 {stats['moved']}, 未变 {stats['unchanged']}"
             )
-            chunk_objects.append(chunk_obj)
+            return stats
+        except Exception as e:
+            logger.error(f"增量重建文档索引失败: {e}")
+            raise
+
+    def _get_text_splitter(self) -> RecursiveCharacterTextSplitter:
+        """按知识库配置创建文本分割器"""
+        return RecursiveCharacterTextSplitter(
+            chunk_size=self.knowledge_base.chunk_size,
+            chunk_overlap=self.knowledge_base.chunk_overlap
+        )
+
+    def _split_documents(self, documents: List[LangChainDocument]) -> List[LangChainDocument]:
+        """按知识库配置切分文档"""
+        return self._get_text_splitter().split_documents(documents)
+
+    def _build_payload(self, chunk: LangChainDocument, chunk_index: int, vector_id: str,
+                       document_obj: Document) -> Dict[str, Any]:
+        """构建分块的 Qdrant payload"""
+        payload = dict(chunk.metadata or {})
+        payload.update({
+            "page_content": chunk.page_content,
+            "document_id": str(document_obj.id),
+            "chunk_index": chunk_index,
+            "vector_id": vector_id,
+            "knowledge_base_id": str(self.knowledge_base.id),
+        })
+        return payload
+
+    def _build_point(self, chunk: LangChainDocument, chunk_index: int, vector_id: str,
+                     dense_vector: List[float], sparse_vector: Optional[SparseVector],
+                     document_obj: Document) -> PointStruct:
+        """构建 PointStruct（稀疏向量可用时一并写入）"""
+        vectors = {self.DENSE_VECTOR_NAME: dense_vector}
+        if sparse_vector:
+            vectors[self.SPARSE_VECTOR_NAME] = sparse_vector
+
+        return PointStruct(
+            id=vector_id,
+            vector=vectors,
+            payload=self._build_payload(chunk, chunk_index, vector_id, document_obj),
+        )
 
+    @staticmethod
+    def _compute_chunk_hash(content: str) -> str:
+        """计算分块内容哈希（嵌入缓存按 服务/模型/内容哈希 索引）"""
+        return hashlib.md5(content.encode()).hexdigest()
+
+    def _compute_embedding_hash(self, content_hash: str) -> str:
+        """
+        计算 DocumentChunk.embedding_hash：内容哈希叠加嵌入服务与模型，
+        切换嵌入模型后原有分块不再匹配，增量重建时重新向量化
+        """
+        config = self.global_config
+        return hashlib.md5(
+            f"{config.embedding_service}/{config.model_name or ''}/{content_hash}".encode()
+        ).hexdigest()
+
+    def _embed_query(self, query: str) -> List[float]:
+        """计算查询向量，按嵌入服务/模型/查询文本缓存"""
+        config = self.global_config
+        key = (config.embedding_service, config.model_name or '', query)
+        vector = search_cache.query_embedding_cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+            search_cache.query_embedding_cache.set(key, vector)
+        return vector
+
+    def _embed_chunks(self, chunk_texts: List[str], chunk_hashes: List[str]) -> tuple:
+        """
+        计算分块的稠密/稀疏向量，优先复用嵌入缓存，仅对未命中的分块调用嵌入服务
+
+        Returns:
+            (dense_vectors, sparse_vectors)，sparse_vectors 元素为 SparseVector，
+            无稀疏编码器时 sparse_vectors 为 None
+        """
+        config = self.global_config
+        service = config.embedding_service
+        model_name = config.model_name or ''
+
+        # 查询缓存（分批构造 IN 条件，避免超出数据库参数上限）
+        cached: Dict[str, EmbeddingCache] = {}
+        unique_hashes = list(dict.fromkeys(chunk_hashes))
+        try:
+            for start in range(0, len(unique_hashes), self.EMBEDDING_CACHE_QUERY_BATCH):
+                for entry in EmbeddingCache.objects.filter(
+                    embedding_service=service,
+                    model_name=model_name,
+                    content_hash__in=unique_hashes[start:start + self.EMBEDDING_CACHE_QUERY_BATCH],
+                ):
+                    cached[entry.content_hash] = entry
+        except Exception as e:
+            logger.warning(f"⚠️ 读取嵌入缓存失败，全部重新计算: {e}")
+            cached = {}
+
+        # 收集未命中的分块（相同内容只计算一次）
+        missing_dense: Dict[str, str] = {}
+        missing_sparse: Dict[str, str] = {}
+        for text, content_hash in zip(chunk_texts, chunk_hashes):
+            entry = cached.get(content_hash)
+            if entry is None:
+                missing_dense.setdefault(content_hash, text)
+            if self.sparse_encoder and (entry is None or entry.sparse_indices is None):
+                missing_sparse.setdefault(content_hash, text)
+
+        new_dense: Dict[str, List[float]] = {}
+        if missing_dense:
+            new_dense = dict(zip(
+                missing_dense.keys(),
+                self.embeddings.embed_documents(list(missing_dense.values()))
+            ))
+
+        new_sparse: Dict[str, Optional[SparseVector]] = {}
+        if missing_sparse:
+            for content_hash, sparse_vec in zip(
+                missing_sparse.keys(),
+                self.sparse_encoder.encode_documents(list(missing_sparse.values()))
+            ):
+                new_sparse[content_hash] = SparseVector(
+                    indices=sparse_vec.indices.tolist(),
+                    values=sparse_vec.values.tolist(),
+                ) if sparse_vec is not None else None
+
+        # 组装结果
+        dense_vectors = []
+        sparse_vectors = [] if self.sparse_encoder else None
+        for content_hash in chunk_hashes:
+            entry = cached.get(content_hash)
+            dense_vectors.append(entry.dense_vector if entry is not None else new_dense[content_hash])
+            if sparse_vectors is not None:
+                if content_hash in new_sparse:
+                    sparse_vectors.append(new_sparse[content_hash])
+                else:
+                    sparse_vectors.append(SparseVector(
+                        indices=entry.sparse_indices,
+                        values=entry.sparse_values,
+                    ))
+
+        self._write_embedding_cache(service, model_name, cached, new_dense, new_sparse)
+
+        hits = len(unique_hashes) - len(missing_dense)
+        logger.info(f"📦 嵌入缓存: 命中 {hits}/{len(unique_hashes)}, 新计算稠密 {len(new_dense)}, 稀疏 {len(new_sparse)}")
+        return dense_vectors, sparse_vectors
+
+    def _write_embedding_cache(self, service: str, model_name: str, cached: Dict[str, EmbeddingCache],
+                               new_dense: Dict[str, List[float]], new_sparse: Dict[str, Optional[SparseVector]]):
+        """写入新计算的向量到嵌入缓存（失败不影响文档处理）"""
+        try:
+            new_entries = []
+            for content_hash, dense_vector in new_dense.items():
+                sparse_vec = new_sparse.get(content_hash)
+                new_entries.append(EmbeddingCache(
+                    content_hash=content_hash,
+                    embedding_service=service,
+                    model_name=model_name,
+                    dense_vector=dense_vector,
+                    sparse_indices=sparse_vec.indices if sparse_vec else None,
+                    sparse_values=sparse_vec.values if sparse_vec else None,
+                ))
+            if new_entries:
+                EmbeddingCache.objects.bulk_create(new_entries, batch_size=500, ignore_conflicts=True)
+
+            # 已缓存稠密向量但缺少稀疏向量的条目，补写稀疏向量
+            updated_entries = []
+            for content_hash, sparse_vec in new_sparse.items():
+                entry = cached.get(content_hash)
+                if entry is not None and sparse_vec is not None:
+                    entry.sparse_indices = sparse_vec.indices
+                    entry.sparse_values = sparse_vec.values
+                    updated_entries.append(entry)
+            if updated_entries:
+                EmbeddingCache.objects.bulk_update(
+                    updated_entries, ['sparse_indices', 'sparse_values'], batch_size=500
+                )
+        except Exception as e:
+            logger.warning(f"⚠️ 写入嵌入缓存失败: {e}")
+
+    def _save_chunks_to_db(self, chunks: List[LangChainDocument], vector_ids: List[str], document_obj: Document,
+                           start_index: int = 0, hashes: Optional[List[str]] = None):
+        """保存分块信息到数据库（start_index 为首个分块的 chunk_index）"""
+        hashes = hashes or [self._compute_chunk_hash(chunk.page_content) for chunk in chunks]
+        chunk_objects = [
+            self._build_chunk_object(chunk, start_index + i, vector_id, content_hash, document_obj)
+            for i, (chunk, vector_id, content_hash) in enumerate(zip(chunks, vector_ids, hashes))
+        ]
         DocumentChunk.objects.bulk_create(chunk_objects)
 
+    def _build_chunk_object(self, chunk: LangChainDocument, chunk_index: int, vector_id: str,
+                            content_hash: str, document_obj: Document) -> DocumentChunk:
+        """构建 DocumentChunk 记录"""
+        return DocumentChunk(
+            document=document_obj,
+            chunk_index=chunk_index,
+            content=chunk.page_content,
+            vector_id=vector_id,
+            embedding_hash=self._compute_embedding_hash(content_hash),
+            start_index=chunk.metadata.get('start_index'),
+            end_index=chunk.metadata.get('end_index'),
+            page_number=chunk.metadata.get('page')
+        )
+
     def similarity_search(self, query: str, k: int = 5, score_threshold: float = 0.1) -> List[Dict[str, Any]]:
         """相似度搜索（支持稠密+稀疏混合检索）"""
         embedding_type = type(self.embeddings).__name__
@@ -1281,18 +1711,29 @@ class VectorStoreManager:
         logger.info(f"   🤖 使用嵌入模型: {embedding_type}")
         logger.info(f"   🎯 返回数量: {k}, 相似度阈值: {score_threshold}")
 
+        cache_key = search_cache.make_result_key(
+            [self.knowledge_base.id], self.global_config.model_name or '', query, k, score_threshold
+        )
+        cached_results = search_cache.get_cached_results(cache_key)
+        if cached_results is not None:
+            logger.info(f"   📦 命中检索结果缓存: {len(cached_results)} 条")
+            return cached_results
+
         # 根据是否有稀疏编码器选择检索方式
         if self.sparse_encoder:
             logger.info("   🔀 使用混合检索（BM25 + 稠密向量）")
-            return self._hybrid_similarity_search(query, k, score_threshold)
+            results = self._hybrid_similarity_search(query, k, score_threshold)
         else:
             logger.info("   📊 使用纯稠密向量检索")
-            return self._dense_similarity_search(query, k, score_threshold)
+            results = self._dense_similarity_search(query, k, score_threshold)
+
+        search_cache.set_cached_results(cache_key, results)
+        return results
 
     def _dense_similarity_search(self, query: str, k: int, score_threshold: float) -> List[Dict[str, Any]]:
         """纯稠密向量检索"""
         try:
-            dense_vector = self.embeddings.embed_query(query)
+            dense_vector = self._embed_query(query)
             collection_name = self._get_collection_name()
             
             results = self.qdrant_client.search(
@@ -1321,43 +1762,26 @@ class VectorStoreManager:
             per_source_limit = max(k * 5, 20) if reranker_enabled else max(k * 3, 10)
 
             # 计算稠密向量
-            dense_vector = self.embeddings.embed_query(query)
+            dense_vector = self._embed_query(query)
 
             # 计算稀疏向量
             sparse_query = self.sparse_encoder.encode_query(query)
 
-            # 稠密向量检索
-            dense_results = self.qdrant_client.search(
-                collection_name=collection_name,
-                query_vector=NamedVector(
-                    name=self.DENSE_VECTOR_NAME,
-                    vector=dense_vector,
-                ),
-                limit=per_source_limit,
-                with_payload=True,
+            # RRF 融合（取更多候选用于 Reranker）
+            fusion_limit = k * 3 if reranker_enabled else k
+
+            # 优先通过 Query API 一次请求完成稠密/稀疏检索，仅为最终结果读取 payload
+            fused_results = self._query_api_search(
+                collection_name, dense_vector, sparse_query, per_source_limit, fusion_limit
             )
 
-            # 稀疏向量检索
-            sparse_results = []
-            if sparse_query:
-                sparse_results = self.qdrant_client.search(
-                    collection_name=collection_name,
-                    query_vector=NamedSparseVector(
-                        name=self.SPARSE_VECTOR_NAME,
-                        vector=SparseVector(
-                            indices=sparse_query.indices.tolist(),
-                            values=sparse_query.values.tolist(),
-                        ),
-                    ),
-                    limit=per_source_limit,
-                    with_payload=True,
+            if fused_results is None:
+                # 稠密 + 稀疏向量检索，本地 RRF 融合
+                dense_results, sparse_results = self._search_candidates(
+                    collection_name, dense_vector, sparse_query, per_source_limit
                 )
-
-            logger.info(f"🔍 稠密候选: {len(dense_results)}, 稀疏候选: {len(sparse_results)}")
-
-            # RRF 融合（取更多候选用于 Reranker）
-            fusion_limit = k * 3 if reranker_enabled else k
-            fused_results = self._rrf_fusion(dense_results, sparse_results, fusion_limit)
+                logger.info(f"🔍 稠密候选: {len(dense_results)}, 稀疏候选: {len(sparse_results)}")
+                fused_results = self._rrf_fusion(dense_results, sparse_results, fusion_limit)
 
             # Reranker 精排（仅 Xinference 支持）
             if reranker_enabled and fused_results:
@@ -1372,6 +1796,113 @@ class VectorStoreManager:
             logger.warning("⚠️ 降级为纯稠密检索")
             return self._dense_similarity_search(query, k, score_threshold)
 
+    def _query_api_search(self, collection_name: str, dense_vector: List[float], sparse_query,
+                          prefetch_limit: int, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        使用 Qdrant Query API 在一次批量请求中完成稠密/稀疏检索
+        候选不携带 payload，经 _rrf_fusion 融合后仅为最终 limit 个结果读取 payload
+
+        Qdrant 服务端 RRF 的常数（k=2）与本地不同且不返回各路排名，
+        因此融合在本地完成，分数与本地融合路径完全一致，相似度阈值含义相同
+
+        Returns:
+            与 _rrf_fusion 格式一致的融合结果；Query API 不可用或本次请求失败时返回 None，由调用方走本地检索
+        """
+        if not getattr(settings, 'KNOWLEDGE_QDRANT_SERVER_FUSION', True):
+            return None
+        if VectorStoreManager._query_api_supported is False:
+            return None
+        if sparse_query is None:
+            # 没有稀疏向量时不是混合检索，由本地路径处理
+            return None
+
+        try:
+            dense_response, sparse_response = self.qdrant_client.query_batch_points(
+                collection_name=collection_name,
+                requests=[
+                    models.QueryRequest(
+                        query=dense_vector,
+                        using=self.DENSE_VECTOR_NAME,
+                        limit=prefetch_limit,
+                        with_payload=False,
+                    ),
+                    models.QueryRequest(
+                        query=SparseVector(
+                            indices=sparse_query.indices.tolist(),
+                            values=sparse_query.values.tolist(),
+                        ),
+                        using=self.SPARSE_VECTOR_NAME,
+                        limit=prefetch_limit,
+                        with_payload=False,
+                    ),
+                ],
+            )
+            fused_results = self._rrf_fusion(dense_response.points, sparse_response.points, limit)
+            if fused_results:
+                point_ids = {
+                    str(point.id): point.id
+                    for point in [*dense_response.points, *sparse_response.points]
+                }
+                records = self.qdrant_client.retrieve(
+                    collection_name=collection_name,
+                    ids=[point_ids[item["id"]] for item in fused_results],
+                    with_payload=True,
+                )
+                payloads = {str(record.id): record.payload or {} for record in records}
+                # 检索与读取 payload 之间被删除的分块不再返回
+                fused_results = [item for item in fused_results if item["id"] in payloads]
+                for item in fused_results:
+                    item["payload"] = payloads[item["id"]]
+        except UnexpectedResponse as e:
+            if e.status_code in (404, 405):
+                # 旧版 Qdrant（< 1.10）没有 Query API，之后不再尝试
+                VectorStoreManager._query_api_supported = False
+                logger.warning(f"⚠️ Qdrant 不支持 Query API，改用本地检索: {e}")
+            else:
+                # 如 400：该集合没有稀疏向量（旧版纯稠密集合），仅本次改用本地检索
+                logger.warning(f"⚠️ Qdrant Query API 检索失败，本次改用本地检索: {e}")
+            return None
+        except Exception as e:
+            # 其他错误（网络等）同样改用本地检索，而不是降级为纯稠密检索
+            logger.warning(f"⚠️ Qdrant Query API 检索失败，本次改用本地检索: {e}")
+            return None
+
+        VectorStoreManager._query_api_supported = True
+        logger.info(
+            f"🔍 Query API 稠密候选: {len(dense_response.points)}, 稀疏候选: {len(sparse_response.points)}"
+        )
+        return fused_results
+
+    def _search_candidates(self, collection_name: str, dense_vector: List[float], sparse_query,
+                           limit: int) -> tuple:
+        """在指定集合中分别执行稠密/稀疏检索，返回 (dense_results, sparse_results)"""
+        dense_results = self.qdrant_client.search(
+            collection_name=collection_name,
+            query_vector=NamedVector(
+                name=self.DENSE_VECTOR_NAME,
+                vector=dense_vector,
+            ),
+            limit=limit,
+            with_payload=True,
+        )
+
+        sparse_results = []
+        if sparse_query:
+            sparse_results = self.qdrant_client.search(
+                collection_name=collection_name,
+                query_vector=NamedSparseVector(
+                    name=self.SPARSE_VECTOR_NAME,
+                    vector=SparseVector(
+                        indices=sparse_query.indices.tolist(),
+                        values=sparse_query.values.tolist(),
+                    ),
+                ),
+                limit=limit,
+                with_payload=True,
+            )
+
+        return dense_results, sparse_results
+
     def _rrf_fusion(self, dense_results, sparse_results, limit: int) -> List[Dict[str, Any]]:
         """RRF (Reciprocal Rank Fusion) 融合两种检索结果"""
         if not dense_results and not sparse_results:
@@ -1508,49 +2039,196 @@ class VectorStoreManager:
     def delete_document(self, document: Document):
         """从 Qdrant 向量存储中删除文档"""
         try:
-            chunks = document.chunks.all()
-            vector_ids = [chunk.vector_id for chunk in chunks if chunk.vector_id]
-
-            if vector_ids:
-                # Qdrant 删除
-                collection_name = self._get_collection_name()
-                self.qdrant_client.delete(
-                    collection_name=collection_name,
-                    points_selector=vector_ids
-                )
-                logger.info(f"✅ 已从 Qdrant 删除 {len(vector_ids)} 个向量")
-
-            chunks.delete()
+            self.delete_documents_vectors(self.knowledge_base.id, [document.id])
+            document.chunks.all().delete()
         except Exception as e:
             logger.error(f"删除文档向量失败: {e}")
             raise
 
 
+def _is_missing_collection(error) -> bool:
+    """集合不存在（知识库尚无文档）的 Qdrant 响应"""
+    return isinstance(error, UnexpectedResponse) and error.status_code == 404
+
+
+class FederatedKnowledgeSearch:
+    """
+    跨知识库联合检索
+    查询只向量化一次，并发检索各知识库集合，再做全局 RRF 融合与 Reranker 精排
+    """
+
+    def __init__(self, knowledge_bases: List[KnowledgeBase]):
+        self.knowledge_bases = list(knowledge_bases)
+        if not self.knowledge_bases:
+            raise ValueError("联合检索至少需要一个知识库")
+        # 嵌入模型、稀疏编码器和 Reranker 均来自全局配置，所有知识库共用一个管理器
+        self.vector_manager = VectorStoreManager(self.knowledge_bases[0])
+
+    def search(self, query: str, k: int = 5, score_threshold: float = 0.1) -> List[Dict[str, Any]]:
+        """在所有知识库中检索，返回全局排序后的前 k 条结果"""
+        manager = self.vector_manager
+        cache_key = search_cache.make_result_key(
+            [kb.id for kb in self.knowledge_bases], manager.global_config.model_name or '', query, k, score_threshold
+        )
+        cached_results = search_cache.get_cached_results(cache_key)
+        if cached_results is not None:
+            logger.info(f"📦 联合检索命中结果缓存: {len(cached_results)} 条")
+            return cached_results
+
+        results, complete = self._search(query, k, score_threshold)
+        if complete:
+            # 部分知识库检索失败时结果不完整，不缓存，下次检索重新尝试
+            search_cache.set_cached_results(cache_key, results)
+        return results
+
+    def _search_knowledge_base(self, collection_name: str, dense_vector: List[float], sparse_query,
+                               limit: int) -> tuple:
+        """检索单个知识库集合，稀疏检索失败（如旧版纯稠密集合）时降级为纯稠密检索"""
+        manager = self.vector_manager
+        try:
+            return manager._search_candidates(collection_name, dense_vector, sparse_query, limit)
+        except Exception as e:
+            if sparse_query is None or _is_missing_collection(e):
+                raise
+            logger.warning(f"    └─ {collection_name}: 混合检索失败，降级为纯稠密检索: {e}")
+            return manager._search_candidates(collection_name, dense_vector, None, limit)
+
+    def _search(self, query: str, k: int, score_threshold: float) -> tuple:
+        """
+        Returns:
+            (results, complete)：complete 为 False 表示有知识库检索失败
+
+        Raises:
+            所有存在集合的知识库都检索失败时抛出最后一个错误，由调用方重试或报告失败
+        """
+        manager = self.vector_manager
+        reranker_enabled = manager._get_reranker_url() is not None
+        per_source_limit = max(k * 5, 20) if reranker_enabled else max(k * 3, 10)
+
+        dense_vector = manager._embed_query(query)
+        sparse_query = manager.sparse_encoder.encode_query(query) if manager.sparse_encoder else None
+
+        dense_results, sparse_results = [], []
+        max_workers = min(len(self.knowledge_bases), getattr(settings, 'KNOWLEDGE_SEARCH_MAX_WORKERS', 8))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    self._search_knowledge_base, f"kb_{kb.id}", dense_vector, sparse_query, per_source_limit
+                ): kb
+                for kb in self.knowledge_bases
+            }
+            succeeded, errors = 0, []
+            for future in as_completed(futures):
+                kb = futures[future]
+                try:
+                    kb_dense, kb_sparse = future.result()
+                except Exception as e:
+                    if _is_missing_collection(e):
+                        # 知识库尚无文档时集合不存在，跳过即可
+                        logger.info(f"    └─ {kb.name}: 集合不存在，跳过")
+                        continue
+                    logger.warning(f"    └─ {kb.name}: 检索失败 {e}")
+                    errors.append(e)
+                    continue
+                succeeded += 1
+                for point in list(kb_dense) + list(kb_sparse):
+                    if point.payload is not None:
+                        point.payload.setdefault('knowledge_base_name', kb.name)
+                dense_results.extend(kb_dense)
+                sparse_results.extend(kb_sparse)
+
+        if errors and not succeeded:
+            raise errors[-1]
+        complete = not errors
+
+        # 同一嵌入模型/BM25 下各集合的分数可直接比较，合并后按分数重新排名
+        dense_results.sort(key=lambda point: point.score, reverse=True)
+        sparse_results.sort(key=lambda point: point.score, reverse=True)
+        logger.info(
+            f"🔍 联合检索 {len(self.knowledge_bases)} 个知识库: "
+            f"稠密候选 {len(dense_results)}, 稀疏候选 {len(sparse_results)}"
+        )
+
+        if not manager.sparse_encoder:
+            return manager._format_search_results(dense_results[:k], score_threshold), complete
+
+        fusion_limit = k * 3 if reranker_enabled else k
+        fused_results = manager._rrf_fusion(dense_results[:per_source_limit], sparse_results[:per_source_limit], fusion_limit)
+        if reranker_enabled and fused_results:
+            fused_results = manager._rerank(query, fused_results, k)
+        return manager._format_fused_results(fused_results, score_threshold), complete
+
+
 class KnowledgeBaseService:
     """知识库服务"""
 
+    # 各处理阶段开始时上报的进度（百分比）
+    STAGE_PROGRESS = {
+        'queued': 0,
+        'loading': 5,
+        'splitting': 15,
+        'embedding': 25,
+        'upserting': 75,
+        'saving': 90,
+        'done': 100,
+    }
+
     def __init__(self, knowledge_base: KnowledgeBase):
         self.knowledge_base = knowledge_base
         self.document_processor = DocumentProcessor()
         self.vector_manager = VectorStoreManager(knowledge_base)
 
-    def process_document(self, document: Document) -> bool:
-        """处理文档"""
+    @classmethod
+    def report_stage(cls, document: Document, stage: str, fraction: Optional[float] = None):
+        """
+        更新文档处理阶段与进度（仅更新相关字段，避免覆盖其他修改）
+        fraction 为向量化阶段的完成比例
+        """
+        progress = cls.STAGE_PROGRESS.get(stage, document.progress)
+        if fraction is not None and stage == 'embedding':
+            # 流式处理时向量化、写入、保存按窗口交替进行，进度在 embedding 到 saving 之间插值
+            span = cls.STAGE_PROGRESS['saving'] - progress
+            progress += int(span * min(max(fraction, 0.0), 1.0))
+        document.processing_stage = stage
+        document.progress = progress
+        Document.objects.filter(id=document.id).update(
+            processing_stage=document.processing_stage,
+            progress=document.progress,
+        )
+
+    def process_document(self, document: Document, incremental: bool = True,
+                         raise_on_error: bool = False) -> bool:
+        """
+        处理文档
+
+        Args:
+            document: 待处理文档
+            incremental: 已有分块时是否增量重建（仅写入变化的分块），False 时删除后全量重建
+            raise_on_error: 失败时在标记文档状态后重新抛出异常（供异步任务判断是否重试）
+        """
+        def report(stage: str, fraction: Optional[float] = None):
+            self.report_stage(document, stage, fraction)
+
         try:
             # 更新状态为处理中
             document.status = 'processing'
             document.save()
 
-            # 清理已存在的分块和向量（如果有的话）
-            try:
-                self.vector_manager.delete_document(document)
-            except Exception as e:
-                logger.warning(f"删除旧向量时出错（可能是首次处理）: {e}")
-            
-            # 再从数据库删除分块记录
-            document.chunks.all().delete()
+            # 已有向量分块时走增量重建，避免处理期间文档不可检索
+            use_incremental = incremental and document.chunks.filter(vector_id__isnull=False).exists()
+
+            if not use_incremental:
+                # 清理已存在的分块和向量（如果有的话）
+                try:
+                    self.vector_manager.delete_document(document)
+                except Exception as e:
+                    logger.warning(f"删除旧向量时出错（可能是首次处理）: {e}")
+
+                # 再从数据库删除分块记录
+                document.chunks.all().delete()
 
             # 加载文档
+            report('loading')
             langchain_docs = self.document_processor.load_document(document)
 
             # 计算文档统计信息
@@ -1559,24 +2237,35 @@ class KnowledgeBaseService:
             document.page_count = len(langchain_docs)
 
             # 向量化并存储
-            vector_ids = self.vector_manager.add_documents(langchain_docs, document)
+            if use_incremental:
+                chunk_count = self.vector_manager.reindex_document(
+                    langchain_docs, document, progress_callback=report
+                )['total']
+            else:
+                chunk_count = len(self.vector_manager.add_documents(
+                    langchain_docs, document, progress_callback=report
+                ))
 
             # 更新状态为完成
             document.status = 'completed'
+            document.processing_stage = 'done'
+            document.progress = self.STAGE_PROGRESS['done']
             document.processed_at = timezone.now()
             document.error_message = None
             document.save()
 
-            logger.info(f"文档处理成功: {document.id}, 生成 {len(vector_ids)} 个分块")
+            logger.info(f"文档处理成功: {document.id}, 生成 {chunk_count} 个分块")
             return True
 
         except Exception as e:
-            # 更新状态为失败
+            # 更新状态为失败（保留失败时所处的阶段）
             document.status = 'failed'
             document.error_message = str(e)
             document.save()
 
             logger.error(f"文档处理失败: {document.id}, 错误: {e}")
+            if raise_on_error:
+                raise
             return False
 
     def query(self, query_text: str, top_k: int = 5, similarity_threshold: float = 0.5,
@@ -1675,14 +2364,40 @@ class KnowledgeBaseService:
                 if os.path.exists(document.file.path):
                     os.remove(document.file.path)
 
-            # 删除数据库记录
-            document.delete()
-
-            # 清理向量存储缓存（因为内容已变化）
-            VectorStoreManager.clear_cache(self.knowledge_base.id)
+            # 删除数据库记录（向量已清理，跳过信号中的重复清理）
+            from .signals import skip_document_vector_cleanup
+            with skip_document_vector_cleanup():
+                document.delete()
 
             logger.info(f"文档删除成功: {document.id}")
 
         except Exception as e:
             logger.error(f"删除文档失败: {e}")
             raise
+
+    @staticmethod
+    def bulk_delete_documents(knowledge_base_id, documents) -> int:
+        """
+        批量删除同一知识库下的文档
+        向量通过一次过滤删除清理，数据库记录删除时跳过逐个文档的信号清理
+        """
+        from .signals import skip_document_vector_cleanup
+
+        documents = list(documents)
+        if not documents:
+            return 0
+
+        VectorStoreManager.delete_documents_vectors(knowledge_base_id, [document.id for document in documents])
+
+        for document in documents:
+            if document.file and os.path.exists(document.file.path):
+                try:
+                    os.remove(document.file.path)
+                except OSError as e:
+                    logger.warning(f"删除文档文件失败 {document.file.path}: {e}")
+
+        with skip_document_vector_cleanup():
+            Document.objects.filter(id__in=[document.id for document in documents]).delete()
+
+        logger.info(f"批量删除文档成功: 知识库 {knowledge_base_id}, 共 {len(documents)} 个")
+        return len(documents)
@@ -5,12 +5,30 @@
 import os
 import shutil
 import logging
-from django.db.models.signals import post_delete, pre_delete
+import threading
+from contextlib import contextmanager
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+_cleanup_state = threading.local()
+
+
+@contextmanager
+def skip_document_vector_cleanup():
+    """
+    在上下文内删除文档时跳过逐个文档的向量清理
+    用于调用方已统一清理向量的场景（如批量删除）
+    """
+    previous = getattr(_cleanup_state, 'skip', False)
+    _cleanup_state.skip = True
+    try:
+        yield
+    finally:
+        _cleanup_state.skip = previous
+
 
 @receiver(pre_delete, sender='knowledge.KnowledgeBase')
 def cleanup_knowledge_base(sender, instance, **kwargs):
@@ -23,8 +41,8 @@ def cleanup_knowledge_base(sender, instance, **kwargs):
         
         logger.info(f"🗑️  开始清理知识库: {instance.name} (ID: {instance.id})")
         
-        # 1. 清理向量存储缓存（会同时删除 Qdrant 集合）
-        VectorStoreManager.clear_cache(instance.id)
+        # 1. 删除 Qdrant 集合并清理向量存储缓存
+        VectorStoreManager.drop_collection(instance.id)
         logger.info("  ✅ 已清理向量存储缓存和 Qdrant 集合")
         
         # 2. 删除知识库文件目录
@@ -47,18 +65,29 @@ def cleanup_knowledge_base(sender, instance, **kwargs):
 
 
 @receiver(post_delete, sender='knowledge.Document')
-def cleanup_document_cache(sender, instance, **kwargs):
+def cleanup_document_vectors(sender, instance, **kwargs):
     """
-    文档删除后清理相关缓存
-    DocumentChunk 会通过 CASCADE 自动删除,但缓存需要手动清理
+    文档删除后清理该文档在 Qdrant 中的向量
+    DocumentChunk 会通过 CASCADE 自动删除，向量按 document_id 过滤删除，不影响知识库内其他文档
     """
+    if getattr(_cleanup_state, 'skip', False):
+        return
+
     try:
         from .services import VectorStoreManager
-        
-        # 清理知识库的向量存储缓存
-        # 因为 Collection 中的文档数量已经变化
-        VectorStoreManager.clear_cache(instance.knowledge_base.id)
-        logger.info(f"✅ 已清理文档 '{instance.title}' 相关的向量缓存")
-        
+
+        VectorStoreManager.delete_documents_vectors(instance.knowledge_base_id, [instance.id])
+        logger.info(f"✅ 已清理文档 '{instance.title}' 的向量")
+
     except Exception as e:
-        logger.error(f"❌ 清理文档缓存失败: {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"❌ 清理文档向量失败: {e}", exc_info=True)
+
+
+@receiver(post_save, sender='knowledge.Document')
+@receiver(post_delete, sender='knowledge.Document')
+def invalidate_search_cache(sender, instance, **kwargs):
+    """文档变化后清除所属知识库的检索结果缓存，并递增版本号使其他进程的缓存失效"""
+    from .search_cache import bump_knowledge_base_version, invalidate_knowledge_base
+
+    invalidate_knowledge_base(instance.knowledge_base_id)
+    bump_knowledge_base_version(instance.knowledge_base_id)
@@ -0,0 +1,96 @@
+"""
+知识库文档处理异步任务
+"""
+import logging
+import requests
+from celery import shared_task
+from qdrant_client.http.exceptions import ResponseHandlingException
+
+logger = logging.getLogger(__name__)
+
+# 可重试的瞬时错误（网络/向量库连接问题），其余错误直接标记失败
+TRANSIENT_ERRORS = (requests.RequestException, ConnectionError, TimeoutError, ResponseHandlingException)
+
+
+@shared_task(
+    bind=True,
+    name='knowledge.process_document',
+    max_retries=3,
+    default_retry_delay=30,
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+def process_document_task(self, document_id, incremental=True):
+    """
+    异步处理文档：加载 → 分块 → 向量化 → 写入向量库 → 保存分块
+
+    任务在 worker 执行完成后才确认（acks_late），worker 重启时任务会重新投递。
+    各阶段可安全重入：向量化命中嵌入缓存，未保存分块时写入的向量会在重试开始时清理。
+
+    Args:
+        document_id: Document实例的ID
+        incremental: 已有分块时是否增量重建
+    """
+    from .models import Document
+    from .services import KnowledgeBaseService
+
+    try:
+        document = Document.objects.select_related('knowledge_base').get(id=document_id)
+    except Document.DoesNotExist:
+        logger.warning(f"文档不存在，跳过处理: {document_id}")
+        return {'status': 'error', 'message': f'文档不存在: {document_id}'}
+
+    try:
+        service = KnowledgeBaseService(document.knowledge_base)
+        service.process_document(document, incremental=incremental, raise_on_error=True)
+        logger.info(f"文档 {document.id} 处理完成")
+        return {
+            'status': 'success',
+            'document_id': str(document.id),
+            'chunk_count': document.chunks.count(),
+        }
+
+    except TRANSIENT_ERRORS as e:
+        if self.request.retries < self.max_retries:
+            logger.warning(f"文档 {document.id} 处理遇到瞬时错误，{self.default_retry_delay}s 后重试: {e}")
+            Document.objects.filter(id=document.id).update(status='pending', processing_stage='queued')
+            raise self.retry(exc=e)
+        return _mark_failed(document, e)
+
+    except Exception as e:
+        return _mark_failed(document, e)
+
+
+def _mark_failed(document, error):
+    """标记文档处理失败"""
+    from .models import Document
+
+    logger.error(f"文档 {document.id} 处理失败: {error}", exc_info=True)
+    Document.objects.filter(id=document.id).update(status='failed', error_message=str(error))
+    return {'status': 'error', 'document_id': str(document.id), 'message': str(error)}
+
+
+def enqueue_document_processing(document, incremental=True):
+    """将文档加入处理队列，并记录任务ID"""
+    from .models import Document
+
+    document.status = 'pending'
+    document.processing_stage = 'queued'
+    document.progress = 0
+    document.error_message = None
+    Document.objects.filter(id=document.id).update(
+        status='pending', processing_stage='queued', progress=0, error_message=None
+    )
+
+    task = process_document_task.delay(str(document.id), incremental)
+    document.task_id = task.id
+    Document.objects.filter(id=document.id).update(task_id=task.id)
+    return task
+
+
+@shared_task(name='knowledge.health_check', ignore_result=True)
+def health_check_task():
+    """定时探测嵌入与 Reranker 服务可用性"""
+    from .health import run_health_checks
+
+    run_health_checks()
@@ -0,0 +1,539 @@
+"""knowledge单元测试"""
+
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from unittest.mock import Mock, patch
+from qdrant_client.http.exceptions import UnexpectedResponse
+from langchain_core.documents import Document as LangChainDocument
+
+from projects.models import Project
+from . import search_cache
+from .health import run_health_checks
+from .models import EmbeddingCache, KnowledgeBase, Document, DocumentChunk, KnowledgeGlobalConfig, ServiceHealthCheck
+from .services import CustomAPIEmbeddings, VectorStoreManager, KnowledgeBaseService, FederatedKnowledgeSearch
+
+
+class CustomAPIEmbeddingsTest(TestCase):
+    """测试自定义API嵌入的批量与重试逻辑"""
+
+    def _make_response(self, inputs):
+        """构造 OpenAI 兼容的响应（逆序返回，验证按 index 还原顺序）"""
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        response = Mock()
+        response.raise_for_status.return_value = None
+        response.json.return_value = {
+            'data': [
+                {'index': i, 'embedding': [float(len(text))]}
+                for i, text in reversed(list(enumerate(inputs)))
+            ]
+        }
+        return response
+
+    def test_embed_documents_batches_requests(self):
+        """测试按 batch_size 打包请求并保持输出顺序"""
+        embeddings = CustomAPIEmbeddings('http://embed/v1/embeddings', batch_size=2, max_workers=2)
+        session = Mock()
+        session.post.side_effect = lambda url, json, headers, timeout: self._make_response(json['input'])
+        embeddings._session = session
+
+        texts = ['a', 'bb', 'ccc', 'dddd', 'eeeee']
+        result = embeddings.embed_documents(texts)
+
+        self.assertEqual(session.post.call_count, 3)
+        self.assertEqual(result, [[1.0], [2.0], [3.0], [4.0], [5.0]])
+
+    def test_embed_documents_retries_only_failed_batches(self):
+        """测试仅重试失败的批次"""
+        embeddings = CustomAPIEmbeddings(
+            'http://embed/v1/embeddings', batch_size=2, max_workers=1, max_retries=1
+        )
+        calls = []
+
+        def post(url, json, headers, timeout):
+            calls.append(json['input'])
+            if json['input'] == ['ccc', 'dddd'] and calls.count(['ccc', 'dddd']) == 1:
+                raise ConnectionError('boom')
+            return self._make_response(json['input'])
+
+        session = Mock()
+        session.post.side_effect = post
+        embeddings._session = session
+
+        result = embeddings.embed_documents(['a', 'bb', 'ccc', 'dddd'])
+
+        self.assertEqual(result, [[1.0], [2.0], [3.0], [4.0]])
+        self.assertEqual(calls.count(['a', 'bb']), 1)
+        self.assertEqual(calls.count(['ccc', 'dddd']), 2)
+
+    def test_embed_documents_keeps_transient_errors_retryable(self):
+        """测试重试后仍失败时，网络错误保持原类型以便任务重试，客户端错误包装为 RuntimeError"""
+        import requests
+        from .tasks import TRANSIENT_ERRORS
+
+        embeddings = CustomAPIEmbeddings('http://embed/v1/embeddings', max_workers=1, max_retries=0)
+        session = Mock()
+        embeddings._session = session
+
+        session.post.side_effect = requests.ConnectionError('refused')
+        with self.assertRaises(TRANSIENT_ERRORS):
+            embeddings.embed_documents(['a'])
+
+        session.post.side_effect = requests.HTTPError('unauthorized', response=Mock(status_code=401))
+        with self.assertRaises(RuntimeError):
+            embeddings.embed_documents(['a'])
+
+
+def make_vector_manager(knowledge_base=None):
+    """构造不连接外部服务的 VectorStoreManager"""
+    manager = VectorStoreManager.__new__(VectorStoreManager)
+    manager.knowledge_base = knowledge_base
+    manager.global_config = Mock(embedding_service='custom', model_name='bge-m3')
+    manager.embeddings = Mock()
+    manager.embeddings.embed_documents.side_effect = lambda texts: [[float(len(t))] for t in texts]
+    manager.sparse_encoder = None
+    manager._vector_store = Mock()
+    manager._qdrant_client = Mock()
+    return manager
+
+
+class EmbeddingCacheTest(TestCase):
+    """测试分块嵌入缓存"""
+
+    def test_unchanged_chunks_reuse_cached_vectors(self):
+        """测试未变化的分块复用缓存，仅嵌入新分块"""
+        manager = make_vector_manager()
+        texts = ['alpha', 'beta']
+        hashes = [manager._compute_chunk_hash(t) for t in texts]
+        manager._embed_chunks(texts, hashes)
+        self.assertEqual(EmbeddingCache.objects.count(), 2)
+
+        texts = ['alpha', 'beta', 'gamma!']
+        hashes = [manager._compute_chunk_hash(t) for t in texts]
+        dense, sparse = manager._embed_chunks(texts, hashes)
+
+        self.assertEqual(dense, [[5.0], [4.0], [6.0]])
+        self.assertIsNone(sparse)
+        manager.embeddings.embed_documents.assert_called_with(['gamma!'])
+        self.assertEqual(EmbeddingCache.objects.count(), 3)
+
+
+class IncrementalReindexTest(TestCase):
+    """测试文档增量重建"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.project = Project.objects.create(name='TestProject', creator=self.user)
+        self.knowledge_base = KnowledgeBase.objects.create(name='KB', project=self.project, creator=self.user)
+        self.document = Document.objects.create(
+            knowledge_base=self.knowledge_base, title='Doc', document_type='txt', content='x'
+        )
+        self.manager = make_vector_manager(self.knowledge_base)
+        for i, text in enumerate(['A', 'B', 'C']):
+            DocumentChunk.objects.create(
+                document=self.document, chunk_index=i, content=text, vector_id=f'vec-{text}',
+                embedding_hash=self.manager._compute_embedding_hash(self.manager._compute_chunk_hash(text))
+            )
+
+    def test_reindex_only_writes_changed_chunks(self):
+        """测试仅写入新增分块、删除消失分块、原地移动保留分块"""
+        self.manager._split_documents = lambda docs: [
+            LangChainDocument(page_content=text, metadata={}) for text in ['B', 'A', 'D']
+        ]
+
+        stats = self.manager.reindex_document([], self.document)
+
+        self.assertEqual(stats, {'total': 3, 'added': 1, 'removed': 1, 'moved': 2, 'unchanged': 0})
+        self.manager.embeddings.embed_documents.assert_called_once_with(['D'])
+        upserted = self.manager._qdrant_client.upsert.call_args.kwargs['points']
+        self.assertEqual(len(upserted), 1)
+        deleted = self.manager._qdrant_client.delete.call_args.kwargs['points_selector']
+        self.assertEqual(deleted.points, ['vec-C'])
+
+        chunks = list(self.document.chunks.order_by('chunk_index').values_list('content', 'vector_id'))
+        self.assertEqual(chunks[:2], [('B', 'vec-B'), ('A', 'vec-A')])
+        self.assertEqual(chunks[2][0], 'D')
+
+    def test_reindex_after_model_change_reembeds_all_chunks(self):
+        """测试切换嵌入模型后即使内容未变也重新向量化所有分块"""
+        self.manager.global_config = Mock(embedding_service='custom', model_name='bge-large-zh')
+        self.manager._split_documents = lambda docs: [
+            LangChainDocument(page_content=text, metadata={}) for text in ['A', 'B', 'C']
+        ]
+
+        stats = self.manager.reindex_document([], self.document)
+
+        self.assertEqual(stats['added'], 3)
+        self.assertEqual(stats['removed'], 3)
+        self.manager.embeddings.embed_documents.assert_called_once_with(['A', 'B', 'C'])
+
+
+class DocumentDeletionTest(TestCase):
+    """测试文档删除时仅清理该文档的向量"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.project = Project.objects.create(name='TestProject', creator=self.user)
+        self.knowledge_base = KnowledgeBase.objects.create(name='KB', project=self.project, creator=self.user)
+        self.client_mock = Mock()
+        self.client_mock.collection_exists.return_value = True
+        patcher = patch.object(VectorStoreManager, '_shared_qdrant_client', self.client_mock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _create_document(self, title):
+        return Document.objects.create(
+            knowledge_base=self.knowledge_base, title=title, document_type='txt', content='x'
+        )
+
+    def test_delete_document_keeps_collection(self):
+        """测试删除单个文档按 document_id 过滤删除，不删除集合"""
+        document = self._create_document('Doc')
+        document_id = str(document.id)
+        document.delete()
+
+        self.client_mock.delete_collection.assert_not_called()
+        selector = self.client_mock.delete.call_args.kwargs['points_selector']
+        self.assertEqual(selector.filter.must[0].match.any, [document_id])
+
+    def test_bulk_delete_uses_single_qdrant_call(self):
+        """测试批量删除只调用一次 Qdrant 删除"""
+        documents = [self._create_document(f'Doc{i}') for i in range(3)]
+
+        deleted = KnowledgeBaseService.bulk_delete_documents(self.knowledge_base.id, documents)
+
+        self.assertEqual(deleted, 3)
+        self.assertEqual(self.client_mock.delete.call_count, 1)
+        self.assertFalse(Document.objects.filter(knowledge_base=self.knowledge_base).exists())
+
+
+class DocumentProgressTest(TestCase):
+    """测试文档处理阶段进度上报"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.project = Project.objects.create(name='TestProject', creator=self.user)
+        self.knowledge_base = KnowledgeBase.objects.create(name='KB', project=self.project, creator=self.user)
+        self.document = Document.objects.create(
+            knowledge_base=self.knowledge_base, title='Doc', document_type='txt', content='hello world'
+        )
+
+    def test_process_document_reports_stages(self):
+        """测试处理过程中依次上报各阶段，完成后进度为100"""
+        stages = []
+        service = KnowledgeBaseService.__new__(KnowledgeBaseService)
+        service.knowledge_base = self.knowledge_base
+        service.document_processor = Mock()
+        service.document_processor.load_document.return_value = [
+            LangChainDocument(page_content='hello world', metadata={})
+        ]
+        service.vector_manager = Mock()
+
+        def add_documents(docs, document, progress_callback):
+            for stage in ['splitting', 'embedding', 'upserting', 'saving']:
+                progress_callback(stage)
+                stages.append(Document.objects.get(id=document.id).progress)
+            return ['vec-1']
+
+        service.vector_manager.add_documents.side_effect = add_documents
+
+        self.assertTrue(service.process_document(self.document))
+
+        self.assertEqual(stages, [15, 25, 75, 90])
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'completed')
+        self.assertEqual(self.document.processing_stage, 'done')
+        self.assertEqual(self.document.progress, 100)
+
+
+class StreamingAddDocumentsTest(TestCase):
+    """测试按窗口流式写入文档分块"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.project = Project.objects.create(name='TestProject', creator=self.user)
+        self.knowledge_base = KnowledgeBase.objects.create(
+            name='KB', project=self.project, creator=self.user, chunk_size=10, chunk_overlap=0
+        )
+        self.document = Document.objects.create(
+            knowledge_base=self.knowledge_base, title='Doc', document_type='txt', content='x'
+        )
+
+    def test_add_documents_upserts_in_windows(self):
+        """测试每个窗口单独写入 Qdrant，chunk_index 连续"""
+        manager = make_vector_manager(self.knowledge_base)
+        pages = [
+            LangChainDocument(page_content=f'page{p} ' + ' '.join(f'w{p}{i}' for i in range(5)), metadata={})
+            for p in range(3)
+        ]
+
+        with self.settings(KNOWLEDGE_INGEST_WINDOW_SIZE=2):
+            vector_ids = manager.add_documents(pages, self.document)
+
+        upsert_sizes = [len(call.kwargs['points']) for call in manager._qdrant_client.upsert.call_args_list]
+        self.assertTrue(all(size <= 2 for size in upsert_sizes))
+        self.assertEqual(sum(upsert_sizes), len(vector_ids))
+        indexes = list(self.document.chunks.order_by('chunk_index').values_list('chunk_index', flat=True))
+        self.assertEqual(indexes, list(range(len(vector_ids))))
+
+
+class FederatedKnowledgeSearchTest(TestCase):
+    """测试跨知识库联合检索"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.project = Project.objects.create(name='TestProject', creator=self.user)
+        self.knowledge_bases = [
+            KnowledgeBase.objects.create(name=f'KB{i}', project=self.project, creator=self.user)
+            for i in range(3)
+        ]
+
+    def _point(self, score, content):
+        return Mock(score=score, payload={'page_content': content, 'metadata': {}})
+
+    def test_query_embedded_once_and_results_merged(self):
+        """测试查询只向量化一次，所有集合都被检索并按分数全局排序"""
+        manager = make_vector_manager(self.knowledge_bases[0])
+        manager.embeddings.embed_query.return_value = [0.1]
+        manager._get_reranker_url = Mock(return_value=None)
+        scores = {f'kb_{kb.id}': i for i, kb in enumerate(self.knowledge_bases)}
+
+        def search_candidates(collection_name, dense_vector, sparse_query, limit):
+            if scores[collection_name] == 2:
+                raise UnexpectedResponse(status_code=404, reason_phrase='Not Found', content=b'', headers={})
+            score = 0.5 + scores[collection_name] * 0.3
+            return [self._point(score, collection_name)], []
+
+        manager._search_candidates = Mock(side_effect=search_candidates)
+        search_cache.clear_all()
+        federated = FederatedKnowledgeSearch.__new__(FederatedKnowledgeSearch)
+        federated.knowledge_bases = self.knowledge_bases
+        federated.vector_manager = manager
+
+        results = federated.search('login', k=5)
+
+        manager.embeddings.embed_query.assert_called_once_with('login')
+        self.assertEqual(manager._search_candidates.call_count, 3)
+        self.assertEqual([r['content'] for r in results], [f'kb_{self.knowledge_bases[1].id}', f'kb_{self.knowledge_bases[0].id}'])
+
+    def _federated(self, manager):
+        federated = FederatedKnowledgeSearch.__new__(FederatedKnowledgeSearch)
+        federated.knowledge_bases = self.knowledge_bases
+        federated.vector_manager = manager
+        return federated
+
+    def test_sparse_failure_falls_back_to_dense_and_skips_cache(self):
+        """测试稀疏检索失败的知识库降级为纯稠密检索，有知识库失败时不缓存结果"""
+        manager = make_vector_manager(self.knowledge_bases[0])
+        manager.embeddings.embed_query.return_value = [0.1]
+        manager._get_reranker_url = Mock(return_value=None)
+        manager.sparse_encoder = Mock()
+        dense_only = f'kb_{self.knowledge_bases[0].id}'
+        broken = f'kb_{self.knowledge_bases[2].id}'
+
+        def search_candidates(collection_name, dense_vector, sparse_query, limit):
+            if collection_name == broken:
+                raise ConnectionError('qdrant down')
+            if collection_name == dense_only and sparse_query is not None:
+                raise UnexpectedResponse(status_code=400, reason_phrase='Bad Request', content=b'', headers={})
+            return [Mock(id=collection_name, score=0.9, payload={'page_content': collection_name})], []
+
+        manager._search_candidates = Mock(side_effect=search_candidates)
+        search_cache.clear_all()
+
+        with patch.object(search_cache, 'set_cached_results') as set_cached:
+            results = self._federated(manager).search('login', k=5, score_threshold=0.0)
+
+        self.assertIn(dense_only, [r['content'] for r in results])
+        set_cached.assert_not_called()
+
+    def test_raises_when_every_knowledge_base_fails(self):
+        """测试所有知识库都检索失败时抛出异常而不是返回空结果"""
+        manager = make_vector_manager(self.knowledge_bases[0])
+        manager.embeddings.embed_query.return_value = [0.1]
+        manager._get_reranker_url = Mock(return_value=None)
+        manager._search_candidates = Mock(side_effect=ConnectionError('qdrant down'))
+        search_cache.clear_all()
+
+        with self.assertRaises(ConnectionError):
+            self._federated(manager).search('login', k=5)
+
+
+@override_settings(KNOWLEDGE_SEARCH_VERSION_CACHE='default')
+class SearchCacheTest(TestCase):
+    """测试查询向量与检索结果缓存"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.project = Project.objects.create(name='TestProject', creator=self.user)
+        self.knowledge_base = KnowledgeBase.objects.create(name='KB', project=self.project, creator=self.user)
+        search_cache.clear_all()
+        self.manager = make_vector_manager(self.knowledge_base)
+        self.manager.embeddings.embed_query.return_value = [0.1]
+        self.manager._qdrant_client.search.return_value = [
+            Mock(score=0.9, payload={'page_content': 'login', 'source': 'doc'})
+        ]
+
+    def test_repeated_query_hits_cache(self):
+        """测试相同查询复用查询向量与检索结果"""
+        first = self.manager.similarity_search('login', k=3)
+        first[0]['content'] = 'mutated'
+        second = self.manager.similarity_search('login', k=3)
+
+        self.assertEqual(second[0]['content'], 'login')
+        self.manager.embeddings.embed_query.assert_called_once_with('login')
+        self.assertEqual(self.manager._qdrant_client.search.call_count, 1)
+        self.assertGreaterEqual(search_cache.cache_stats()['search_result']['hits'], 1)
+
+    def test_document_change_invalidates_results(self):
+        """测试知识库文档变化后重新检索，但查询向量仍复用"""
+        self.manager.similarity_search('login', k=3)
+        Document.objects.create(knowledge_base=self.knowledge_base, title='Doc', document_type='txt', content='x')
+        self.manager.similarity_search('login', k=3)
+
+        self.assertEqual(self.manager._qdrant_client.search.call_count, 2)
+        self.manager.embeddings.embed_query.assert_called_once_with('login')
+
+    def test_cache_hit_does_not_query_database(self):
+        """测试命中结果缓存时不查询数据库"""
+        self.manager.similarity_search('login', k=3)
+
+        with self.assertNumQueries(0):
+            self.manager.similarity_search('login', k=3)
+        self.assertEqual(self.manager._qdrant_client.search.call_count, 1)
+
+    def test_version_bump_from_other_process_invalidates_results(self):
+        """测试其他进程递增版本号（本进程未收到信号）后重新检索"""
+        self.manager.similarity_search('login', k=3)
+        search_cache.bump_knowledge_base_version(self.knowledge_base.id)
+        self.manager.similarity_search('login', k=3)
+
+        self.assertEqual(self.manager._qdrant_client.search.call_count, 2)
+
+
+class ServiceHealthCheckTest(TestCase):
+    """测试模型服务健康检查"""
+
+    def setUp(self):
+        self.config = KnowledgeGlobalConfig.get_config()
+        self.config.embedding_service = 'custom'
+        self.config.api_base_url = 'http://embed/v1/embeddings'
+        self.config.reranker_service = 'none'
+        self.config.save()
+        VectorStoreManager.clear_global_config_cache()
+        VectorStoreManager._embeddings_cache.clear()
+
+    def test_creating_embeddings_does_not_call_service(self):
+        """测试请求路径创建嵌入客户端时不同步探测远程服务"""
+        manager = VectorStoreManager.__new__(VectorStoreManager)
+        manager.global_config = self.config
+
+        with patch.object(CustomAPIEmbeddings, 'embed_query') as embed_query:
+            embeddings = manager._get_embeddings_instance()
+
+        self.assertIsInstance(embeddings, CustomAPIEmbeddings)
+        embed_query.assert_not_called()
+
+    def test_run_health_checks_records_status(self):
+        """测试健康检查写入嵌入服务状态，未启用的 Reranker 标记为 disabled"""
+        with patch.object(CustomAPIEmbeddings, 'embed_query', return_value=[0.1, 0.2, 0.3]):
+            run_health_checks()
+
+        embedding = ServiceHealthCheck.objects.get(service='embedding')
+        self.assertEqual(embedding.status, 'healthy')
+        self.assertEqual(embedding.dimension, 3)
+        self.assertEqual(ServiceHealthCheck.objects.get(service='reranker').status, 'disabled')
+
+        with patch.object(CustomAPIEmbeddings, 'embed_query', side_effect=ConnectionError('refused')):
+            run_health_checks()
+
+        embedding.refresh_from_db()
+        self.assertEqual(embedding.status, 'unhealthy')
+        self.assertIn('refused', embedding.error_message)
+
+
+class QueryApiSearchTest(TestCase):
+    """测试通过 Qdrant Query API 批量检索的混合检索"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.project = Project.objects.create(name='TestProject', creator=self.user)
+        self.knowledge_base = KnowledgeBase.objects.create(name='KB', project=self.project, creator=self.user)
+        search_cache.clear_all()
+        self.manager = make_vector_manager(self.knowledge_base)
+        self.manager.embeddings.embed_query.return_value = [0.1]
+        self.manager.sparse_encoder = Mock()
+        self.manager.sparse_encoder.encode_query.return_value = Mock(
+            indices=Mock(tolist=Mock(return_value=[1])), values=Mock(tolist=Mock(return_value=[0.5]))
+        )
+        self.manager._get_reranker_url = Mock(return_value=None)
+        patcher = patch.object(VectorStoreManager, '_query_api_supported', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # 稠密：p1, p2；稀疏：p2, p3
+        self.dense_hits = [Mock(id='p1', score=0.9, payload=None), Mock(id='p2', score=0.8, payload=None)]
+        self.sparse_hits = [Mock(id='p2', score=3.0, payload=None), Mock(id='p3', score=2.0, payload=None)]
+        self.payloads = {pid: {'page_content': f'content {pid}'} for pid in ('p1', 'p2', 'p3')}
+        self.manager._qdrant_client.query_batch_points.return_value = [
+            Mock(points=self.dense_hits), Mock(points=self.sparse_hits)
+        ]
+        self.manager._qdrant_client.retrieve.side_effect = lambda collection_name, ids, with_payload: [
+            Mock(id=pid, payload=self.payloads[pid]) for pid in ids
+        ]
+
+    def test_hybrid_search_uses_single_batch_query(self):
+        """测试混合检索通过一次批量查询完成，仅为最终结果读取 payload"""
+        results = self.manager.similarity_search('login', k=2, score_threshold=0.0)
+
+        self.assertEqual(self.manager._qdrant_client.query_batch_points.call_count, 1)
+        self.manager._qdrant_client.search.assert_not_called()
+        self.assertEqual(self.manager._qdrant_client.retrieve.call_args.kwargs['ids'], ['p2', 'p1'])
+        self.assertEqual([r['content'] for r in results], ['content p2', 'content p1'])
+
+    def test_scores_match_local_fusion(self):
+        """测试 Query API 路径与本地融合路径对相同命中给出相同分数"""
+        query_api_results = self.manager.similarity_search('login', k=3, score_threshold=0.0)
+
+        search_cache.clear_all()
+        VectorStoreManager._query_api_supported = False
+        for hit in self.dense_hits + self.sparse_hits:
+            hit.payload = self.payloads[hit.id]
+        self.manager._qdrant_client.search.side_effect = [self.dense_hits, self.sparse_hits]
+        local_results = self.manager.similarity_search('login', k=3, score_threshold=0.0)
+
+        self.assertEqual(
+            [(r['content'], r['similarity_score']) for r in query_api_results],
+            [(r['content'], r['similarity_score']) for r in local_results],
+        )
+        # 只出现在一路结果中的第 1 名得分为 0.5，阈值可以过滤
+        self.assertAlmostEqual(query_api_results[1]['similarity_score'], 0.5, places=6)
+
+    def test_query_api_skipped_without_sparse_query(self):
+        """测试没有稀疏向量时不走 Query API 批量检索"""
+        self.assertIsNone(self.manager._query_api_search('kb', [0.1], None, 10, 3))
+        self.manager._qdrant_client.query_batch_points.assert_not_called()
+
+    def test_bad_request_only_falls_back_for_this_call(self):
+        """测试 400（如纯稠密集合没有稀疏向量）只对本次检索降级，不全局禁用"""
+        self.manager._qdrant_client.query_batch_points.side_effect = UnexpectedResponse(
+            status_code=400, reason_phrase='Bad Request', content=b'', headers={}
+        )
+
+        self.assertIsNone(self.manager._query_api_search('kb', [0.1], Mock(), 10, 3))
+        self.assertIsNone(VectorStoreManager._query_api_supported)
+
+    def test_falls_back_to_local_fusion(self):
+        """测试 Qdrant 不支持 Query API 时降级为本地 RRF"""
+        self.manager._qdrant_client.query_batch_points.side_effect = UnexpectedResponse(
+            status_code=404, reason_phrase='Not Found', content=b'', headers={}
+        )
+        self.manager._qdrant_client.search.return_value = [
+            Mock(id='p1', score=0.9, payload={'page_content': 'login'}),
+        ]
+
+        results = self.manager.similarity_search('login', k=3)
+
+        self.assertEqual(self.manager._qdrant_client.search.call_count, 2)
+        self.assertEqual(results[0]['content'], 'login')
+        self.assertFalse(VectorStoreManager._query_api_supported)
@@ -1,5 +1,4 @@
 import os
-import threading
 import logging
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
@@ -11,6 +10,7 @@ from rest_framework import filters
 from django.db import transaction
 from django.db import models
 from django.utils import timezone
+from wharttest_django.checkpointer import get_checkpointer_pool_stats
 from wharttest_django.viewsets import BaseModelViewSet
 from .models import KnowledgeBase, Document, DocumentChunk, QueryLog, KnowledgeGlobalConfig
 from .serializers import (
@@ -19,6 +19,9 @@ from .serializers import (
     KnowledgeQueryResponseSerializer, KnowledgeGlobalConfigSerializer
 )
 from .services import KnowledgeBaseService, VectorStoreManager
+from .tasks import enqueue_document_processing, health_check_task
+from .health import get_health_status
+from . import search_cache
 import logging
 import time
 from pathlib import Path
@@ -328,6 +331,15 @@ class KnowledgeBaseViewSet(BaseModelViewSet):
             status_info['embedding_model']['status'] = 'api_based'
             status_info['embedding_model']['note'] = '使用CustomAPIEmbeddings通过API调用嵌入模型'
 
+            # 模型服务健康状态（后台定时探测，此处只读取结果）
+            service_health = get_health_status()
+            if not service_health or any(item['stale'] for item in service_health.values()):
+                try:
+                    health_check_task.delay()
+                except Exception as e:
+                    logger.warning(f"提交健康检查任务失败: {e}")
+            status_info['service_health'] = service_health
+
             # 检查知识库统计
             total_kb = KnowledgeBase.objects.count()
             active_kb = KnowledgeBase.objects.filter(is_active=True).count()
@@ -339,6 +351,12 @@ class KnowledgeBaseViewSet(BaseModelViewSet):
             cache_count = len(VectorStoreManager._vector_store_cache)
             status_info['vector_stores']['cache_status'] = f'{cache_count} cached instances'
 
+            # 检索缓存命中率
+            status_info['search_cache'] = search_cache.cache_stats()
+
+            # LangGraph checkpointer 连接池使用情况（psycopg_pool 统计，未创建的连接池为 None）
+            status_info['checkpointer_pools'] = get_checkpointer_pool_stats()
+
             # 确定整体状态
             all_deps = all(status_info['dependencies'].values())
             model_working = status_info['embedding_model']['status'] == 'working'
@@ -400,25 +418,8 @@ class DocumentViewSet(BaseModelViewSet):
         """创建文档时自动设置上传人"""
         document = serializer.save(uploader=self.request.user)
 
-        # 启动后台任务处理文档（避免超时）
-        import threading
-
-        def process_document_async():
-            try:
-                service = KnowledgeBaseService(document.knowledge_base)
-                service.process_document(document)
-                logger.info(f"文档 {document.id} 处理完成")
-            except Exception as e:
-                logger.error(f"文档 {document.id} 处理失败: {e}")
-                # 更新文档状态为失败
-                document.status = 'failed'
-                document.error_message = str(e)
-                document.save()
-
-        # 在后台线程中处理文档
-        thread = threading.Thread(target=process_document_async)
-        thread.daemon = True
-        thread.start()
+        # 投递到 Celery 处理队列（避免占用 Web 进程）
+        enqueue_document_processing(document)
 
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
@@ -427,7 +428,9 @@ class DocumentViewSet(BaseModelViewSet):
         return Response({
             'id': document.id,
             'status': document.status,
-            'progress': getattr(document, 'progress', 0),
+            'processing_stage': document.processing_stage,
+            'progress': document.progress,
+            'task_id': document.task_id,
             'error_message': document.error_message,
             'chunk_count': document.chunks.count(),
             'processed_at': document.processed_at
@@ -435,33 +438,17 @@ class DocumentViewSet(BaseModelViewSet):
 
     @action(detail=True, methods=['post'])
     def reprocess(self, request, pk=None):
-        """重新处理文档"""
+        """
+        重新处理文档
+        默认增量重建（仅处理变化的分块），传入 mode=full 时删除后全量重建
+        """
         document = self.get_object()
+        incremental = request.data.get('mode', 'incremental') != 'full'
 
-        # 重置状态
-        document.status = 'pending'
-        document.error_message = ''
-        document.save()
-
-        # 启动后台处理
-        import threading
-
-        def reprocess_document_async():
-            try:
-                service = KnowledgeBaseService(document.knowledge_base)
-                service.process_document(document)
-                logger.info(f"文档 {document.id} 重新处理完成")
-            except Exception as e:
-                logger.error(f"文档 {document.id} 重新处理失败: {e}")
-                document.status = 'failed'
-                document.error_message = str(e)
-                document.save()
+        # 投递到 Celery 处理队列
+        enqueue_document_processing(document, incremental=incremental)
 
-        thread = threading.Thread(target=reprocess_document_async)
-        thread.daemon = True
-        thread.start()
-
-        return Response({'message': '文档重新处理已启动，请稍后查看状态'})
+        return Response({'message': '文档重新处理已启动，请稍后查看状态', 'task_id': document.task_id})
 
     def _get_document_content(self, document):
         """获取文档的实际内容"""
@@ -590,6 +577,51 @@ class DocumentViewSet(BaseModelViewSet):
 
         return Response(content_data)
 
+    @action(detail=False, methods=['post'], url_path='batch-delete')
+    def batch_delete(self, request):
+        """
+        批量删除文档（同一知识库的文档向量通过一次 Qdrant 调用清理）
+        POST请求体格式: {"ids": ["uuid1", "uuid2"]}
+        """
+        ids_data = request.data.get('ids', [])
+        if not ids_data or not isinstance(ids_data, list):
+            return Response(
+                {'error': '请提供要删除的文档ID列表'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        documents = list(self.get_queryset().filter(id__in=ids_data))
+        found_ids = {str(document.id) for document in documents}
+        not_found_ids = [document_id for document_id in ids_data if str(document_id) not in found_ids]
+        if not_found_ids:
+            return Response(
+                {
+                    'error': f'以下文档ID不存在或无权访问: {not_found_ids}',
+                    'not_found_ids': not_found_ids
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        documents_by_kb = {}
+        for document in documents:
+            documents_by_kb.setdefault(document.knowledge_base_id, []).append(document)
+
+        try:
+            deleted_count = 0
+            for knowledge_base_id, kb_documents in documents_by_kb.items():
+                deleted_count += KnowledgeBaseService.bulk_delete_documents(knowledge_base_id, kb_documents)
+
+            return Response({
+                'message': f'成功删除 {deleted_count} 个文档',
+                'deleted_count': deleted_count,
+            })
+        except Exception as e:
+            logger.error(f"批量删除文档失败: {e}")
+            return Response(
+                {'error': f'批量删除失败: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     def destroy(self, request, *args, **kwargs):
         """删除文档时同时删除向量数据"""
         document = self.get_object()
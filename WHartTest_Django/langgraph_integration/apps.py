@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LanggraphIntegrationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'langgraph_integration'
+
+    def ready(self):
+        # 注册信号处理器
+        import langgraph_integration.signals  # noqa
@@ -0,0 +1,201 @@
+"""
+LLM 客户端注册表
+- 按 LLMConfig(id, updated_at) + 温度 + 额外参数 复用 ChatOpenAI 实例，
+  从而复用其底层 HTTP 客户端与 keep-alive 连接
+- 按服务商（API 地址）限制同时进行中的请求数，避免高并发下触发 429
+- 配置保存/删除时通过信号失效对应实例
+- 临时事件循环（如 Celery 任务中新建的循环）结束前需调用 release_loop_clients 关闭连接
+"""
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from langchain_openai import ChatOpenAI
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# 无事件循环（同步线程）中创建的实例
+_sync_clients: Dict[tuple, ChatOpenAI] = {}
+# 事件循环中创建的实例：httpx 异步连接绑定事件循环，按循环隔离。
+# 连接池中的 keep-alive 连接会引用事件循环，循环不会被自动回收，
+# 必须在循环结束前调用 release_loop_clients 关闭连接并移除
+_loop_clients: Dict[asyncio.AbstractEventLoop, Dict[tuple, ChatOpenAI]] = {}
+
+_thread_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_loop_semaphores: Dict[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]] = {}
+
+
+def _max_concurrency() -> int:
+    return getattr(settings, 'LLM_PROVIDER_MAX_CONCURRENCY', 8)
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+@contextmanager
+def _provider_slot(provider: str):
+    """同步调用占用服务商并发名额（进程内所有线程共享）"""
+    limit = _max_concurrency()
+    if limit <= 0:
+        yield
+        return
+    with _lock:
+        semaphore = _thread_semaphores.get(provider)
+        if semaphore is None:
+            semaphore = _thread_semaphores[provider] = threading.BoundedSemaphore(limit)
+    with semaphore:
+        yield
+
+
+@asynccontextmanager
+async def _async_provider_slot(provider: str):
+    """异步调用占用服务商并发名额（同一事件循环内共享）"""
+    limit = _max_concurrency()
+    if limit <= 0:
+        yield
+        return
+    loop = asyncio.get_running_loop()
+    with _lock:
+        semaphores = _loop_semaphores.setdefault(loop, {})
+        semaphore = semaphores.get(provider)
+        if semaphore is None:
+            semaphore = semaphores[provider] = asyncio.Semaphore(limit)
+    async with semaphore:
+        yield
+
+
+class PooledChatOpenAI(ChatOpenAI):
+    """
+    受服务商并发限制的 ChatOpenAI
+
+    streaming=True 时 _generate/_agenerate 内部转调 _stream/_astream，只在后者占用名额，避免重复占用
+    """
+
+    @property
+    def _provider_key(self) -> str:
+        return self.openai_api_base or 'default'
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        with _provider_slot(self._provider_key):
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        async with _async_provider_slot(self._provider_key):
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        with _provider_slot(self._provider_key):
+            yield from super()._stream(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        async with _async_provider_slot(self._provider_key):
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+
+
+def _client_key(active_config, temperature: float, llm_kwargs: Dict[str, Any]) -> tuple:
+    return (
+        active_config.pk,
+        active_config.updated_at,
+        float(temperature),
+        tuple(sorted(llm_kwargs.items())),
+    )
+
+
+def get_llm_client(active_config, temperature: float = 0.7, **llm_kwargs) -> ChatOpenAI:
+    """
+    获取（或创建）LLMConfig 对应的 ChatOpenAI 实例
+    统一使用OpenAI兼容格式，支持所有兼容的服务商
+
+    在事件循环中调用时返回该循环专用的实例；同步线程中调用时返回进程共享的实例。
+    同步线程中获取的实例不要在 asyncio.run() 等新建的事件循环中异步调用
+    """
+    key = _client_key(active_config, temperature, llm_kwargs)
+    loop = _running_loop()
+
+    with _lock:
+        _drop_closed_loops()
+        clients = _loop_clients.setdefault(loop, {}) if loop is not None else _sync_clients
+        llm = clients.get(key)
+        if llm is not None:
+            return llm
+
+        model_identifier = active_config.name or "gpt-3.5-turbo"
+        llm = PooledChatOpenAI(
+            model=model_identifier,
+            temperature=temperature,
+            api_key=active_config.api_key,
+            base_url=active_config.api_url,
+            **llm_kwargs,
+        )
+        # 同一配置的旧版本实例不会再被命中，直接移除
+        for stale_key in [k for k in clients if k[0] == active_config.pk and k[1] != active_config.updated_at]:
+            del clients[stale_key]
+        clients[key] = llm
+
+    logger.info(f"Initialized OpenAI-compatible LLM with model: {model_identifier}, base_url: {active_config.api_url}")
+    return llm
+
+
+def _drop_closed_loops():
+    """移除已关闭（未调用 release_loop_clients）的事件循环的缓存，调用方需持有 _lock"""
+    for loop in [loop for loop in _loop_clients if loop.is_closed()]:
+        logger.warning("LLM clients of a closed event loop were not released; dropping them")
+        del _loop_clients[loop]
+    for loop in [loop for loop in _loop_semaphores if loop.is_closed()]:
+        del _loop_semaphores[loop]
+
+
+async def _aclose_clients(clients):
+    for llm in clients:
+        client = getattr(llm, 'root_async_client', None)
+        if client is None:
+            continue
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"Failed to close LLM client: {e}")
+
+
+def release_loop_clients(loop: asyncio.AbstractEventLoop) -> int:
+    """
+    关闭并移除指定事件循环中创建的实例，返回移除数量
+
+    在 loop.close() 之前、循环未运行时调用（如 Celery 任务中新建的事件循环）
+    """
+    with _lock:
+        clients = list(_loop_clients.pop(loop, {}).values())
+        _loop_semaphores.pop(loop, None)
+    if clients and not loop.is_closed():
+        loop.run_until_complete(_aclose_clients(clients))
+    return len(clients)
+
+
+def invalidate_llm_config(config_id) -> int:
+    """移除指定 LLMConfig 的所有缓存实例，返回移除数量"""
+    removed = 0
+    with _lock:
+        for clients in [_sync_clients, *_loop_clients.values()]:
+            for key in [k for k in clients if k[0] == config_id]:
+                del clients[key]
+                removed += 1
+    return removed
+
+
+def clear_llm_clients():
+    """清空所有缓存实例"""
+    with _lock:
+        _sync_clients.clear()
+        _loop_clients.clear()
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from langgraph_integration.tasks import reconcile_chat_sessions
+
+
+class Command(BaseCommand):
+    help = 'Registers ChatSession records for sessions that exist only in LangGraph checkpoints.'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Reconciling chat sessions from checkpoints...')
+        created = reconcile_chat_sessions()
+        self.stdout.write(self.style.SUCCESS(f'Registered {created} missing chat session(s).'))
@@ -87,6 +87,17 @@ class ChatSession(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.title}"
 
+    @classmethod
+    def register(cls, user, session_id, project=None, title="新对话", prompt=None):
+        """
+        确保会话记录存在（写入对话历史前调用）
+        ChatSession 是会话列表的唯一数据来源，遗漏的记录由 reconcile_chat_sessions 定时补齐
+        """
+        return cls.objects.get_or_create(
+            session_id=session_id,
+            defaults={'user': user, 'project': project, 'title': title, 'prompt': prompt},
+        )
+
 
 class ChatMessage(models.Model):
     """
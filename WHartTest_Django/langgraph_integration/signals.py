@@ -0,0 +1,15 @@
+"""
+LLM 配置信号处理器
+配置更新或删除后失效进程内缓存的 LLM 客户端
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .llm_clients import invalidate_llm_config
+from .models import LLMConfig
+
+
+@receiver(post_save, sender=LLMConfig)
+@receiver(post_delete, sender=LLMConfig)
+def invalidate_llm_clients(sender, instance, **kwargs):
+    invalidate_llm_config(instance.pk)
@@ -0,0 +1,60 @@
+"""
+对话会话相关异步任务
+"""
+import logging
+from celery import shared_task
+from django.contrib.auth import get_user_model
+
+from projects.models import Project
+from wharttest_django.checkpointer import check_history_exists, get_thread_ids_by_prefix
+from .models import ChatSession
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='langgraph_integration.reconcile_chat_sessions', ignore_result=True)
+def reconcile_chat_sessions():
+    """
+    补齐 checkpoints 中存在但未登记 ChatSession 的会话
+    会话列表只查询 ChatSession，对 checkpoints 的全量扫描仅在此定时任务中进行
+
+    Returns:
+        新登记的会话数量
+    """
+    if not check_history_exists():
+        return 0
+
+    known_session_ids = set(ChatSession.objects.values_list('session_id', flat=True))
+    missing = {}
+    for thread_id in get_thread_ids_by_prefix(''):
+        # thread_id 格式: {user_id}_{project_id}_{session_id}
+        parts = thread_id.split('_', 2)
+        if len(parts) != 3 or not parts[0].isdigit() or not parts[1].isdigit() or not parts[2]:
+            continue
+        user_id, project_id, session_id = int(parts[0]), int(parts[1]), parts[2]
+        if session_id not in known_session_ids:
+            missing[session_id] = (user_id, project_id)
+
+    if not missing:
+        return 0
+
+    user_ids = set(get_user_model().objects.filter(
+        id__in={user_id for user_id, _ in missing.values()}
+    ).values_list('id', flat=True))
+    project_ids = set(Project.objects.filter(
+        id__in={project_id for _, project_id in missing.values()}
+    ).values_list('id', flat=True))
+
+    sessions = [
+        ChatSession(
+            user_id=user_id,
+            project_id=project_id,
+            session_id=session_id,
+            title=f'会话 {session_id[:8]}...',
+        )
+        for session_id, (user_id, project_id) in missing.items()
+        if user_id in user_ids and project_id in project_ids
+    ]
+    ChatSession.objects.bulk_create(sessions, ignore_conflicts=True)
+    logger.info(f"Reconciled {len(sessions)} chat sessions from checkpoints")
+    return len(sessions)
@@ -1,3 +1,334 @@
+import asyncio
+import os
+from io import StringIO
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from projects.models import Project
+from wharttest_django import checkpointer
+from wharttest_django.sse import FLUSH_TICK, SSETokenCoalescer, encode_sse, iter_with_flush_ticks
+from . import llm_clients
+from .models import ChatSession, LLMConfig
+from .tasks import reconcile_chat_sessions
+
+
+class PooledCheckpointerTest(TestCase):
+    """测试 PostgreSQL 模式下 Checkpointer 复用进程级连接池"""
+
+    def setUp(self):
+        patchers = [
+            patch.dict(os.environ, {'DATABASE_TYPE': 'postgres'}),
+            patch.object(checkpointer, '_async_pool_state', None),
+            patch.object(checkpointer, '_setup_done', False),
+            patch('psycopg_pool.AsyncConnectionPool', side_effect=self._make_pool),
+            patch('langgraph.checkpoint.postgres.aio.AsyncPostgresSaver', side_effect=self._make_saver),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.pools = []
+        self.savers = []
+
+    def _make_pool(self, **kwargs):
+        pool = MagicMock()
+        # 打开连接池时让出事件循环，使并发协程有机会交错执行
+        pool.open = AsyncMock(side_effect=self._yield_to_loop)
+        pool.close = AsyncMock()
+        self.pools.append(pool)
+        return pool
+
+    @staticmethod
+    async def _yield_to_loop():
+        await asyncio.sleep(0)
+
+    def _make_saver(self, conn):
+        saver = MagicMock()
+        saver.setup = AsyncMock()
+        self.savers.append(saver)
+        return saver
+
+    def test_async_checkpointer_reuses_pool_and_runs_setup_once(self):
+        """测试同一事件循环内多次获取只创建一个连接池，setup 只执行一次"""
+        async def use_twice():
+            async with checkpointer.get_async_checkpointer() as first:
+                pass
+            async with checkpointer.get_async_checkpointer() as second:
+                pass
+            return first, second
+
+        first, second = asyncio.run(use_twice())
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.pools), 1)
+        self.pools[0].open.assert_awaited_once()
+        self.savers[0].setup.assert_awaited_once()
+
+    def test_new_loop_takes_over_pool_after_owner_closed(self):
+        """测试原事件循环关闭后，新的事件循环重新创建连接池"""
+        async def use_once():
+            async with checkpointer.get_async_checkpointer() as saver:
+                return saver
+
+        first = asyncio.run(use_once())
+        second = asyncio.run(use_once())
+
+        self.assertIsNot(first, second)
+        self.assertEqual(len(self.pools), 2)
+        second.setup.assert_not_awaited()
+
+    def test_release_loop_checkpointer_closes_pool(self):
+        """测试关闭事件循环前释放其持有的连接池"""
+        async def use_once():
+            async with checkpointer.get_async_checkpointer() as saver:
+                return saver
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(use_once())
+            self.assertTrue(checkpointer.release_loop_checkpointer(loop))
+            self.assertFalse(checkpointer.release_loop_checkpointer(loop))
+        finally:
+            loop.close()
+
+        self.pools[0].close.assert_awaited_once()
+        self.assertIsNone(checkpointer._async_pool_state)
+
+    def test_pool_stats_report_async_pool(self):
+        """测试连接池统计包含当前异步连接池（在知识库 system_status 接口中展示）"""
+        self.assertIsNone(checkpointer.get_checkpointer_pool_stats()['async'])
+
+        async def use_once():
+            async with checkpointer.get_async_checkpointer():
+                pass
+
+        asyncio.run(use_once())
+        self.pools[0].get_stats.return_value = {'pool_size': 1}
+
+        self.assertEqual(checkpointer.get_checkpointer_pool_stats()['async'], {'pool_size': 1})
+
+    def test_concurrent_coroutines_share_one_pool(self):
+        """测试同一事件循环内并发获取只创建一个连接池"""
+        async def use_once():
+            async with checkpointer.get_async_checkpointer() as saver:
+                return saver
+
+        async def use_concurrently():
+            return await asyncio.gather(*(use_once() for _ in range(5)))
+
+        savers = asyncio.run(use_concurrently())
+
+        self.assertEqual(len(self.pools), 1)
+        self.assertTrue(all(saver is savers[0] for saver in savers))
+
+
+class CheckpointMaintenanceTest(TestCase):
+    """测试 checkpoint 维护函数复用连接池"""
+
+    def setUp(self):
+        self.conn = MagicMock()
+        self.conn.execute.return_value.rowcount = 2
+        self.conn.execute.return_value.fetchone.return_value = {'table_exists': True}
+        pool = MagicMock()
+        pool.connection.return_value.__enter__.return_value = self.conn
+        patchers = [
+            patch.dict(os.environ, {'DATABASE_TYPE': 'postgres'}),
+            patch.object(checkpointer, '_checkpoints_table_exists', False),
+            patch.object(checkpointer, '_get_sync_pool', return_value=pool),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_delete_removes_blobs_and_writes_in_one_transaction(self):
+        """测试删除会话时在同一事务中清理 writes/blobs/checkpoints"""
+        deleted = checkpointer.delete_checkpoints_batch(['t1', 't2'])
+
+        self.assertEqual(deleted, 2)
+        self.conn.transaction.assert_called_once()
+        statements = [call.args[0] for call in self.conn.execute.call_args_list]
+        self.assertTrue(statements[1].startswith('DELETE FROM checkpoint_writes'))
+        self.assertTrue(statements[2].startswith('DELETE FROM checkpoint_blobs'))
+        self.assertTrue(statements[3].startswith('DELETE FROM checkpoints'))
+
+    def test_table_exists_flag_is_cached(self):
+        """测试确认表存在后不再查询数据库"""
+        self.assertTrue(checkpointer.check_history_exists())
+        self.assertTrue(checkpointer.check_history_exists())
+
+        self.assertEqual(self.conn.execute.call_count, 1)
+
+
+class ChatSessionReconcileTest(TestCase):
+    """测试 checkpoints 中未登记会话的定时补齐"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.project = Project.objects.create(name='TestProject', creator=self.user)
+        ChatSession.register(self.user, 'known', project=self.project)
+
+    def test_reconcile_registers_missing_sessions(self):
+        """测试只为合法的 {user}_{project}_{session} 线程补登记会话"""
+        thread_ids = [
+            f'{self.user.id}_{self.project.id}_known',
+            f'{self.user.id}_{self.project.id}_orphan',
+            f'{self.user.id}_{self.project.id}',
+            f'{self.user.id}_99999_ghost',
+        ]
+        with patch('langgraph_integration.tasks.check_history_exists', return_value=True), \
+                patch('langgraph_integration.tasks.get_thread_ids_by_prefix', return_value=thread_ids):
+            created = reconcile_chat_sessions()
+
+        self.assertEqual(created, 1)
+        orphan = ChatSession.objects.get(session_id='orphan')
+        self.assertEqual((orphan.user_id, orphan.project_id), (self.user.id, self.project.id))
+        self.assertEqual(ChatSession.objects.count(), 2)
+
+    def test_management_command_runs_reconciler(self):
+        """测试部署时执行的管理命令调用补齐逻辑"""
+        out = StringIO()
+        with patch('langgraph_integration.management.commands.reconcile_chat_sessions.reconcile_chat_sessions',
+                   return_value=3) as reconcile:
+            call_command('reconcile_chat_sessions', stdout=out)
+
+        reconcile.assert_called_once_with()
+        self.assertIn('3', out.getvalue())
+
+
+class MessageTimestampsTest(TestCase):
+    """测试只读取 blob 头部计算消息时间戳"""
+
+    def test_msgpack_array_length(self):
+        """测试从 msgpack 头部读取列表长度"""
+        self.assertEqual(checkpointer._msgpack_array_length('msgpack', b'\x93\x01'), 3)
+        self.assertEqual(checkpointer._msgpack_array_length('msgpack', b'\xdc\x01\x00'), 256)
+        self.assertEqual(checkpointer._msgpack_array_length('empty', None), 0)
+        self.assertIsNone(checkpointer._msgpack_array_length('json', b'[1]'))
+
+    def test_postgres_timestamps_from_blob_headers(self):
+        """测试按 checkpoint 顺序为新增消息分配首次出现的时间戳"""
+        conn = MagicMock()
+        conn.execute.return_value.fetchall.side_effect = [
+            [
+                {'ts': 't1', 'version': 'v1'},
+                {'ts': 't2', 'version': 'v1'},
+                {'ts': 't3', 'version': 'v2'},
+            ],
+            [
+                {'version': 'v1', 'type': 'msgpack', 'head': b'\x92'},
+                {'version': 'v2', 'type': 'msgpack', 'head': b'\x94'},
+            ],
+        ]
+        with patch.dict(os.environ, {'DATABASE_TYPE': 'postgres'}), \
+                patch.object(checkpointer, '_postgres_connection') as connection, \
+                patch.object(checkpointer, '_postgres_checkpoints_table_exists', return_value=True):
+            connection.return_value.__enter__.return_value = conn
+            timestamps = checkpointer.get_message_timestamps('1_1_s')
+
+        self.assertEqual(timestamps, {0: 't1', 1: 't1', 2: 't3', 3: 't3'})
+
+
+class SSETokenCoalescerTest(TestCase):
+    """测试 SSE 令牌按时间/字节窗口合并"""
+
+    def test_flushes_on_size_and_time_window(self):
+        """测试达到字节阈值或时间窗口后合并输出一帧"""
+        now = [0.0]
+        coalescer = SSETokenCoalescer('message', flush_interval=0.03, flush_bytes=6, clock=lambda: now[0])
+
+        self.assertIsNone(coalescer.add('你'))
+        self.assertEqual(coalescer.add('好'), encode_sse({'type': 'message', 'data': '你好'}))
+        self.assertIsNone(coalescer.add('a'))
+        now[0] = 0.05
+        self.assertEqual(coalescer.add('b'), 'data: {"type":"message","data":"ab"}\n\n')
+        self.assertIsNone(coalescer.flush())
+
+    def test_flush_tick_when_source_stalls(self):
+        """测试上游暂停时按窗口发送缓冲内容，且不取消上游迭代"""
+        async def source():
+            yield 'a'
+            await asyncio.sleep(0.2)
+            yield 'b'
+
+        async def collect():
+            coalescer = SSETokenCoalescer('message', flush_interval=0.01, flush_bytes=256)
+            events = []
+            async for item in iter_with_flush_ticks(source(), coalescer):
+                if item is FLUSH_TICK:
+                    events.append(coalescer.flush())
+                else:
+                    coalescer.add(item)
+                    events.append(item)
+            events.append(coalescer.flush())
+            return events
+
+        self.assertEqual(asyncio.run(collect()), [
+            'a',
+            encode_sse({'type': 'message', 'data': 'a'}),
+            'b',
+            encode_sse({'type': 'message', 'data': 'b'}),
+        ])
+
+
+class LLMClientRegistryTest(TestCase):
+    """测试 LLM 客户端按配置复用与服务商并发限制"""
+
+    def setUp(self):
+        llm_clients.clear_llm_clients()
+        self.addCleanup(llm_clients.clear_llm_clients)
+        self.config = LLMConfig.objects.create(
+            config_name='test', name='gpt-4o', api_url='http://llm.local/v1', api_key='sk-test'
+        )
+
+    def test_reuses_client_until_config_saved(self):
+        """测试同一配置与温度复用实例，配置保存后重新创建"""
+        first = llm_clients.get_llm_client(self.config, temperature=0.7)
+
+        self.assertIs(llm_clients.get_llm_client(self.config, temperature=0.7), first)
+        self.assertIsNot(llm_clients.get_llm_client(self.config, temperature=0.1), first)
+
+        self.config.name = 'gpt-4o-mini'
+        self.config.save()
+
+        second = llm_clients.get_llm_client(self.config, temperature=0.7)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.model_name, 'gpt-4o-mini')
+
+    def test_async_requests_limited_per_provider(self):
+        """测试同一服务商同时进行中的异步请求不超过上限"""
+        in_flight = []
+        peak = []
+
+        async def fake_agenerate(*args, **kwargs):
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+
+        async def run():
+            llm = llm_clients.get_llm_client(self.config)
+            await asyncio.gather(*(llm._agenerate([]) for _ in range(5)))
+
+        with self.settings(LLM_PROVIDER_MAX_CONCURRENCY=2), \
+                patch('langchain_openai.chat_models.base.BaseChatOpenAI._agenerate', side_effect=fake_agenerate):
+            asyncio.run(run())
+
+        self.assertEqual(len(peak), 5)
+        self.assertEqual(max(peak), 2)
+
+    def test_release_loop_clients_closes_connections(self):
+        """测试释放事件循环时关闭该循环中创建的客户端并移除缓存"""
+        async def create():
+            return llm_clients.get_llm_client(self.config)
+
+        loop = asyncio.new_event_loop()
+        try:
+            llm = loop.run_until_complete(create())
+            with patch.object(llm.root_async_client, 'close', new=AsyncMock()) as close:
+                self.assertEqual(llm_clients.release_loop_clients(loop), 1)
+            close.assert_awaited_once()
+            self.assertNotIn(loop, llm_clients._loop_clients)
+        finally:
+            loop.close()
@@ -28,8 +28,8 @@ from orchestrator_integration.context_compression import ConversationCompressor,
 
 # --- New Imports ---
 from typing import TypedDict, Annotated, List, Optional
-from langchain_core.messages import AnyMessage, HumanMessage, AIMessage, ToolMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import AnyMessage, HumanMessage, AIMessage, AIMessageChunk, ToolMessage, SystemMessage
+from .llm_clients import get_llm_client
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages # Correct import for add_messages
 from langgraph.prebuilt import create_react_agent # For agent with tools
@@ -44,10 +44,10 @@ from knowledge.models import KnowledgeBase
 from django.conf import settings
 import logging # Import logging
 from asgiref.sync import sync_to_async # For async operations in sync context
+# SSE 编码与令牌合并
+from wharttest_django.sse import SSETokenCoalescer, FLUSH_TICK, encode_sse, iter_with_flush_ticks
 # 统一的 Checkpointer 工厂
-from wharttest_django.checkpointer import get_async_checkpointer, get_sync_checkpointer, delete_checkpoints_by_thread_id, delete_checkpoints_batch, check_history_exists, get_thread_ids_by_prefix, rollback_checkpoints_to_count
-import json # For JSON serialization in streaming
-import asyncio # For async operations
+from wharttest_django.checkpointer import get_async_checkpointer, get_sync_checkpointer, delete_checkpoints_by_thread_id, delete_checkpoints_batch, check_history_exists, rollback_checkpoints_to_count, get_message_timestamps
 
 # Django streaming response
 from django.http import StreamingHttpResponse
@@ -64,28 +64,16 @@ logger = logging.getLogger(__name__) # Initialize logger
 # --- Helper Functions ---
 def create_llm_instance(active_config, temperature=0.7):
     """
-    根据配置创建LLM实例
+    根据配置获取LLM实例（进程内按配置复用，共享 HTTP 连接）
     统一使用OpenAI兼容格式，支持所有兼容的服务商
     """
-    model_identifier = active_config.name or "gpt-3.5-turbo"
-    
-    llm_kwargs = {
-        "model": model_identifier,
-        "temperature": temperature,
-        "api_key": active_config.api_key,
-        "base_url": active_config.api_url
-    }
-    llm = ChatOpenAI(**llm_kwargs)
-    logger.info(f"Initialized OpenAI-compatible LLM with model: {model_identifier}, base_url: {active_config.api_url}")
-    
-    return llm
+    return get_llm_client(active_config, temperature=temperature)
 
 def create_sse_data(data_dict):
     """
     创建SSE格式的数据，确保中文字符正确编码
     """
-    json_str = json.dumps(data_dict, ensure_ascii=False)
-    return f"data: {json_str}\n\n"
+    return encode_sse(data_dict)
 
 _REQ_DOC_ID_RE = re.compile(r'需求文档ID[:：]\s*([0-9a-fA-F-]{36})')
 _REQ_DOC_IMAGE_URL_RE = re.compile(
@@ -657,8 +645,8 @@ class ChatAPIView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # 如果是新会话，立即创建ChatSession对象
-            if is_new_session:
+            # 如果是新会话（包括客户端指定但尚未登记的 session_id），立即创建ChatSession对象
+            if is_new_session or not await sync_to_async(ChatSession.objects.filter(session_id=session_id).exists)():
                 try:
                     # 获取关联的提示词对象
                     prompt_obj = None
@@ -672,7 +660,7 @@ class ChatAPIView(APIView):
                         except UserPrompt.DoesNotExist:
                             logger.warning(f"ChatAPIView: Prompt {prompt_id} not found or inactive")
                     
-                    await sync_to_async(ChatSession.objects.create)(
+                    await sync_to_async(ChatSession.register)(
                         user=request.user,
                         session_id=session_id,
                         project=project,
@@ -1093,6 +1081,21 @@ class ChatHistoryAPIView(APIView):
                 "errors": {"session_id": ["This field is required."]}
             }, status=status.HTTP_400_BAD_REQUEST)
 
+        # 分页参数（可选）：before 为消息下标（不含），limit 为返回的消息条数，均不传时返回全部历史
+        try:
+            before = request.query_params.get('before')
+            before = int(before) if before not in (None, '') else None
+            limit = request.query_params.get('limit')
+            limit = int(limit) if limit not in (None, '') else None
+            if (before is not None and before < 0) or (limit is not None and limit <= 0):
+                raise ValueError
+        except ValueError:
+            return Response({
+                "status": "error", "code": status.HTTP_400_BAD_REQUEST,
+                "message": "before must be a non-negative integer and limit a positive integer.", "data": {},
+                "errors": {"pagination": ["Invalid before/limit."]}
+            }, status=status.HTTP_400_BAD_REQUEST)
+
         if not project_id:
             return Response({
                 "status": "error", "code": status.HTTP_400_BAD_REQUEST,
@@ -1128,46 +1131,18 @@ class ChatHistoryAPIView(APIView):
         thread_id = "_".join(thread_id_parts)
 
         history_messages = []
+        thread_messages = []  # 线程内全部消息，用于计算上下文Token（不受分页影响）
+        total_messages = 0
+        has_more = False
 
         try:
             # 使用统一的 Checkpointer 读取数据
-            from wharttest_django.checkpointer import get_database_type, get_db_connection_string
-            db_type = get_database_type()
-            conn_str = get_db_connection_string()
-            logger.warning(f"ChatHistoryAPIView: DEBUG - database_type={db_type}, connection={conn_str}")
-            
             with get_sync_checkpointer() as memory:
-                logger.warning(f"ChatHistoryAPIView: DEBUG - Checkpointer type={type(memory).__name__}")
-                checkpoint_generator = memory.list(config={"configurable": {"thread_id": thread_id}})
-                checkpoint_tuples_list = list(checkpoint_generator)
-
-                logger.info(f"ChatHistoryAPIView: Found {len(checkpoint_tuples_list)} checkpoints for thread_id: {thread_id}")
-
-                if checkpoint_tuples_list: # Check if the list is not empty
-                    # 构建消息到时间戳的映射
-                    # 遍历所有checkpoints，为每条新消息分配对应checkpoint的时间戳
-                    message_timestamps = {}
-                    processed_message_count = 0
-
-                    # 按时间顺序处理checkpoints（从旧到新）
-                    for checkpoint_tuple in reversed(checkpoint_tuples_list):
-                        if checkpoint_tuple and hasattr(checkpoint_tuple, 'checkpoint'):
-                            checkpoint_data = checkpoint_tuple.checkpoint
-                            if checkpoint_data and 'channel_values' in checkpoint_data and 'messages' in checkpoint_data['channel_values']:
-                                messages = checkpoint_data['channel_values']['messages']
-                                current_message_count = len(messages)
-
-                                # 如果这个checkpoint有新消息，为新消息分配时间戳
-                                if current_message_count > processed_message_count:
-                                    checkpoint_timestamp = checkpoint_data.get('ts')
-                                    if checkpoint_timestamp:
-                                        # 为新增的消息分配时间戳
-                                        for i in range(processed_message_count, current_message_count):
-                                            message_timestamps[i] = checkpoint_timestamp
-                                    processed_message_count = current_message_count
-
-                    # 获取最新checkpoint的消息列表
-                    latest_checkpoint_tuple = checkpoint_tuples_list[0]
+                # 只反序列化最新 checkpoint；消息时间戳由 checkpoint 元数据计算，无需加载每个历史版本
+                latest_checkpoint_tuple = memory.get_tuple({"configurable": {"thread_id": thread_id}})
+
+                if latest_checkpoint_tuple:
+                    message_timestamps = get_message_timestamps(thread_id)
                     logger.info(f"ChatHistoryAPIView: latest_checkpoint_tuple type={type(latest_checkpoint_tuple).__name__}")
                     if latest_checkpoint_tuple and hasattr(latest_checkpoint_tuple, 'checkpoint'):
                         checkpoint_data = latest_checkpoint_tuple.checkpoint
@@ -1178,9 +1153,16 @@ class ChatHistoryAPIView(APIView):
 
                         if checkpoint_data and 'channel_values' in checkpoint_data and 'messages' in checkpoint_data['channel_values']:
                             messages = checkpoint_data['channel_values']['messages']
-                            logger.info(f"ChatHistoryAPIView: Found {len(messages)} messages in latest checkpoint")
+                            thread_messages = messages
+                            total_messages = len(messages)
+                            logger.info(f"ChatHistoryAPIView: Found {total_messages} messages in latest checkpoint")
+
+                            # 分页：返回下标小于 before 的最近 limit 条消息
+                            page_end = min(before, total_messages) if before is not None else total_messages
+                            page_start = max(0, page_end - limit) if limit else 0
+                            has_more = page_start > 0
 
-                            for i, msg in enumerate(messages):
+                            for i, msg in enumerate(messages[page_start:page_end], start=page_start):
                                 msg_type = "unknown"
                                 content = ""
 
@@ -1290,6 +1272,7 @@ class ChatHistoryAPIView(APIView):
                                     message_data = {
                                         "type": msg_type,
                                         "content": content,
+                                        "index": i,
                                     }
                                     # 如果消息包含图片，添加图片数据
                                     if msg_type == "human" and image_data:
@@ -1344,9 +1327,8 @@ class ChatHistoryAPIView(APIView):
                         logger.warning(f"ChatHistoryAPIView: Invalid checkpoint tuple structure")
                 else:
                     logger.info(f"ChatHistoryAPIView: No checkpoints found for thread_id: {thread_id}")
-            # By processing only the latest checkpoint, we get the final state of messages, avoiding duplicates.
 
-            # 计算上下文Token使用信息
+            # 计算上下文Token使用信息（加载更早的分页时前端已有该信息，跳过计算）
             context_token_count = 0
             context_limit = 128000
             try:
@@ -1354,9 +1336,15 @@ class ChatHistoryAPIView(APIView):
                 active_config = LLMConfig.objects.get(is_active=True)
                 context_limit = active_config.context_limit or 128000
                 
-                for msg_data in history_messages:
-                    content = msg_data.get('content', '')
-                    if content:
+                # 按整个线程计算，而不是当前返回的分页
+                for msg in (thread_messages if before is None else []):
+                    content = getattr(msg, 'content', '')
+                    if isinstance(content, list):
+                        content = "".join(
+                            item.get("text", "") for item in content
+                            if isinstance(item, dict) and item.get("type") == "text"
+                        )
+                    if content and (not isinstance(content, str) or content.strip()):
                         content_str = content if isinstance(content, str) else str(content)
                         context_token_count += context_checker.count_tokens(content_str, active_config.name or "gpt-4o")
             except Exception as e:
@@ -1373,6 +1361,8 @@ class ChatHistoryAPIView(APIView):
                     "prompt_id": prompt_id,
                     "prompt_name": prompt_name,
                     "history": history_messages,
+                    "total_messages": total_messages,
+                    "has_more": has_more,
                     "context_token_count": context_token_count,
                     "context_limit": context_limit
                 }
@@ -1701,10 +1691,8 @@ class UserChatSessionsAPIView(APIView):
         ).order_by('-updated_at').values('session_id', 'title', 'updated_at', 'created_at')
         
         sessions_list = []
-        django_session_ids = set()
         
         for s in django_sessions:
-            django_session_ids.add(s['session_id'])
             sessions_list.append({
                 'id': s['session_id'],
                 'title': s['title'] or '新对话',
@@ -1712,25 +1700,7 @@ class UserChatSessionsAPIView(APIView):
                 'created_at': s['created_at'].isoformat() if s['created_at'] else None,
             })
         
-        # 回退：检查checkpoints中是否有Django模型没记录的会话
-        if check_history_exists():
-            try:
-                thread_id_prefix = f"{user_id}_{project_id}_"
-                thread_ids = get_thread_ids_by_prefix(thread_id_prefix)
-                
-                for full_thread_id in thread_ids:
-                    if full_thread_id.startswith(thread_id_prefix):
-                        session_id_part = full_thread_id[len(thread_id_prefix):]
-                        if session_id_part and session_id_part not in django_session_ids:
-                            # checkpoints有但Django没有的会话，添加到列表
-                            sessions_list.append({
-                                'id': session_id_part,
-                                'title': f'会话 {session_id_part[:8]}...',
-                                'updated_at': None,
-                                'created_at': None,
-                            })
-            except Exception as e:
-                logger.warning(f"UserChatSessionsAPIView: Failed to check checkpoints for additional sessions: {e}")
+        # checkpoints 中遗漏登记的会话由 reconcile_chat_sessions 定时任务补齐，此处不再扫描 checkpoints
 
         return Response({
             "status": "success", "code": status.HTTP_200_OK,
@@ -1800,16 +1770,16 @@ class ChatStreamAPIView(View):
             active_config = await sync_to_async(LLMConfig.objects.get)(is_active=True)
             logger.info(f"ChatStreamAPIView: Using active LLMConfig: {active_config.name}")
         except LLMConfig.DoesNotExist:
-            yield f"data: {json.dumps({'type': 'error', 'message': 'No active LLM configuration found'})}\n\n"
+            yield create_sse_data({'type': 'error', 'message': 'No active LLM configuration found'})
             return
         except LLMConfig.MultipleObjectsReturned:
-            yield f"data: {json.dumps({'type': 'error', 'message': 'Multiple active LLM configurations found'})}\n\n"
+            yield create_sse_data({'type': 'error', 'message': 'Multiple active LLM configurations found'})
             return
 
         # 验证图片输入是否支持
         if image_base64 and not active_config.supports_vision:
             logger.warning(f"ChatStreamAPIView: Image input rejected - model {active_config.name} does not support vision")
-            yield f"data: {json.dumps({'type': 'error', 'message': f'当前模型 {active_config.name} 不支持图片输入，请切换到支持多模态的模型（如 GPT-4V、Claude 3、Gemini Vision 或 Qwen-VL）'})}\n\n"
+            yield create_sse_data({'type': 'error', 'message': f'当前模型 {active_config.name} 不支持图片输入，请切换到支持多模态的模型（如 GPT-4V、Claude 3、Gemini Vision 或 Qwen-VL）'})
             return
 
         try:
@@ -1852,7 +1822,7 @@ class ChatStreamAPIView(View):
                         logger.info("ChatStreamAPIView: No active RemoteMCPConfig found.")
                 except Exception as e:
                     logger.error(f"ChatStreamAPIView: Error loading remote MCP tools: {e}", exc_info=True)
-                    yield f"data: {json.dumps({'type': 'warning', 'message': f'Failed to load MCP tools: {str(e)}'})}\n\n"
+                    yield create_sse_data({'type': 'warning', 'message': f'Failed to load MCP tools: {str(e)}'})
 
                 # 准备LangGraph runnable
                 runnable_to_invoke = None
@@ -2199,12 +2169,33 @@ class ChatStreamAPIView(View):
                 # 使用astream进行流式处理，支持多种模式
                 stream_modes = ["updates", "messages"]
 
+                # LLM 令牌按时间/字节窗口合并后输出
+                token_coalescer = SSETokenCoalescer('message')
+
                 try:
-                    async for stream_mode, chunk in runnable_to_invoke.astream(
-                        input_messages,
-                        config=invoke_config,
-                        stream_mode=stream_modes
+                    async for item in iter_with_flush_ticks(
+                        runnable_to_invoke.astream(input_messages, config=invoke_config, stream_mode=stream_modes),
+                        token_coalescer
                     ):
+                        if item is FLUSH_TICK:
+                            yield token_coalescer.flush()
+                            continue
+
+                        stream_mode, chunk = item
+                        message_chunk = chunk[0] if isinstance(chunk, tuple) and chunk else chunk
+                        if stream_mode == "messages" and isinstance(message_chunk, AIMessageChunk) \
+                                and isinstance(message_chunk.content, str):
+                            # AI 文本令牌：空内容（工具调用片段）前端不展示，直接跳过
+                            frame = token_coalescer.add(message_chunk.content)
+                            if frame:
+                                yield frame
+                            continue
+
+                        # 输出其他事件前先发送已缓冲的令牌，保证顺序
+                        frame = token_coalescer.flush()
+                        if frame:
+                            yield frame
+
                         if stream_mode == "updates":
                             # 代理进度更新 - 安全地序列化复杂对象
                             try:
@@ -2223,11 +2214,15 @@ class ChatStreamAPIView(View):
                             else:
                                 yield create_sse_data({'type': 'message', 'data': str(chunk)})
 
-                        # 添加小延迟以确保流式传输效果
-                        await asyncio.sleep(0.01)
+                    frame = token_coalescer.flush()
+                    if frame:
+                        yield frame
 
                 except Exception as e:
                     logger.error(f"ChatStreamAPIView: Error during streaming: {e}", exc_info=True)
+                    frame = token_coalescer.flush()
+                    if frame:
+                        yield frame
                     yield create_sse_data({'type': 'error', 'message': f'Streaming error: {str(e)}'})
 
                 # 计算并发送上下文Token使用信息
@@ -2347,8 +2342,8 @@ class ChatStreamAPIView(View):
             is_new_session = True
             logger.info(f"ChatStreamAPIView: Generated new session_id: {session_id}")
 
-        # 如果是新会话，立即创建ChatSession对象
-        if is_new_session:
+        # 如果是新会话（包括客户端指定但尚未登记的 session_id），立即创建ChatSession对象
+        if is_new_session or not await sync_to_async(ChatSession.objects.filter(session_id=session_id).exists)():
             try:
                 # 获取关联的提示词对象
                 prompt_obj = None
@@ -2362,7 +2357,7 @@ class ChatStreamAPIView(View):
                     except UserPrompt.DoesNotExist:
                         logger.warning(f"ChatStreamAPIView: Prompt {prompt_id} not found or inactive")
                 
-                await sync_to_async(ChatSession.objects.create)(
+                await sync_to_async(ChatSession.register)(
                     user=request.user,
                     session_id=session_id,
                     project=project,
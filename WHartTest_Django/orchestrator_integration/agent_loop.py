@@ -9,14 +9,17 @@ Agent Loop 编排器
 - AI 自主决策下一步操作
 """
 import asyncio
+import fnmatch
 import json
 import logging
 import time
 from typing import Any, Dict, List, Optional, Tuple
 
+from django.conf import settings
 from django.utils import timezone
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 
+from .journal import AgentPersistenceJournal
 from .models import AgentTask, AgentStep, AgentBlackboard
 from langgraph_integration.models import ChatSession
 
@@ -56,7 +59,7 @@ class AgentOrchestrator:
 - 严禁在没有任何新信息的情况下重复调用同一工具（同名同参数）。如果上一步工具返回已经包含所需信息，请直接进入下一步（如生成用例标题并调用保存工具），或给出无法继续的原因。
 """
 
-    def __init__(self, llm, tools=None, max_steps: int = None):
+    def __init__(self, llm, tools=None, max_steps: int = None, max_tool_concurrency: int = None):
         """
         初始化编排器
         
@@ -64,10 +67,15 @@ class AgentOrchestrator:
             llm: LangChain LLM 实例
             tools: 可用的工具列表
             max_steps: 最大步骤数
+            max_tool_concurrency: 单个会话同时执行的工具调用数上限
         """
         self.llm = llm
         self.tools = tools or []
         self.max_steps = max_steps or self.DEFAULT_MAX_STEPS
+        self.max_tool_concurrency = max(1, max_tool_concurrency or getattr(settings, 'AGENT_TOOL_MAX_CONCURRENCY', 4))
+        self._tool_semaphore = None  # 首次执行工具时在当前事件循环中创建
+        # 任务/步骤/Blackboard 的写入先缓冲，批量保存
+        self.journal = AgentPersistenceJournal()
         
         # 如果有工具，绑定到 LLM
         if self.tools:
@@ -195,6 +203,9 @@ class AgentOrchestrator:
                 'steps': task.current_step,
                 'task_id': task.id
             }
+        finally:
+            # 任何退出路径（包括取消）都写入剩余的缓冲
+            await asyncio.shield(self.journal.flush())
     
     async def _create_task(self, goal: str, session: ChatSession) -> AgentTask:
         """创建任务"""
@@ -231,14 +242,9 @@ class AgentOrchestrator:
         return await create()
     
     async def _save_task(self, task: AgentTask):
-        """保存任务状态"""
-        from asgiref.sync import sync_to_async
-        
-        @sync_to_async
-        def save():
-            task.save()
-        
-        await save()
+        """保存任务状态（缓冲写入，进入终态时立即写入）"""
+        self.journal.mark_task(task)
+        await self.journal.maybe_flush()
     
     def _build_step_context(self, blackboard: AgentBlackboard, goal: str) -> Dict:
         """
@@ -756,47 +762,97 @@ class AgentOrchestrator:
         return result
     
     async def _execute_tools(self, tool_calls: List) -> List[Dict]:
-        """执行工具调用"""
-        results = []
+        """
+        执行工具调用
+
+        同一步骤中的多个工具调用并发执行（受 max_tool_concurrency 限制），
+        有状态工具（见 _is_parallel_safe）按原顺序依次执行，结果按调用顺序返回
+        """
+        results: List[Optional[Dict]] = [None] * len(tool_calls)
+        parallel_calls = []
+        sequential_calls = []
         
-        for tool_call in tool_calls:
+        for index, tool_call in enumerate(tool_calls):
             tool_name, tool_args = self._extract_tool_call_payload(tool_call)
             
             if not tool_name:
-                results.append({
+                results[index] = {
                     'tool_name': '',
                     'input': tool_args,
                     'error': '工具名称缺失'
-                })
+                }
                 continue
             
             # 查找工具
             tool = self._find_tool(tool_name)
             if not tool:
-                results.append({
+                results[index] = {
                     'tool_name': tool_name,
                     'error': f'工具 {tool_name} 不存在'
-                })
+                }
                 continue
             
-            try:
-                # 执行工具（支持同步/异步）
-                output = await self._invoke_tool(tool, tool_args)
-                results.append({
-                    'tool_name': tool_name,
-                    'input': tool_args,
-                    'output': output
-                })
-            except Exception as e:
-                logger.error(f"工具 {tool_name} 调用失败: {e}", exc_info=True)
-                results.append({
-                    'tool_name': tool_name,
-                    'input': tool_args,
-                    'error': str(e)
-                })
+            calls = parallel_calls if self._is_parallel_safe(tool) else sequential_calls
+            calls.append((index, tool_name, tool, tool_args))
+        
+        if self._tool_semaphore is None:
+            self._tool_semaphore = asyncio.Semaphore(self.max_tool_concurrency)
+        
+        async def run_call(index, tool_name, tool, tool_args):
+            async with self._tool_semaphore:
+                results[index] = await self._run_tool(tool_name, tool, tool_args)
+        
+        async def run_sequential():
+            for call in sequential_calls:
+                await run_call(*call)
+        
+        jobs = [run_call(*call) for call in parallel_calls]
+        if sequential_calls:
+            jobs.append(run_sequential())
+        if len(jobs) > 1:
+            started = time.time()
+            await asyncio.gather(*jobs)
+            logger.info(
+                f"并发执行 {len(parallel_calls) + len(sequential_calls)} 个工具调用"
+                f"（有状态工具 {len(sequential_calls)} 个依次执行），耗时 {int((time.time() - started) * 1000)}ms"
+            )
+        elif jobs:
+            await jobs[0]
         
         return results
     
+    async def _run_tool(self, tool_name: str, tool, tool_args: Dict[str, Any]) -> Dict:
+        """执行单个工具调用，异常转换为错误结果"""
+        try:
+            # 执行工具（支持同步/异步）
+            output = await self._invoke_tool(tool, tool_args)
+            return {
+                'tool_name': tool_name,
+                'input': tool_args,
+                'output': output
+            }
+        except Exception as e:
+            logger.error(f"工具 {tool_name} 调用失败: {e}", exc_info=True)
+            return {
+                'tool_name': tool_name,
+                'input': tool_args,
+                'error': str(e)
+            }
+    
+    def _is_parallel_safe(self, tool) -> bool:
+        """
+        判断工具能否与同一步骤的其他调用并发执行
+
+        工具 metadata 中 parallel_safe=False，或名称匹配 AGENT_SEQUENTIAL_TOOLS
+        （如浏览器操作类 MCP 工具）时视为有状态工具
+        """
+        metadata = getattr(tool, 'metadata', None) or {}
+        if 'parallel_safe' in metadata:
+            return bool(metadata['parallel_safe'])
+        tool_name = getattr(tool, 'name', '')
+        patterns = getattr(settings, 'AGENT_SEQUENTIAL_TOOLS', [])
+        return not any(fnmatch.fnmatchcase(tool_name, pattern) for pattern in patterns)
+    
     def _find_tool(self, tool_name: str):
         """查找工具"""
         for tool in self.tools:
@@ -892,9 +948,7 @@ class AgentOrchestrator:
         return '\n\n'.join(summaries)
     
     async def _update_blackboard(self, blackboard: AgentBlackboard, step_result: Dict):
-        """更新 Blackboard"""
-        from asgiref.sync import sync_to_async
-        
+        """更新 Blackboard（缓冲写入）"""
         # 生成本步骤的摘要
         summary_parts = []
         
@@ -912,12 +966,9 @@ class AgentOrchestrator:
         
         if summary_parts:
             step_summary = ' | '.join(summary_parts)
-            
-            @sync_to_async
-            def update():
-                blackboard.add_history(step_summary)
-            
-            await update()
+            blackboard.add_history(step_summary, save=False)
+            self.journal.mark_blackboard(blackboard, 'history_summary')
+            await self.journal.maybe_flush()
     
     async def _record_step(
         self,
@@ -926,34 +977,28 @@ class AgentOrchestrator:
         result: Dict,
         duration_ms: int
     ):
-        """记录步骤"""
-        from asgiref.sync import sync_to_async
-        
-        @sync_to_async
-        def create_step():
-            # 安全提取工具信息
-            tool_name = ''
-            tool_input = None
-            tool_calls = result.get('tool_calls') or []
-            if tool_calls:
-                tool_name, tool_input = self._extract_tool_call_payload(tool_calls[0])
-            
-            return AgentStep.objects.create(
-                task=task,
-                step_number=task.current_step,
-                input_context={
-                    'goal': context.get('goal', ''),
-                    'history_length': len(context.get('history', '').split('\n'))
-                },
-                ai_response=result.get('response', ''),
-                tool_name=tool_name,
-                tool_input=tool_input,
-                tool_output_summary=result.get('tool_summary', ''),
-                is_final=result.get('is_final', False),
-                duration_ms=duration_ms
-            )
+        """记录步骤（缓冲写入，批量保存）"""
+        # 安全提取工具信息
+        tool_name = ''
+        tool_input = None
+        tool_calls = result.get('tool_calls') or []
+        if tool_calls:
+            tool_name, tool_input = self._extract_tool_call_payload(tool_calls[0])
         
-        await create_step()
+        self.journal.add_step(AgentStep(
+            task=task,
+            step_number=task.current_step,
+            input_context={
+                'goal': context.get('goal', ''),
+                'history_length': len(context.get('history', '').split('\n'))
+            },
+            ai_response=result.get('response', ''),
+            tool_name=tool_name,
+            tool_input=tool_input,
+            tool_output_summary=result.get('tool_summary', ''),
+            is_final=result.get('is_final', False),
+            duration_ms=duration_ms
+        ))
 
 
 class AgentLoopIntegration:
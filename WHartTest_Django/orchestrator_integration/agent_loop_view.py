@@ -26,9 +26,11 @@ from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, Tool
 from .context_compression import ConversationCompressor, CompressionSettings
 from requirements.context_limits import context_checker, RESERVED_TOKENS
 from wharttest_django.checkpointer import get_async_checkpointer
+from wharttest_django.sse import SSETokenCoalescer
 
 from .agent_loop import AgentOrchestrator
 from .models import AgentTask, AgentBlackboard, AgentStep
+from .tool_summaries import SUMMARY_THRESHOLD, content_hash, get_tool_summaries, schedule_tool_summary
 from langgraph_integration.models import ChatSession, LLMConfig
 from langgraph_integration.views import (
     create_llm_instance,
@@ -324,34 +326,33 @@ class AgentLoopStreamAPIView(View):
         messages: List[AnyMessage],
         llm,
         model_name: str,
-        summary_limit: int = 600
+        summary_limit: int = SUMMARY_THRESHOLD
     ) -> List[AnyMessage]:
-        """对历史消息中的工具输出进行摘要"""
+        """对历史消息中的工具输出进行摘要（优先使用已缓存的摘要，缺失的并发生成）"""
+        long_outputs = {}
+        if llm:
+            for index, msg in enumerate(messages):
+                if isinstance(msg, ToolMessage):
+                    raw_content = self._normalize_message_content(getattr(msg, "content", ""))
+                    if len(raw_content) > summary_limit:
+                        long_outputs[index] = (getattr(msg, "tool_call_id", None) or '', raw_content)
+        if not long_outputs:
+            return list(messages)
+
+        summaries = await get_tool_summaries(llm, long_outputs.values(), model_name=model_name)
+
         summarized: List[AnyMessage] = []
-        for msg in messages:
-            if isinstance(msg, ToolMessage):
-                raw_content = self._normalize_message_content(getattr(msg, "content", ""))
-                if len(raw_content) > summary_limit and llm:
-                    try:
-                        prompt = (
-                            "以下是工具输出，请用简洁中文概括关键结论、数据和建议，控制在150字内：\n"
-                            f"{raw_content}\n\n"
-                            "要求：保留结论和数值，忽略日志、重复细节。"
-                        )
-                        response = await llm.ainvoke([
-                            SystemMessage(content="你擅长压缩冗长的工具返回，只保留要点。"),
-                            HumanMessage(content=prompt)
-                        ])
-                        summary_text = response.content if hasattr(response, "content") else str(response)
-                        if summary_text:
-                            msg = ToolMessage(
-                                content=f"[工具摘要] {summary_text.strip()}",
-                                name=getattr(msg, "name", None),
-                                tool_call_id=getattr(msg, "tool_call_id", None),
-                                additional_kwargs=getattr(msg, "additional_kwargs", None)
-                            )
-                    except Exception as tool_err:
-                        logger.warning(f"AgentLoopStreamAPI: tool summary failed: {tool_err}")
+        for index, msg in enumerate(messages):
+            if index in long_outputs:
+                tool_call_id, raw_content = long_outputs[index]
+                summary_text = summaries.get((tool_call_id, content_hash(raw_content)))
+                if summary_text:
+                    msg = ToolMessage(
+                        content=f"[工具摘要] {summary_text}",
+                        name=getattr(msg, "name", None),
+                        tool_call_id=getattr(msg, "tool_call_id", None),
+                        additional_kwargs=getattr(msg, "additional_kwargs", None)
+                    )
             summarized.append(msg)
         return summarized
 
@@ -413,7 +414,7 @@ class AgentLoopStreamAPIView(View):
 
     async def _create_stream_generator(
         self,
-        request,
+        user,
         user_message: str,
         session_id: str,
         project_id: str,
@@ -425,14 +426,19 @@ class AgentLoopStreamAPIView(View):
         generate_playwright_script: bool = False,
         test_case_id: Optional[int] = None,
         use_pytest: bool = True,
+        encode=create_sse_data,
     ):
-        """创建 SSE 流式生成器"""
+        """
+        创建流式事件生成器
+
+        事件字典经 encode 编码后输出：默认编码为 SSE 帧；进程内执行（见 runner.run_agent_loop）时原样输出字典
+        """
         # 用于收集所有消息的列表（会先加载历史消息）
         conversation_messages: List[AnyMessage] = []
         session_created = False
         
         # 先加载历史消息（用于续接会话时避免重复）
-        thread_id = f"{request.user.id}_{project_id}_{session_id}"
+        thread_id = f"{user.id}_{project_id}_{session_id}"
         try:
             async with get_async_checkpointer() as checkpointer:
                 config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
@@ -454,20 +460,21 @@ class AgentLoopStreamAPIView(View):
             context_limit = active_config.context_limit or 128000
             model_name = active_config.name or "gpt-4o"
         except LLMConfig.DoesNotExist:
-            yield create_sse_data({'type': 'error', 'message': 'No active LLM configuration found'})
+            yield encode({'type': 'error', 'message': 'No active LLM configuration found'})
             return
 
         # 2. 验证多模态支持
         if image_base64 and not active_config.supports_vision:
-            yield create_sse_data({
+            yield encode({
                 'type': 'error',
                 'message': f'模型 {active_config.name} 不支持图片输入'
             })
             return
 
+        orchestrator = None
         try:
-            # 3. 初始化 LLM（避免阻塞事件循环）
-            llm = await sync_to_async(create_llm_instance)(active_config, temperature=0.7)
+            # 3. 获取 LLM（客户端已按配置缓存，在事件循环中获取以复用该循环的异步连接）
+            llm = create_llm_instance(active_config, temperature=0.7)
 
             # 4. 加载 MCP 工具
             mcp_tools_list = []
@@ -489,18 +496,18 @@ class AgentLoopStreamAPIView(View):
                     if client_config:
                         mcp_tools_list = await mcp_session_manager.get_tools_for_config(
                             client_config,
-                            user_id=str(request.user.id),
+                            user_id=str(user.id),
                             project_id=str(project_id),
                             session_id=session_id
                         )
                         logger.info(f"AgentLoopStreamAPI: Loaded {len(mcp_tools_list)} MCP tools")
-                        yield create_sse_data({
+                        yield encode({
                             'type': 'info',
                             'message': f'已加载 {len(mcp_tools_list)} 个工具'
                         })
             except Exception as e:
                 logger.error(f"AgentLoopStreamAPI: MCP tools loading failed: {e}", exc_info=True)
-                yield create_sse_data({
+                yield encode({
                     'type': 'warning',
                     'message': f'MCP 工具加载失败: {str(e)}'
                 })
@@ -511,7 +518,7 @@ class AgentLoopStreamAPIView(View):
                     from knowledge.langgraph_integration import create_knowledge_tool
                     kb_tool = await sync_to_async(create_knowledge_tool)(
                         knowledge_base_id=knowledge_base_id,
-                        user=request.user
+                        user=user
                     )
                     mcp_tools_list.append(kb_tool)
                     logger.info(f"AgentLoopStreamAPI: Added knowledge base tool")
@@ -522,7 +529,7 @@ class AgentLoopStreamAPIView(View):
             from orchestrator_integration.builtin_tools import get_builtin_tools
 
             builtin_tools = get_builtin_tools(
-                user_id=request.user.id,
+                user_id=user.id,
                 project_id=int(project_id),
                 test_case_id=test_case_id,
                 chat_session_id=session_id,
@@ -534,7 +541,7 @@ class AgentLoopStreamAPIView(View):
             chat_session = await sync_to_async(
                 lambda: ChatSession.objects.filter(
                     session_id=session_id,
-                    user=request.user,
+                    user=user,
                     project_id=project_id
                 ).first()
             )()
@@ -544,13 +551,13 @@ class AgentLoopStreamAPIView(View):
                 if prompt_id:
                     try:
                         prompt_obj = await sync_to_async(UserPrompt.objects.get)(
-                            id=prompt_id, user=request.user, is_active=True
+                            id=prompt_id, user=user, is_active=True
                         )
                     except UserPrompt.DoesNotExist:
                         pass
                 
                 chat_session = await sync_to_async(ChatSession.objects.create)(
-                    user=request.user,
+                    user=user,
                     session_id=session_id,
                     project=project,
                     prompt=prompt_obj,
@@ -561,7 +568,7 @@ class AgentLoopStreamAPIView(View):
 
             # 7. 获取系统提示词
             effective_prompt, prompt_source = await get_effective_system_prompt_async(
-                request.user, prompt_id, project
+                user, prompt_id, project
             )
             
             # 7.1 如果需要生成脚本，追加脚本生成指令
@@ -768,7 +775,7 @@ page.get_by_placeholder("用户名").fill("admin")
 
             # 7.5 加载历史对话摘要（跨对话上下文，根据模型context_limit判断是否需要AI摘要）
             conversation_summary = await self._load_conversation_summary(
-                request.user.id,
+                user.id,
                 project_id,
                 session_id,
                 llm=llm,
@@ -807,7 +814,7 @@ page.get_by_placeholder("用户名").fill("admin")
             conversation_messages.append(HumanMessage(content=human_message_content))
 
             # 11. 发送开始信号
-            yield create_sse_data({
+            yield encode({
                 'type': 'start',
                 'session_id': session_id,
                 'project_id': project_id,
@@ -897,7 +904,8 @@ page.get_by_placeholder("用户名").fill("admin")
 
                 blackboard.current_state = dict(blackboard.current_state or {})
                 blackboard.current_state['conversation_history'] = combined_text
-                await sync_to_async(blackboard.save)(update_fields=['current_state', 'updated_at'])
+                orchestrator.journal.mark_blackboard(blackboard, 'current_state')
+                await orchestrator.journal.maybe_flush()
                 last_conversation_snapshot = combined_text
                 return True
 
@@ -940,7 +948,7 @@ page.get_by_placeholder("用户名").fill("admin")
                         )
                         try:
                             await self._save_chat_history(
-                                request.user.id,
+                                user.id,
                                 project_id,
                                 session_id,
                                 conversation_messages
@@ -948,12 +956,12 @@ page.get_by_placeholder("用户名").fill("admin")
                         except Exception as save_err:
                             logger.warning(f"AgentLoopStreamAPI: Stop history save failed: {save_err}")
 
-                    yield create_sse_data({
+                    yield encode({
                         'type': 'stopped',
                         'message': '已停止生成',
                         'step': step_count
                     })
-                    yield create_sse_data({
+                    yield encode({
                         'type': 'complete',
                         'status': 'stopped',
                         'steps': step_count - 1
@@ -966,7 +974,7 @@ page.get_by_placeholder("用户名").fill("admin")
                 await orchestrator._save_task(task)
 
                 # 发送步骤开始信号
-                yield create_sse_data({
+                yield encode({
                     'type': 'step_start',
                     'step': step_count,
                     'max_steps': orchestrator.max_steps
@@ -999,6 +1007,9 @@ page.get_by_placeholder("用户名").fill("admin")
                 step_timed_out = False
                 user_stopped = False  # ⭐ 用户停止标志
 
+                # 流式令牌按时间/字节窗口合并后输出
+                token_coalescer = SSETokenCoalescer('stream', encode=encode)
+
                 # 实时输出流式内容
                 while not step_task.done():
                     try:
@@ -1008,7 +1019,10 @@ page.get_by_placeholder("用户名").fill("admin")
                             step_timed_out = True
                             step_task.cancel()
                             logger.error(f"步骤 {step_count} 执行超时 ({step_timeout}秒)")
-                            yield create_sse_data({
+                            frame = token_coalescer.flush()
+                            if frame:
+                                yield frame
+                            yield encode({
                                 'type': 'error',
                                 'message': f'步骤执行超时（{step_timeout}秒）'
                             })
@@ -1019,20 +1033,26 @@ page.get_by_placeholder("用户名").fill("admin")
                             user_stopped = True
                             step_task.cancel()
                             logger.info(f"AgentLoopStreamAPI: Stop signal in streaming for session {session_id}")
+                            frame = token_coalescer.flush()
+                            if frame:
+                                yield frame
                             break
 
-                        # 等待队列数据，设置超时避免阻塞
+                        # 等待队列数据，设置超时避免阻塞；有待发送令牌时按合并窗口到期时间唤醒
+                        flush_wait = token_coalescer.time_until_flush()
                         msg_type, content = await asyncio.wait_for(
                             stream_queue.get(), 
-                            timeout=0.1
+                            timeout=0.1 if flush_wait is None else min(flush_wait, 0.1)
                         )
                         if msg_type == 'chunk':
-                            yield create_sse_data({
-                                'type': 'stream',
-                                'data': content
-                            })
+                            frame = token_coalescer.add(content)
+                            if frame:
+                                yield frame
                     except asyncio.TimeoutError:
-                        # 超时后继续检查任务是否完成
+                        # 超时后发送已缓冲的令牌，继续检查任务是否完成
+                        frame = token_coalescer.flush()
+                        if frame:
+                            yield frame
                         continue
                     except asyncio.CancelledError:
                         break
@@ -1070,7 +1090,7 @@ page.get_by_placeholder("用户名").fill("admin")
                         # 保存对话历史
                         try:
                             await self._save_chat_history(
-                                request.user.id,
+                                user.id,
                                 project_id,
                                 session_id,
                                 conversation_messages
@@ -1079,12 +1099,12 @@ page.get_by_placeholder("用户名").fill("admin")
                             logger.warning(f"AgentLoopStreamAPI: Timeout history save failed: {save_err}")
                     
                     # 发送错误结束事件
-                    yield create_sse_data({
+                    yield encode({
                         'type': 'error',
                         'message': f'步骤执行超时（{step_timeout}秒）',
                         'step': step_count
                     })
-                    yield create_sse_data({
+                    yield encode({
                         'type': 'complete',
                         'status': 'timeout',
                         'steps': step_count
@@ -1125,7 +1145,7 @@ page.get_by_placeholder("用户名").fill("admin")
                     )
                     try:
                         await self._save_chat_history(
-                            request.user.id,
+                            user.id,
                             project_id,
                             session_id,
                             conversation_messages
@@ -1133,12 +1153,12 @@ page.get_by_placeholder("用户名").fill("admin")
                     except Exception as save_err:
                         logger.warning(f"AgentLoopStreamAPI: User stop history save failed: {save_err}")
 
-                    yield create_sse_data({
+                    yield encode({
                         'type': 'stopped',
                         'message': '已停止生成',
                         'step': step_count
                     })
-                    yield create_sse_data({
+                    yield encode({
                         'type': 'complete',
                         'status': 'stopped',
                         'steps': step_count
@@ -1150,10 +1170,12 @@ page.get_by_placeholder("用户名").fill("admin")
                 while not stream_queue.empty():
                     msg_type, content = await stream_queue.get()
                     if msg_type == 'chunk':
-                        yield create_sse_data({
-                            'type': 'stream',
-                            'data': content
-                        })
+                        frame = token_coalescer.add(content)
+                        if frame:
+                            yield frame
+                frame = token_coalescer.flush()
+                if frame:
+                    yield frame
                 
                 # 获取执行结果
                 try:
@@ -1183,7 +1205,7 @@ page.get_by_placeholder("用户名").fill("admin")
                     await refresh_conversation_history_snapshot()
                     
                     # ⭐ 发送流式结束信号（内容已通过 stream 事件发送）
-                    yield create_sse_data({
+                    yield encode({
                         'type': 'stream_end',
                         'step': step_count,
                         'is_final': is_final
@@ -1199,16 +1221,17 @@ page.get_by_placeholder("用户名").fill("admin")
                         "agent": "agent_loop",
                         "sse_event_type": "tool_result"  # ⭐ 标记为 tool_result 事件
                     }
-                    conversation_messages.append(
-                        ToolMessage(
-                            content=f"Step {step_count} 工具结果:\n{tool_summary}",
-                            tool_call_id=f"agent-loop-step-{step_count}",
-                            name="agent_loop_tools",
-                            additional_kwargs={"metadata": tool_metadata}
-                        )
+                    tool_message = ToolMessage(
+                        content=f"Step {step_count} 工具结果:\n{tool_summary}",
+                        tool_call_id=f"agent-loop-step-{step_count}",
+                        name="agent_loop_tools",
+                        additional_kwargs={"metadata": tool_metadata}
                     )
+                    conversation_messages.append(tool_message)
+                    # 后台预先生成历史摘要，后续轮次加载历史时直接复用
+                    schedule_tool_summary(llm, tool_message.tool_call_id, tool_message.content, model_name=model_name)
                     await refresh_conversation_history_snapshot()
-                    yield create_sse_data({
+                    yield encode({
                         'type': 'tool_result',
                         'summary': tool_summary
                     })
@@ -1217,7 +1240,7 @@ page.get_by_placeholder("用户名").fill("admin")
                 await orchestrator._update_blackboard(blackboard, step_result)
 
                 # 发送步骤完成信号
-                yield create_sse_data({
+                yield encode({
                     'type': 'step_complete',
                     'step': step_count,
                     'summary': step_result.get('tool_summary', '')[:200]
@@ -1226,7 +1249,7 @@ page.get_by_placeholder("用户名").fill("admin")
                 # ⭐ 每步完成后立即保存对话历史（增量保存，防止中断丢失）
                 try:
                     await self._save_chat_history(
-                        request.user.id,
+                        user.id,
                         project_id,
                         session_id,
                         conversation_messages
@@ -1287,7 +1310,7 @@ page.get_by_placeholder("用户名").fill("admin")
                     logger.info(f"[Context Update] Agent Loop Step {step_count}: {total_tokens}/{context_limit} tokens")
                     
                     # ⭐ 每步都发送Token更新事件
-                    yield create_sse_data({
+                    yield encode({
                         'type': 'context_update',
                         'context_token_count': total_tokens,
                         'context_limit': context_limit,
@@ -1298,7 +1321,7 @@ page.get_by_placeholder("用户名").fill("admin")
                     if total_tokens >= context_limit * 0.9:
                         logger.warning(f"[Compression Trigger] Step {step_count}: Token达到{total_tokens}/{context_limit}(90%),触发压缩")
                         
-                        yield create_sse_data({
+                        yield encode({
                             'type': 'compressing',
                             'message': '⚙️ Token达到90%,正在压缩记忆...',
                             'step': step_count,
@@ -1344,14 +1367,14 @@ page.get_by_placeholder("用户名").fill("admin")
                             reduction = max(total_tokens - new_total_tokens, 0)
                             actions_text = '、'.join(compression_actions)
                             
-                            yield create_sse_data({
+                            yield encode({
                                 'type': 'compression_done',
                                 'message': f'{actions_text}已压缩: {total_tokens}→{new_total_tokens} tokens',
                                 'step': step_count,
                                 'token_reduction': reduction
                             })
                             
-                            yield create_sse_data({
+                            yield encode({
                                 'type': 'context_update',
                                 'context_token_count': new_total_tokens,
                                 'context_limit': context_limit,
@@ -1390,7 +1413,7 @@ page.get_by_placeholder("用户名").fill("admin")
                             'message': '脚本管理工具已启用（保存/查询/执行等）'
                         }
                     
-                    yield create_sse_data(complete_data)
+                    yield encode(complete_data)
                     break
 
                 # 检查错误：工具调用失败时继续循环让 LLM 重试
@@ -1403,7 +1426,7 @@ page.get_by_placeholder("用户名").fill("admin")
                     
                     logger.info(f"AgentLoopStreamAPI: Task failed at step {step_count}, history already saved")
                     
-                    yield create_sse_data({
+                    yield encode({
                         'type': 'error',
                         'message': step_result['error']
                     })
@@ -1420,7 +1443,7 @@ page.get_by_placeholder("用户名").fill("admin")
                         task.completed_at = timezone.now()
                         await orchestrator._save_task(task)
                         
-                        yield create_sse_data({
+                        yield encode({
                             'type': 'error',
                             'message': task.error_message
                         })
@@ -1429,9 +1452,6 @@ page.get_by_placeholder("用户名").fill("admin")
                     # 成功时重置计数器
                     consecutive_tool_failures = 0
 
-                # 小延迟确保流式效果
-                await asyncio.sleep(0.05)
-
             # 超过最大步骤
             if step_count >= orchestrator.max_steps:
                 task.status = 'failed'
@@ -1439,7 +1459,7 @@ page.get_by_placeholder("用户名").fill("admin")
                 task.completed_at = timezone.now()
                 await orchestrator._save_task(task)
                 
-                yield create_sse_data({
+                yield encode({
                     'type': 'error',
                     'message': task.error_message
                 })
@@ -1449,10 +1469,17 @@ page.get_by_placeholder("用户名").fill("admin")
 
         except Exception as e:
             logger.error(f"AgentLoopStreamAPI: Error: {e}", exc_info=True)
-            yield create_sse_data({
+            yield encode({
                 'type': 'error',
                 'message': f'执行错误: {str(e)}'
             })
+        finally:
+            # 流结束、客户端断开或被取消时，写入剩余的任务/步骤/Blackboard 缓冲
+            if orchestrator is not None:
+                try:
+                    await asyncio.shield(orchestrator.journal.flush())
+                except Exception as flush_err:
+                    logger.warning(f"AgentLoopStreamAPI: Final journal flush failed: {flush_err}")
 
     async def post(self, request, *args, **kwargs):
         """处理流式聊天请求"""
@@ -1531,7 +1558,7 @@ page.get_by_placeholder("用户名").fill("admin")
         # 6. 返回流式响应
         async def async_generator():
             async for chunk in self._create_stream_generator(
-                request, user_message, session_id, project_id, project,
+                request.user, user_message, session_id, project_id, project,
                 knowledge_base_id, use_knowledge_base, prompt_id, image_base64,
                 generate_playwright_script, test_case_id, use_pytest
             ):
@@ -187,4 +187,8 @@ def get_diagram_tools() -> list:
             "message": f"已准备{len(validated_ops)}个编辑操作"
         }, ensure_ascii=False)
 
+    # 两个工具操作同一张图表，Agent Loop 中按调用顺序依次执行
+    for diagram_tool in (display_diagram, edit_diagram):
+        diagram_tool.metadata = {'parallel_safe': False}
+
     return [display_diagram, edit_diagram]
@@ -414,6 +414,10 @@ def get_playwright_tools(
             logger.error(f"[get_script_execution_result] 查询失败: {e}", exc_info=True)
             return f"查询失败: {str(e)}"
     
+    # 保存/更新/执行同一脚本的调用有先后依赖，Agent Loop 中按调用顺序依次执行
+    for stateful_tool in (save_playwright_script, update_playwright_script, execute_playwright_script):
+        stateful_tool.metadata = {'parallel_safe': False}
+
     # 返回所有工具
     return [
         save_playwright_script,
@@ -297,4 +297,7 @@ def get_skill_tools(user_id: int, project_id: int = None, test_case_id: int = No
             logger.error(f"[execute_skill_script] 执行失败: {e}", exc_info=True)
             return f"错误: {str(e)}"
 
+    # 脚本可能复用同一浏览器会话，Agent Loop 中按调用顺序依次执行
+    execute_skill_script.metadata = {'parallel_safe': False}
+
     return [read_skill_content, execute_skill_script]
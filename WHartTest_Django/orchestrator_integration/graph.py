@@ -38,7 +38,7 @@ class OrchestratorState(TypedDict):
 
 def create_knowledge_tool(project_id: int, max_retries: int = 3) -> Tool:
     """
-    创建知识库搜索工具，自动重试最多3次
+    创建知识库搜索工具（跨知识库联合检索），失败时自动重试最多3次
     
     Args:
         project_id: 项目ID
@@ -49,7 +49,7 @@ def create_knowledge_tool(project_id: int, max_retries: int = 3) -> Tool:
     """
     def search_knowledge_base(query: str) -> str:
         """
-        在项目的所有知识库中搜索相关文档，自动重试最多3次
+        在项目的所有知识库中联合搜索相关文档，失败时自动重试最多3次
         
         Args:
             query: 搜索查询字符串
@@ -59,33 +59,24 @@ def create_knowledge_tool(project_id: int, max_retries: int = 3) -> Tool:
         """
         logger.info(f"🔍 知识库工具被调用: query='{query}', max_retries={max_retries}")
         
+        # 获取项目下所有激活的知识库
+        project_kbs = list(KnowledgeBase.objects.filter(
+            project_id=project_id,
+            is_active=True
+        ))
+        
+        if not project_kbs:
+            msg = f"项目 {project_id} 下没有可用的知识库"
+            logger.warning(msg)
+            return msg
+        
         for attempt in range(max_retries):
             try:
-                # 获取项目下所有激活的知识库
-                project_kbs = KnowledgeBase.objects.filter(
-                    project_id=project_id,
-                    is_active=True
-                )
-                
-                if not project_kbs.exists():
-                    msg = f"项目 {project_id} 下没有可用的知识库"
-                    logger.warning(msg)
-                    return msg
+                logger.info(f"  📚 第{attempt+1}次尝试: 在 {len(project_kbs)} 个知识库中联合搜索...")
                 
-                logger.info(f"  📚 第{attempt+1}次尝试: 在 {project_kbs.count()} 个知识库中搜索...")
-                
-                all_docs = []
-                for kb in project_kbs:
-                    try:
-                        # 使用VectorStoreManager进行搜索
-                        from knowledge.services import KnowledgeBaseService
-                        kb_service = KnowledgeBaseService(kb)
-                        results = kb_service.vector_manager.similarity_search(query, k=3, score_threshold=0.1)
-                        if results:
-                            all_docs.extend(results)
-                            logger.info(f"    └─ {kb.name}: 找到 {len(results)} 个文档")
-                    except Exception as e:
-                        logger.error(f"    └─ {kb.name}: 搜索失败 {e}")
+                # 查询只向量化一次，并发检索所有知识库后全局融合排序
+                from knowledge.services import FederatedKnowledgeSearch
+                all_docs = FederatedKnowledgeSearch(project_kbs).search(query, k=5, score_threshold=0.1)
                 
                 if all_docs:
                     # 找到文档，返回摘要
@@ -95,12 +86,10 @@ def create_knowledge_tool(project_id: int, max_retries: int = 3) -> Tool:
                     ])
                     logger.info(f"  ✅ 第{attempt+1}次尝试成功: 找到 {len(all_docs)} 个文档")
                     return f"找到 {len(all_docs)} 个相关文档:\n\n{docs_summary}"
-                else:
-                    logger.info(f"  ⚠️ 第{attempt+1}次尝试: 未找到文档")
-                    if attempt < max_retries - 1:
-                        continue  # 继续重试
-                    else:
-                        return f"在 {project_kbs.count()} 个知识库中搜索了 {max_retries} 次，未找到与'{query}'相关的文档"
+                
+                # 检索正常但无结果时重试不会改变结果，直接返回
+                logger.info(f"  ⚠️ 第{attempt+1}次尝试: 未找到文档")
+                return f"在 {len(project_kbs)} 个知识库中未找到与'{query}'相关的文档"
             
             except Exception as e:
                 logger.error(f"  ❌ 第{attempt+1}次尝试失败: {e}", exc_info=True)
@@ -113,7 +102,7 @@ def create_knowledge_tool(project_id: int, max_retries: int = 3) -> Tool:
     
     return Tool(
         name="search_knowledge_base",
-        description=f"在项目ID={project_id}的所有知识库中搜索相关文档。输入搜索查询，返回相关文档内容。自动重试最多{max_retries}次。适用于查找项目文档、需求、设计等信息。",
+        description=f"在项目ID={project_id}的所有知识库中搜索相关文档。输入搜索查询，返回相关文档内容。失败时自动重试最多{max_retries}次。适用于查找项目文档、需求、设计等信息。",
         func=search_knowledge_base
     )
 
@@ -0,0 +1,107 @@
+"""
+Agent Loop 持久化日志（write-behind）
+
+每步的任务状态、步骤记录和 Blackboard 变更先在内存中累积，
+按时间间隔/条数批量写入数据库，任务进入终态时立即写入：
+- 步骤记录：bulk_create
+- 任务 / Blackboard：只保存有变更的字段
+- 一次写入在同一事务中完成，失败时保留缓冲，下次重试
+"""
+import asyncio
+import logging
+import time
+from typing import List, Set
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .models import AgentBlackboard, AgentStep, AgentTask
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {'completed', 'failed', 'cancelled'}
+
+
+class AgentPersistenceJournal:
+    """缓冲单个 Agent 任务的数据库写入"""
+
+    def __init__(self, flush_interval: float = None, max_pending_steps: int = None):
+        self.flush_interval = (
+            flush_interval if flush_interval is not None
+            else getattr(settings, 'AGENT_JOURNAL_FLUSH_INTERVAL', 2.0)
+        )
+        self.max_pending_steps = (
+            max_pending_steps if max_pending_steps is not None
+            else getattr(settings, 'AGENT_JOURNAL_MAX_PENDING_STEPS', 20)
+        )
+        self._steps: List[AgentStep] = []
+        self._task: AgentTask = None
+        self._blackboard: AgentBlackboard = None
+        self._blackboard_fields: Set[str] = set()
+        self._last_flush = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._steps or self._task is not None or self._blackboard_fields)
+
+    def mark_task(self, task: AgentTask):
+        """记录任务状态变更（保存时写入任务的当前内存状态）"""
+        self._task = task
+
+    def mark_blackboard(self, blackboard: AgentBlackboard, *fields: str):
+        """记录 Blackboard 字段变更"""
+        self._blackboard = blackboard
+        self._blackboard_fields.update(fields)
+
+    def add_step(self, step: AgentStep):
+        """追加步骤记录（尚未保存的 AgentStep 实例）"""
+        self._steps.append(step)
+
+    async def maybe_flush(self):
+        """达到时间间隔或步骤条数阈值时写入；任务进入终态时立即写入"""
+        if not self.pending:
+            return
+        task_finished = self._task is not None and self._task.status in TERMINAL_STATUSES
+        if (
+            task_finished
+            or len(self._steps) >= self.max_pending_steps
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            await self.flush()
+
+    async def flush(self):
+        """将缓冲的变更写入数据库"""
+        async with self._lock:
+            if not self.pending:
+                return
+            steps, task = self._steps, self._task
+            blackboard, blackboard_fields = self._blackboard, self._blackboard_fields
+            self._steps, self._task, self._blackboard_fields = [], None, set()
+
+            try:
+                await sync_to_async(self._write)(steps, task, blackboard, blackboard_fields)
+            except Exception:
+                # 写入失败：恢复缓冲，由下次写入重试（同一事务内不会部分写入）
+                self._steps = steps + self._steps
+                self._task = self._task or task
+                self._blackboard_fields |= blackboard_fields
+                raise
+            finally:
+                self._last_flush = time.monotonic()
+
+    @staticmethod
+    def _write(steps, task, blackboard, blackboard_fields):
+        with transaction.atomic():
+            if task is not None:
+                task.save()
+            if steps:
+                # 同一步骤号已存在时跳过（与逐条 create 时唯一约束失败被忽略的行为一致）
+                AgentStep.objects.bulk_create(steps, ignore_conflicts=True)
+            if blackboard is not None and blackboard_fields:
+                blackboard.save(update_fields=sorted(blackboard_fields | {'updated_at'}))
+        logger.debug(
+            f"AgentPersistenceJournal: flushed task={getattr(task, 'id', None)}, "
+            f"steps={len(steps)}, blackboard_fields={sorted(blackboard_fields)}"
+        )
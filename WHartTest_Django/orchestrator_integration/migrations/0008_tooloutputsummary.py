@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orchestrator_integration', '0007_change_max_steps_default_500'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ToolOutputSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tool_call_id', models.CharField(max_length=255, verbose_name='工具调用ID')),
+                ('content_hash', models.CharField(help_text='工具输出内容的 SHA-256', max_length=64, verbose_name='内容哈希')),
+                ('summary', models.TextField(verbose_name='摘要')),
+                ('model_name', models.CharField(blank=True, max_length=255, verbose_name='摘要模型')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': '工具输出摘要',
+                'verbose_name_plural': '工具输出摘要',
+                'db_table': 'tool_output_summary',
+                'unique_together': {('tool_call_id', 'content_hash')},
+            },
+        ),
+    ]
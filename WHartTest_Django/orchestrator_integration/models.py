@@ -189,15 +189,16 @@ class AgentBlackboard(models.Model):
     def __str__(self):
         return f"Blackboard for Task {self.task_id}"
     
-    def add_history(self, summary: str):
-        """添加历史摘要"""
+    def add_history(self, summary: str, save: bool = True):
+        """添加历史摘要（save=False 时只更新内存，由调用方负责保存）"""
         history = list(self.history_summary or [])
         history.append(str(summary))
         # 限制历史长度
         if len(history) > self.MAX_HISTORY_LENGTH:
             history = history[-self.MAX_HISTORY_LENGTH:]
         self.history_summary = history
-        self.save(update_fields=['history_summary', 'updated_at'])
+        if save:
+            self.save(update_fields=['history_summary', 'updated_at'])
     
     def update_state(self, key: str, value):
         """更新当前状态"""
@@ -286,4 +287,22 @@ class AgentBlackboard(models.Model):
             # 失败时至少保留最近10条
             self.history_summary = history[-10:]
             self.save(update_fields=['history_summary', 'updated_at'])
-            return False
\ No newline at end of file
+            return False
+
+class ToolOutputSummary(models.Model):
+    """工具输出摘要缓存 - 加载对话历史时复用，避免每轮重复调用 LLM 摘要"""
+
+    tool_call_id = models.CharField(max_length=255, verbose_name='工具调用ID')
+    content_hash = models.CharField(max_length=64, verbose_name='内容哈希', help_text='工具输出内容的 SHA-256')
+    summary = models.TextField(verbose_name='摘要')
+    model_name = models.CharField(max_length=255, blank=True, verbose_name='摘要模型')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'tool_output_summary'
+        unique_together = ['tool_call_id', 'content_hash']
+        verbose_name = '工具输出摘要'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"Summary of {self.tool_call_id} ({self.content_hash[:8]})"
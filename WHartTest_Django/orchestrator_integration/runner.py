@@ -0,0 +1,78 @@
+"""
+Agent Loop 进程内执行
+
+Celery worker 等服务端调用方直接在当前事件循环中运行 Agent Loop，
+事件以字典形式回调，无需经 HTTP 回环、JWT 签发与 SSE 编码/解析
+"""
+import inspect
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from django.conf import settings
+
+from projects.models import Project
+from .tool_summaries import drain_tool_summaries
+
+logger = logging.getLogger(__name__)
+
+EventHandler = Callable[[Dict[str, Any]], Union[None, Awaitable[None]]]
+
+
+def _identity(data_dict: Dict[str, Any]) -> Dict[str, Any]:
+    return data_dict
+
+
+async def run_agent_loop(
+    user,
+    project: Project,
+    message: str,
+    *,
+    session_id: Optional[str] = None,
+    prompt_id: Optional[int] = None,
+    use_knowledge_base: bool = False,
+    knowledge_base_id: Optional[int] = None,
+    generate_playwright_script: bool = False,
+    test_case_id: Optional[int] = None,
+    use_pytest: bool = True,
+    on_event: Optional[EventHandler] = None,
+) -> str:
+    """
+    在当前事件循环中执行 Agent Loop（与 /api/orchestrator/agent-loop/ 行为一致）
+
+    Args:
+        user: 执行用户（调用方负责权限校验）
+        project: 所属项目
+        message: 用户消息
+        on_event: 事件回调，接收与 SSE 相同结构的事件字典，可为同步或异步函数；
+            回调抛出的异常会终止执行并向上传播
+
+    Returns:
+        本次执行使用的会话ID
+    """
+    from .agent_loop_view import AgentLoopStreamAPIView
+
+    if not session_id:
+        session_id = uuid.uuid4().hex
+
+    events = AgentLoopStreamAPIView()._create_stream_generator(
+        user, message, session_id, str(project.id), project,
+        knowledge_base_id, use_knowledge_base, prompt_id, None,
+        generate_playwright_script, test_case_id, use_pytest,
+        encode=_identity,
+    )
+    try:
+        async for event in events:
+            # 结束标记等预编码的 SSE 文本只用于 HTTP 输出
+            if not isinstance(event, dict) or on_event is None:
+                continue
+            result = on_event(event)
+            if inspect.isawaitable(result):
+                await result
+    finally:
+        await events.aclose()
+        # 调用方的事件循环可能随后关闭（如 Celery 任务），不遗留后台摘要任务
+        await drain_tool_summaries(getattr(settings, 'AGENT_TOOL_SUMMARY_DRAIN_TIMEOUT', 30))
+
+    logger.info(f"AgentLoopRunner: Finished session {session_id} for user {user.id}")
+    return session_id
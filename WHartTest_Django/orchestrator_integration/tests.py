@@ -1,12 +1,23 @@
 """orchestrator_integration单元测试"""
 
-from django.test import TestCase
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
 
-from .models import OrchestratorTask
+from .agent_loop import AgentOrchestrator
+from .journal import AgentPersistenceJournal
+from .models import AgentBlackboard, AgentStep, AgentTask, OrchestratorTask, ToolOutputSummary
+from .runner import run_agent_loop
+from . import tool_summaries
+from .tool_summaries import get_tool_summaries, schedule_tool_summary
 from .graph import create_orchestrator_graph, AgentNodes, OrchestratorState
+from langgraph_integration.models import ChatSession
 from projects.models import Project
 
 User = get_user_model()
@@ -131,3 +142,169 @@ class OrchestratorGraphTest(TestCase):
         self.assertIsNotNone(graph)
         # 验证图可以被编译（不会抛出异常）
         self.assertTrue(hasattr(graph, 'invoke'))
+
+
+class AgentToolExecutionTest(TestCase):
+    """测试 Agent Loop 同一步骤内工具调用的并发执行"""
+
+    def setUp(self):
+        self.events = []
+
+        @tool
+        async def search(query: str) -> str:
+            """搜索"""
+            self.events.append(('start', query))
+            await asyncio.sleep(0.1)
+            self.events.append(('end', query))
+            return query
+
+        @tool
+        async def browser_click(target: str) -> str:
+            """点击"""
+            self.events.append(('start', target))
+            await asyncio.sleep(0.05)
+            self.events.append(('end', target))
+            return target
+
+        self.orchestrator = AgentOrchestrator(llm=Mock(), tools=[search, browser_click], max_tool_concurrency=4)
+
+    def test_independent_calls_run_concurrently_in_original_order(self):
+        """测试独立工具并发执行，结果保持调用顺序"""
+        calls = [
+            {'name': 'search', 'args': {'query': 'a'}},
+            {'name': 'missing', 'args': {}},
+            {'name': 'search', 'args': {'query': 'b'}},
+        ]
+        started = time.monotonic()
+        results = asyncio.run(self.orchestrator._execute_tools(calls))
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.18)
+        self.assertEqual([r.get('output') for r in results], ['a', None, 'b'])
+        self.assertIn('不存在', results[1]['error'])
+
+    def test_stateful_tools_run_sequentially(self):
+        """测试有状态工具（浏览器操作）按原顺序依次执行"""
+        calls = [
+            {'name': 'browser_click', 'args': {'target': 'x'}},
+            {'name': 'browser_click', 'args': {'target': 'y'}},
+        ]
+        with self.settings(AGENT_SEQUENTIAL_TOOLS=['browser_*']):
+            results = asyncio.run(self.orchestrator._execute_tools(calls))
+
+        self.assertEqual([r['output'] for r in results], ['x', 'y'])
+        self.assertEqual(self.events, [('start', 'x'), ('end', 'x'), ('start', 'y'), ('end', 'y')])
+
+
+class ToolOutputSummaryCacheTest(TestCase):
+    """测试工具输出摘要按 tool_call_id + 内容哈希持久化复用"""
+
+    def test_missing_summaries_generated_once(self):
+        """测试首次并发生成缺失摘要，再次加载时不再调用 LLM"""
+        llm = Mock()
+        llm.ainvoke = AsyncMock(side_effect=lambda messages: AIMessage(content=' 摘要 '))
+        outputs = [('step-1', 'a' * 700), ('step-2', 'b' * 700)]
+
+        first = async_to_sync(get_tool_summaries)(llm, outputs, model_name='gpt-4o')
+        second = async_to_sync(get_tool_summaries)(llm, outputs)
+
+        self.assertEqual(llm.ainvoke.await_count, 2)
+        self.assertEqual(first, second)
+        self.assertEqual(set(first.values()), {'摘要'})
+        self.assertEqual(ToolOutputSummary.objects.count(), 2)
+
+
+class AgentPersistenceJournalTest(TestCase):
+    """测试 Agent Loop 写入缓冲"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='journal', password='pass')
+        session, _ = ChatSession.register(user, 'journal-session')
+        self.task = AgentTask.objects.create(session=session, goal='测试')
+        self.blackboard = AgentBlackboard.objects.create(task=self.task)
+        self.journal = AgentPersistenceJournal(flush_interval=3600, max_pending_steps=10)
+
+    def test_buffers_until_task_finishes(self):
+        """测试中间步骤只在内存累积，任务进入终态时一次写入"""
+        async def run_steps():
+            for step_number in (1, 2):
+                self.task.current_step = step_number
+                self.task.status = 'running'
+                self.journal.mark_task(self.task)
+                self.journal.add_step(AgentStep(task=self.task, step_number=step_number))
+                self.blackboard.add_history(f'step {step_number}', save=False)
+                self.journal.mark_blackboard(self.blackboard, 'history_summary')
+                await self.journal.maybe_flush()
+            buffered_steps = await AgentStep.objects.filter(task=self.task).acount()
+
+            self.task.status = 'completed'
+            self.journal.mark_task(self.task)
+            await self.journal.maybe_flush()
+            return buffered_steps
+
+        self.assertEqual(async_to_sync(run_steps)(), 0)
+
+        self.assertEqual(AgentStep.objects.filter(task=self.task).count(), 2)
+        self.task.refresh_from_db()
+        self.blackboard.refresh_from_db()
+        self.assertEqual((self.task.status, self.task.current_step), ('completed', 2))
+        self.assertEqual(self.blackboard.history_summary, ['step 1', 'step 2'])
+        self.assertFalse(self.journal.pending)
+
+
+class AgentLoopRunnerTest(TestCase):
+    """测试进程内执行 Agent Loop"""
+
+    def test_run_agent_loop_passes_event_dicts(self):
+        """测试事件以字典形式回调，不经过 SSE 编码，结束标记被跳过"""
+        user = User.objects.create_user(username='runner', password='pass')
+        project = Project.objects.create(name='Runner Project', creator=user)
+        received = []
+
+        async def fake_generator(view, *args, encode, **kwargs):
+            yield encode({'type': 'step_start', 'step': 1})
+            yield encode({'type': 'stream', 'data': '完成'})
+            yield "data: [DONE]\n\n"
+
+        with patch('orchestrator_integration.agent_loop_view.AgentLoopStreamAPIView._create_stream_generator',
+                   new=fake_generator):
+            session_id = async_to_sync(run_agent_loop)(
+                user, project, '执行测试', session_id='runner-session', on_event=received.append
+            )
+
+        self.assertEqual(session_id, 'runner-session')
+        self.assertEqual(received, [{'type': 'step_start', 'step': 1}, {'type': 'stream', 'data': '完成'}])
+
+    def _run_with_summary(self, delay):
+        user = User.objects.create_user(username='runner', password='pass')
+        project = Project.objects.create(name='Runner Project', creator=user)
+        llm = Mock()
+
+        async def slow_summary(messages):
+            await asyncio.sleep(delay)
+            return AIMessage(content='摘要')
+
+        llm.ainvoke = slow_summary
+
+        async def fake_generator(view, *args, encode, **kwargs):
+            schedule_tool_summary(llm, 'call-1', 'x' * (tool_summaries.SUMMARY_THRESHOLD + 1))
+            yield encode({'type': 'stream', 'data': '完成'})
+
+        with patch('orchestrator_integration.agent_loop_view.AgentLoopStreamAPIView._create_stream_generator',
+                   new=fake_generator):
+            async_to_sync(run_agent_loop)(user, project, '执行测试', session_id='runner-session')
+
+    def test_run_agent_loop_waits_for_background_summaries(self):
+        """测试结束前等待后台工具摘要完成，不遗留到即将关闭的事件循环"""
+        self._run_with_summary(delay=0.01)
+
+        self.assertTrue(ToolOutputSummary.objects.filter(tool_call_id='call-1').exists())
+        self.assertFalse(tool_summaries._background_tasks)
+
+    @override_settings(AGENT_TOOL_SUMMARY_DRAIN_TIMEOUT=0.01)
+    def test_run_agent_loop_cancels_slow_summaries(self):
+        """测试超时未完成的摘要被取消"""
+        self._run_with_summary(delay=5)
+
+        self.assertFalse(ToolOutputSummary.objects.filter(tool_call_id='call-1').exists())
+        self.assertFalse(tool_summaries._background_tasks)
@@ -0,0 +1,143 @@
+"""
+工具输出摘要缓存
+
+长工具输出的 LLM 摘要按 (tool_call_id, 内容哈希) 持久化到 ToolOutputSummary：
+- 工具结果产生时在后台生成并写入一次
+- 加载对话历史时批量读取，缺失的摘要并发生成
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from .models import ToolOutputSummary
+
+logger = logging.getLogger(__name__)
+
+# 超过该长度的工具输出才需要摘要
+SUMMARY_THRESHOLD = 600
+
+# 后台摘要任务的引用，避免任务在完成前被回收
+_background_tasks = set()
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+async def _generate_summary(llm, content: str) -> Optional[str]:
+    """调用 LLM 生成工具输出摘要"""
+    prompt = (
+        "以下是工具输出，请用简洁中文概括关键结论、数据和建议，控制在150字内：\n"
+        f"{content}\n\n"
+        "要求：保留结论和数值，忽略日志、重复细节。"
+    )
+    response = await llm.ainvoke([
+        SystemMessage(content="你擅长压缩冗长的工具返回，只保留要点。"),
+        HumanMessage(content=prompt)
+    ])
+    summary_text = response.content if hasattr(response, "content") else str(response)
+    return summary_text.strip() if summary_text else None
+
+
+def _load_summaries(keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+    tool_call_ids = {tool_call_id for tool_call_id, _ in keys}
+    hashes = {digest for _, digest in keys}
+    rows = ToolOutputSummary.objects.filter(
+        tool_call_id__in=tool_call_ids, content_hash__in=hashes
+    ).values_list('tool_call_id', 'content_hash', 'summary')
+    return {(tool_call_id, digest): summary for tool_call_id, digest, summary in rows}
+
+
+def _save_summaries(summaries: Dict[Tuple[str, str], str], model_name: str):
+    ToolOutputSummary.objects.bulk_create(
+        [
+            ToolOutputSummary(tool_call_id=tool_call_id, content_hash=digest, summary=summary, model_name=model_name)
+            for (tool_call_id, digest), summary in summaries.items()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+async def get_tool_summaries(
+    llm,
+    outputs: Iterable[Tuple[str, str]],
+    model_name: str = '',
+) -> Dict[Tuple[str, str], str]:
+    """
+    获取工具输出摘要
+
+    Args:
+        llm: 生成缺失摘要使用的 LLM
+        outputs: (tool_call_id, 工具输出内容) 列表
+        model_name: 记录生成摘要的模型名称
+
+    Returns:
+        (tool_call_id, 内容哈希) → 摘要；生成失败的条目不在结果中
+    """
+    contents = {(tool_call_id or '', content_hash(content)): content for tool_call_id, content in outputs}
+    if not contents:
+        return {}
+
+    summaries = await sync_to_async(_load_summaries)(list(contents))
+    missing = [key for key in contents if key not in summaries]
+    if not missing:
+        return summaries
+
+    # 缺失的摘要并发生成（LLM 客户端按服务商限制并发）
+    results = await asyncio.gather(
+        *(_generate_summary(llm, contents[key]) for key in missing),
+        return_exceptions=True
+    )
+    generated = {}
+    for key, result in zip(missing, results):
+        if isinstance(result, Exception):
+            logger.warning(f"AgentLoopStreamAPI: tool summary failed: {result}")
+        elif result:
+            generated[key] = result
+
+    if generated:
+        try:
+            await sync_to_async(_save_summaries)(generated, model_name)
+        except Exception as e:
+            logger.warning(f"AgentLoopStreamAPI: failed to save tool summaries: {e}")
+        summaries.update(generated)
+    logger.info(f"AgentLoopStreamAPI: tool summaries cached={len(contents) - len(missing)}, generated={len(generated)}")
+    return summaries
+
+
+def schedule_tool_summary(llm, tool_call_id: str, content: str, model_name: str = ''):
+    """工具结果产生时在后台生成并保存摘要，不阻塞当前流式输出"""
+    if not llm or len(content) <= SUMMARY_THRESHOLD:
+        return
+    task = asyncio.get_running_loop().create_task(
+        get_tool_summaries(llm, [(tool_call_id, content)], model_name=model_name)
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def drain_tool_summaries(timeout: Optional[float] = None) -> int:
+    """
+    等待当前事件循环中的后台摘要任务完成，超时未完成的任务被取消
+
+    在即将关闭的临时事件循环（如 Celery 任务中运行的 Agent Loop）结束前调用，
+    避免摘要请求白费、在已关闭的 LLM 客户端上执行或随事件循环一起被销毁
+
+    Returns:
+        被取消的任务数量
+    """
+    loop = asyncio.get_running_loop()
+    pending = [task for task in _background_tasks if task.get_loop() is loop and not task.done()]
+    if not pending:
+        return 0
+    _, not_done = await asyncio.wait(pending, timeout=timeout)
+    for task in not_done:
+        task.cancel()
+    if not_done:
+        await asyncio.gather(*not_done, return_exceptions=True)
+        logger.warning(f"AgentLoopStreamAPI: cancelled {len(not_done)} unfinished tool summaries")
+    return len(not_done)
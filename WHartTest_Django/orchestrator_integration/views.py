@@ -3,7 +3,6 @@
 import json
 import logging
 import uuid
-import asyncio
 import os
 from django.views import View
 from django.http import StreamingHttpResponse
@@ -205,6 +204,14 @@ class OrchestratorStreamAPIView(View):
                     thread_id_parts.append(str(session_id))
                 thread_id = "_".join(thread_id_parts)
                 logger.info(f"OrchestratorStream: Using thread_id: {thread_id}")
+                if session_id:
+                    # 登记会话，使其出现在会话列表中
+                    await sync_to_async(ChatSession.register)(
+                        user=request.user,
+                        session_id=str(session_id),
+                        project=project,
+                        title=f"新对话 - {user_message_content[:30]}"
+                    )
                 
                 # 6. 构建输入状态（只包含新消息，checkpointer会自动合并历史）
                 from langchain_core.messages import HumanMessage
@@ -507,9 +514,6 @@ class OrchestratorStreamAPIView(View):
                             # 🔧 修复：检查node_output是否为None或dict
                             if node_output and isinstance(node_output, dict):
                                 final_state.update(node_output)
-                        
-                        # 添加小延迟以确保流式传输效果
-                        await asyncio.sleep(0.01)
                 
                 except Exception as e:
                     logger.error(f"OrchestratorStream: Error during streaming: {e}", exc_info=True)
@@ -2,8 +2,13 @@
 模型上下文限制配置和检测
 """
 
+import hashlib
+import threading
+from collections import OrderedDict
+
 import tiktoken
 import logging
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
@@ -44,8 +49,18 @@ RESERVED_TOKENS = 1000
 class ContextLimitChecker:
     """上下文限制检测器"""
     
-    def __init__(self):
+    def __init__(self, token_cache_size: int = None):
         self.encoders = {}
+        # Token 数缓存：(编码器名, 文本哈希) → token 数
+        # 对话历史中的消息每轮都会重新计数，缓存后只有新消息需要编码
+        self.token_cache_size = (
+            token_cache_size if token_cache_size is not None
+            else getattr(settings, 'CONTEXT_TOKEN_CACHE_SIZE', 10000)
+        )
+        self._token_cache = OrderedDict()
+        self._token_cache_lock = threading.Lock()
+        self.token_cache_hits = 0
+        self.token_cache_misses = 0
     
     def get_encoder(self, model_name: str):
         """获取对应模型的编码器"""
@@ -64,10 +79,27 @@ class ContextLimitChecker:
         return self.encoders[model_name]
     
     def count_tokens(self, text: str, model_name: str = 'gpt-3.5-turbo') -> int:
-        """计算文本的token数量"""
+        """计算文本的token数量（按编码器 + 文本哈希缓存）"""
         try:
             encoder = self.get_encoder(model_name)
-            return len(encoder.encode(text))
+            if self.token_cache_size <= 0:
+                return len(encoder.encode(text))
+
+            key = (encoder.name, hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest())
+            with self._token_cache_lock:
+                count = self._token_cache.get(key)
+                if count is not None:
+                    self._token_cache.move_to_end(key)
+                    self.token_cache_hits += 1
+                    return count
+                self.token_cache_misses += 1
+
+            count = len(encoder.encode(text))
+            with self._token_cache_lock:
+                self._token_cache[key] = count
+                while len(self._token_cache) > self.token_cache_size:
+                    self._token_cache.popitem(last=False)
+            return count
         except Exception as e:
             logger.error(f"计算token数量失败: {e}")
             # 粗略估算：中文约1.5字符/token，英文约4字符/token
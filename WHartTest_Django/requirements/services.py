@@ -4,10 +4,10 @@ import re
 from string import Template
 from typing import List, Dict, Any, Optional
 from django.conf import settings
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langgraph_integration.models import LLMConfig
+from langgraph_integration.llm_clients import get_llm_client
 from .models import RequirementDocument, RequirementModule, DocumentImage
 from prompts.models import UserPrompt
 
@@ -16,25 +16,10 @@ logger = logging.getLogger(__name__)
 
 def create_llm_instance(active_config, temperature=0.1):
     """
-    根据配置创建LLM实例
+    根据配置获取LLM实例（进程内按配置复用，共享 HTTP 连接）
     统一使用OpenAI兼容格式，支持所有兼容的服务商
     """
-    model_identifier = active_config.name or "gpt-3.5-turbo"
-    
-    llm_kwargs = {
-        "model": model_identifier,
-        "temperature": temperature,
-        "api_key": active_config.api_key,
-        "base_url": active_config.api_url,
-        "max_retries": 3,
-        "timeout": 120,
-    }
-    llm = ChatOpenAI(**llm_kwargs)
-    logger.info(f"Initialized OpenAI-compatible LLM with model: {model_identifier}, base_url: {active_config.api_url}")
-    
-    return llm
-    
-    return llm
+    return get_llm_client(active_config, temperature=temperature, max_retries=3, timeout=120)
 
 
 def safe_llm_invoke(llm, messages, max_retries=3, retry_delay=2):
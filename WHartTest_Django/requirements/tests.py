@@ -1,3 +1,35 @@
+from unittest.mock import Mock, patch
+
 from django.test import TestCase
 
-# Create your tests here.
+from .context_limits import ContextLimitChecker
+
+
+class TokenCountCacheTest(TestCase):
+    """测试 Token 计数按编码器 + 内容哈希缓存"""
+
+    def setUp(self):
+        self.checker = ContextLimitChecker(token_cache_size=2)
+        self.encoder = Mock()
+        self.encoder.name = 'cl100k_base'
+        self.encoder.encode.side_effect = lambda text: list(text)
+        patcher = patch.object(self.checker, 'get_encoder', return_value=self.encoder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_text_encoded_once(self):
+        """测试相同文本只编码一次，共用编码器的模型共享缓存"""
+        self.assertEqual(self.checker.count_tokens('你好，世界', 'qwen'), 5)
+        self.assertEqual(self.checker.count_tokens('你好，世界', 'qwen'), 5)
+        self.assertEqual(self.checker.count_tokens('你好，世界', 'llama3'), 5)
+
+        self.encoder.encode.assert_called_once_with('你好，世界')
+        self.assertEqual((self.checker.token_cache_hits, self.checker.token_cache_misses), (2, 1))
+
+    def test_cache_is_bounded(self):
+        """测试超过容量时淘汰最久未使用的条目"""
+        for text in ('a', 'b', 'c', 'a'):
+            self.checker.count_tokens(text, 'qwen')
+
+        self.assertEqual(len(self.checker._token_cache), 2)
+        self.assertEqual(self.encoder.encode.call_count, 4)
@@ -0,0 +1,97 @@
+"""
+测试执行取消信号
+
+取消请求由 Web 进程写入共享缓存（默认使用 Celery broker 所在的 Redis），
+执行测试的 Celery worker 通过 CancellationWatcher 读取，无需轮询数据库：
+- 视图/取消任务调用 set_cancel_signal(execution_id)
+- 执行循环内由 CancellationWatcher 定期读取信号，收到后立即取消正在执行的任务
+"""
+import asyncio
+import logging
+from typing import Optional, Set
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def _cache():
+    return caches[getattr(settings, 'TEST_EXECUTION_SIGNAL_CACHE', 'default')]
+
+
+def _key(execution_id) -> str:
+    return f"testcases:execution:{execution_id}:cancel"
+
+
+def set_cancel_signal(execution_id) -> bool:
+    """写入取消信号，返回是否写入成功"""
+    try:
+        _cache().set(_key(execution_id), 1, timeout=getattr(settings, 'TEST_EXECUTION_SIGNAL_TTL', 86400))
+        logger.info(f"[CancelSignal] Set cancel signal for execution: {execution_id}")
+        return True
+    except Exception as e:
+        logger.warning(f"[CancelSignal] Failed to set cancel signal for execution {execution_id}: {e}")
+        return False
+
+
+def is_cancelled(execution_id) -> bool:
+    """检查是否已收到取消信号（缓存不可用时视为未取消）"""
+    try:
+        return bool(_cache().get(_key(execution_id)))
+    except Exception as e:
+        logger.warning(f"[CancelSignal] Failed to read cancel signal for execution {execution_id}: {e}")
+        return False
+
+
+class CancellationWatcher:
+    """
+    在执行循环中监听取消信号
+
+    收到信号后设置 cancelled 事件，并取消所有已登记的正在执行的 asyncio 任务
+    """
+
+    def __init__(self, execution_id, interval: Optional[float] = None):
+        self.execution_id = execution_id
+        self.interval = (
+            interval if interval is not None
+            else getattr(settings, 'TEST_EXECUTION_CANCEL_CHECK_INTERVAL', 1.0)
+        )
+        self.cancelled = asyncio.Event()
+        self._running: Set[asyncio.Task] = set()
+        self._watch_task: Optional[asyncio.Task] = None
+
+    def register(self, task: asyncio.Task):
+        """登记正在执行的任务；已取消时立即取消该任务"""
+        if self.cancelled.is_set():
+            task.cancel()
+            return
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _watch(self):
+        while not self.cancelled.is_set():
+            await asyncio.sleep(self.interval)
+            if await sync_to_async(is_cancelled)(self.execution_id):
+                logger.info(f"[CancelSignal] Execution {self.execution_id} cancelled, "
+                            f"interrupting {len(self._running)} running task(s)")
+                self.cancelled.set()
+                for task in list(self._running):
+                    task.cancel()
+                return
+
+    async def __aenter__(self):
+        # 进入时先检查一次，已取消的执行（如分布式执行的后续分片）不再启动任何任务
+        if await sync_to_async(is_cancelled)(self.execution_id):
+            self.cancelled.set()
+        self._watch_task = asyncio.create_task(self._watch())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,70 @@
+"""
+Django管理命令：脚本执行池并发基准测试
+
+用 N 个固定耗时的脚本模拟测试套件，比较不同并发数下的总耗时
+"""
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from testcases.script_executor import ScriptExecutionPool
+
+
+class Command(BaseCommand):
+    help = '测试脚本执行池在不同并发数下的总耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scripts',
+            type=int,
+            default=50,
+            help='模拟套件中的脚本数量（默认 50）',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=0.5,
+            help='每个脚本的执行时长（秒，默认 0.5）',
+        )
+        parser.add_argument(
+            '--concurrency',
+            default='1,2,5,10',
+            help='逗号分隔的并发数列表（默认 1,2,5,10）',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',') if level.strip()]
+        except ValueError:
+            raise CommandError('--concurrency 必须是逗号分隔的整数')
+        if not levels or min(levels) < 1:
+            raise CommandError('--concurrency 必须是正整数')
+
+        script_count = options['scripts']
+        script_content = f"import time\ntime.sleep({options['duration']})\n"
+
+        self.stdout.write(self.style.SUCCESS(f'🚀 脚本执行池基准测试: {script_count} 个脚本, 每个 {options["duration"]} 秒'))
+        self.stdout.write(f"{'并发数':>8} {'总耗时(秒)':>12} {'加速比':>8} {'失败数':>8}")
+
+        baseline = None
+        for level in levels:
+            elapsed, failures = asyncio.run(self._run_suite(script_content, script_count, level))
+            baseline = baseline or elapsed
+            self.stdout.write(f'{level:>8} {elapsed:>12.2f} {baseline / elapsed:>8.2f} {failures:>8}')
+
+    @staticmethod
+    async def _run_suite(script_content: str, script_count: int, max_concurrent: int):
+        """与 _execute_tasks_concurrently 相同：信号量限制并发，脚本在执行池中运行"""
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        with ScriptExecutionPool(max_workers=max_concurrent) as pool:
+            async def run_one():
+                async with semaphore:
+                    return await pool.run(script_content, timeout_seconds=60, use_pytest=False)
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(run_one() for _ in range(script_count)))
+            elapsed = time.perf_counter() - started
+
+        return elapsed, sum(1 for result in results if not result['success'])
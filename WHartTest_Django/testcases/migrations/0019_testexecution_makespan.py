@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('testcases', '0018_alter_testcase_review_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testexecution',
+            name='actual_makespan',
+            field=models.FloatField(blank=True, null=True, verbose_name='实际总耗时(秒)'),
+        ),
+        migrations.AddField(
+            model_name='testexecution',
+            name='baseline_makespan',
+            field=models.FloatField(blank=True, help_text='按优先级顺序执行时估算的总耗时，用于对比调度收益', null=True, verbose_name='默认顺序预计总耗时(秒)'),
+        ),
+        migrations.AddField(
+            model_name='testexecution',
+            name='estimated_makespan',
+            field=models.FloatField(blank=True, help_text='按历史耗时与最长优先调度估算的执行总耗时', null=True, verbose_name='预计总耗时(秒)'),
+        ),
+    ]
@@ -345,6 +345,21 @@ class TestExecution(models.Model):
         help_text=_('执行功能测试用例时是否自动生成Playwright脚本')
     )
 
+    # 调度：按历史耗时估算的总耗时与实际总耗时（秒）
+    estimated_makespan = models.FloatField(
+        _('预计总耗时(秒)'),
+        null=True,
+        blank=True,
+        help_text=_('按历史耗时与最长优先调度估算的执行总耗时')
+    )
+    baseline_makespan = models.FloatField(
+        _('默认顺序预计总耗时(秒)'),
+        null=True,
+        blank=True,
+        help_text=_('按优先级顺序执行时估算的总耗时，用于对比调度收益')
+    )
+    actual_makespan = models.FloatField(_('实际总耗时(秒)'), null=True, blank=True)
+
     created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
     updated_at = models.DateTimeField(_('更新时间'), auto_now=True)
     
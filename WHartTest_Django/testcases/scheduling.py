@@ -0,0 +1,118 @@
+"""
+测试套件调度
+
+按历史执行耗时估算每个用例/脚本的运行时间：
+- 最长优先（LPT）：耗时长的任务先启动，避免长任务最后启动拖长总耗时
+- 分布式执行时按 LPT 将任务分配到各执行通道，使各通道负载均衡
+- 估算给定顺序与并发数下的总耗时（makespan），用于与实际耗时对比
+"""
+import heapq
+import statistics
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import ScriptExecution, TestCaseResult
+
+# 只有正常跑完的执行耗时可代表用例时长；错误、跳过、取消的记录耗时失真
+FINISHED_STATUSES = ('pass', 'fail')
+
+
+def _history_medians(queryset, key_field: str, keys, history: int) -> Dict[int, float]:
+    """每个 key 最近 history 次通过/失败执行耗时的中位数（按 key 分别取最近记录）"""
+    samples = defaultdict(list)
+    rows = (
+        queryset.filter(
+            **{f'{key_field}__in': keys},
+            status__in=FINISHED_STATUSES,
+            execution_time__isnull=False,
+        )
+        .annotate(recent_rank=Window(
+            RowNumber(),
+            partition_by=[F(key_field)],
+            order_by=[F('completed_at').desc(nulls_last=True), F('id').desc()],
+        ))
+        .filter(recent_rank__lte=history)
+        .values_list(key_field, 'execution_time')
+    )
+    for key, execution_time in rows:
+        samples[key].append(execution_time)
+    return {key: statistics.median(values) for key, values in samples.items()}
+
+
+def estimate_task_durations(tasks_list, history: int = None, default: float = None) -> List[float]:
+    """
+    根据历史执行耗时估算每个任务的运行时间（秒）
+
+    Args:
+        tasks_list: TestCaseResult 或 ScriptExecution 列表
+        history: 每个用例/脚本参考的最近执行次数
+        default: 没有任何历史记录时使用的估算值
+
+    Returns:
+        与 tasks_list 一一对应的估算耗时；无历史记录的任务使用已知估算的中位数
+    """
+    history = history or getattr(settings, 'TEST_SUITE_DURATION_HISTORY', 10)
+    default = default if default is not None else getattr(settings, 'TEST_SUITE_DEFAULT_TASK_DURATION', 60.0)
+
+    testcase_ids = {task_obj.testcase_id for task_obj in tasks_list if isinstance(task_obj, TestCaseResult)}
+    script_ids = {task_obj.script_id for task_obj in tasks_list if isinstance(task_obj, ScriptExecution)}
+    current_case_ids = [task_obj.id for task_obj in tasks_list if isinstance(task_obj, TestCaseResult)]
+    current_script_ids = [task_obj.id for task_obj in tasks_list if isinstance(task_obj, ScriptExecution)]
+
+    case_estimates = _history_medians(
+        TestCaseResult.objects.exclude(id__in=current_case_ids), 'testcase_id', list(testcase_ids), history
+    ) if testcase_ids else {}
+    script_estimates = _history_medians(
+        ScriptExecution.objects.exclude(id__in=current_script_ids), 'script_id', list(script_ids), history
+    ) if script_ids else {}
+
+    known = list(case_estimates.values()) + list(script_estimates.values())
+    fallback = statistics.median(known) if known else default
+
+    durations = []
+    for task_obj in tasks_list:
+        if isinstance(task_obj, TestCaseResult):
+            durations.append(case_estimates.get(task_obj.testcase_id, fallback))
+        else:
+            durations.append(script_estimates.get(task_obj.script_id, fallback))
+    return durations
+
+
+def longest_first(durations: Sequence[float]) -> List[int]:
+    """按估算耗时从长到短排序的下标（耗时相同保持原顺序）"""
+    return sorted(range(len(durations)), key=lambda index: -durations[index])
+
+
+def estimate_makespan(durations: Sequence[float], workers: int) -> float:
+    """
+    估算按给定顺序、workers 个并发名额执行的总耗时
+
+    与信号量调度一致：每个任务在最早空出的名额上启动
+    """
+    if not durations:
+        return 0.0
+    slots = [0.0] * max(1, min(workers, len(durations)))
+    for duration in durations:
+        heapq.heapreplace(slots, slots[0] + duration)
+    return max(slots)
+
+
+def assign_lanes(durations: Sequence[float], lanes: int) -> List[List[int]]:
+    """
+    LPT 分配：按耗时从长到短，依次分配给当前负载最小的通道
+
+    Returns:
+        每个通道的任务下标列表（通道内从长到短）；空通道不返回
+    """
+    lane_count = max(1, min(lanes, len(durations)))
+    loads = [(0.0, lane) for lane in range(lane_count)]
+    assigned = [[] for _ in range(lane_count)]
+    for index in longest_first(durations):
+        load, lane = heapq.heappop(loads)
+        assigned[lane].append(index)
+        heapq.heappush(loads, (load + durations[index], lane))
+    return [lane for lane in assigned if lane]
@@ -5,6 +5,7 @@ Playwright 脚本执行器
 """
 from __future__ import annotations
 
+import asyncio
 import subprocess
 import sys
 import tempfile
@@ -13,6 +14,7 @@ import re
 import shutil
 import logging
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, TYPE_CHECKING
 from datetime import datetime
@@ -54,6 +56,16 @@ class ScriptExecutor:
         self.work_dir = work_dir or tempfile.mkdtemp(prefix='playwright_')
         self.timeout_seconds = timeout_seconds
         self.browser_type = browser_type
+        self._process: Optional[subprocess.Popen] = None
+        self._terminated = False
+    
+    def terminate(self):
+        """终止正在执行的脚本子进程（测试执行被取消时调用，可在其他线程中调用）"""
+        self._terminated = True
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.kill()
+            logger.info("[ScriptExecutor] 已终止脚本子进程")
     
     def _inject_headless_setting(self, script_content: str, headless: bool) -> str:
         """
@@ -190,35 +202,54 @@ class ScriptExecutor:
             start_time = datetime.now()
             logger.info(f"[ScriptExecutor] 开始执行, 超时时间: {self.timeout_seconds}秒")
             
-            process = subprocess.run(
+            if self._terminated:
+                raise RuntimeError('执行已取消')
+            
+            process = subprocess.Popen(
                 cmd,
-                capture_output=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
                 text=True,
                 encoding='utf-8',
                 errors='replace',
-                timeout=self.timeout_seconds,
                 cwd=self.work_dir,
                 env=env
             )
+            self._process = process
+            if self._terminated:
+                # 启动子进程期间收到终止请求
+                process.kill()
+            try:
+                stdout, stderr = process.communicate(timeout=self.timeout_seconds)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise
+            finally:
+                self._process = None
             
             end_time = datetime.now()
             
-            result['output'] = process.stdout or ''
+            result['output'] = stdout or ''
             result['execution_time'] = (end_time - start_time).total_seconds()
             result['completed_at'] = timezone.now()
             
             logger.info(f"[ScriptExecutor] 执行完成, 返回码: {process.returncode}, 耗时: {result['execution_time']:.2f}秒")
             logger.info(f"[ScriptExecutor] 标准输出({len(result['output'])}字符):\n{result['output']}")
-            if process.stderr:
-                logger.info(f"[ScriptExecutor] 标准错误({len(process.stderr)}字符):\n{process.stderr}")
+            if stderr:
+                logger.info(f"[ScriptExecutor] 标准错误({len(stderr)}字符):\n{stderr}")
             
-            if process.returncode == 0:
+            if self._terminated:
+                result['error_message'] = '执行已取消'
+                result['stack_trace'] = stderr
+                logger.info("[ScriptExecutor] 执行已取消")
+            elif process.returncode == 0:
                 result['success'] = True
                 logger.info("[ScriptExecutor] ✅ 执行成功")
             else:
-                result['error_message'] = process.stderr or '执行失败'
-                result['stack_trace'] = process.stderr
-                logger.error(f"[ScriptExecutor] ❌ 执行失败, stderr:\n{process.stderr}")
+                result['error_message'] = stderr or '执行失败'
+                result['stack_trace'] = stderr
+                logger.error(f"[ScriptExecutor] ❌ 执行失败, stderr:\n{stderr}")
             
             # 收集截图并移动到持久化目录
             result['screenshots'] = self._persist_screenshots()
@@ -316,6 +347,74 @@ class ScriptExecutor:
             shutil.rmtree(self.work_dir, ignore_errors=True)
 
 
+
+class ScriptExecutionPool:
+    """
+    脚本执行池：在专用线程池中并发执行脚本子进程
+
+    每个脚本在独立的 ScriptExecutor（独立临时目录）中运行，子进程等待期间不占用 GIL，
+    同时运行的脚本数即线程池大小。池内线程不访问数据库，执行记录由调用方保存
+    """
+
+    def __init__(self, max_workers: int = 1):
+        self.max_workers = max(1, max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='script-exec')
+
+    @staticmethod
+    def _execute(
+        executor: ScriptExecutor,
+        script_content: str,
+        use_pytest: bool,
+        headless: bool,
+        record_video: bool
+    ) -> dict:
+        try:
+            return executor.execute_script(
+                script_content=script_content,
+                use_pytest=use_pytest,
+                headless=headless,
+                record_video=record_video
+            )
+        finally:
+            # 截图/视频已持久化，清理临时目录
+            executor.cleanup()
+
+    async def run(
+        self,
+        script_content: str,
+        timeout_seconds: int = 300,
+        browser_type: str = 'chromium',
+        use_pytest: bool = True,
+        headless: bool = True,
+        record_video: bool = False
+    ) -> dict:
+        """
+        在池中执行脚本，返回 ScriptExecutor.execute_script 的结果字典
+
+        调用方任务被取消时终止脚本子进程
+        """
+        executor = ScriptExecutor(timeout_seconds=timeout_seconds, browser_type=browser_type)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._pool,
+                self._execute,
+                executor, script_content, use_pytest, headless, record_video
+            )
+        except asyncio.CancelledError:
+            executor.terminate()
+            raise
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+
+
 def _cleanup_old_executions(script, max_executions: int = 15):
     """
     清理旧的执行记录，只保留最新的 max_executions 条
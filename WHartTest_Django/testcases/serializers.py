@@ -531,12 +531,14 @@ class TestExecutionSerializer(serializers.ModelSerializer):
             'started_at', 'completed_at', 'total_count', 'passed_count',
             'failed_count', 'skipped_count', 'error_count', 'celery_task_id',
             'duration', 'pass_rate', 'results', 'script_results',
+            'estimated_makespan', 'baseline_makespan', 'actual_makespan',
             'generate_playwright_script', 'created_at', 'updated_at'
         ]
         read_only_fields = [
             'id', 'status', 'started_at', 'completed_at',
             'total_count', 'passed_count', 'failed_count', 'skipped_count',
             'error_count', 'celery_task_id', 'duration', 'pass_rate',
+            'estimated_makespan', 'baseline_makespan', 'actual_makespan',
             'created_at', 'updated_at'
         ]
 
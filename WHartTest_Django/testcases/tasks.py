@@ -4,26 +4,61 @@
 import logging
 import asyncio
 import re
-from celery import shared_task
+from celery import chain, chord, group, shared_task
 from django.utils import timezone
-from django.db import transaction
-from datetime import datetime
+from django.db.models import Count, F
+from datetime import datetime, timedelta
 from typing import Dict, Any
 from django.conf import settings
 import os
 import json
 import uuid
-import httpx
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import TestExecution, TestSuite, TestCaseResult, TestCase, ScriptExecution
 from prompts.models import UserPrompt, PromptType
 from asgiref.sync import sync_to_async
-from .script_executor import execute_automation_script
+from .script_executor import ScriptExecutionPool, execute_automation_script
+from .cancellation import CancellationWatcher, set_cancel_signal
+from .scheduling import assign_lanes, estimate_makespan, estimate_task_durations, longest_first
+from langgraph_integration.llm_clients import release_loop_clients
+from wharttest_django.checkpointer import release_loop_checkpointer
+from orchestrator_integration.runner import run_agent_loop
 
 logger = logging.getLogger(__name__)
 
 
+def _cancel_pending_tasks(loop):
+    """取消循环中遗留的后台任务并等待其结束（与 asyncio.run 的收尾方式一致）"""
+    pending = [task for task in asyncio.all_tasks(loop) if not task.done()]
+    if not pending:
+        return
+    logger.warning(f"事件循环关闭前仍有 {len(pending)} 个未完成的后台任务，已取消")
+    for task in pending:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+
+def _run_in_new_loop(coro):
+    """
+    在新建的事件循环中运行协程（Celery 任务中使用）
+    
+    循环关闭前取消遗留的后台任务，再释放该循环中创建的 LLM 客户端与 Checkpointer 连接池，
+    避免每次任务泄漏事件循环与连接
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        _cancel_pending_tasks(loop)
+        for release in (release_loop_clients, release_loop_checkpointer):
+            try:
+                release(loop)
+            except Exception as e:
+                logger.warning(f"释放事件循环资源失败: {e}")
+        loop.close()
+
+
 @shared_task(bind=True, name='testcases.execute_test_suite')
 def execute_test_suite(self, execution_id):
     """
@@ -85,40 +120,18 @@ def execute_test_suite(self, execution_id):
         max_concurrent = suite.max_concurrent_tasks
         logger.info(f"并发配置: {max_concurrent} 个任务同时执行")
         
+        # 按历史耗时调度：耗时长的任务先启动
+        all_tasks, durations = _schedule_tasks(execution, all_tasks, max_concurrent)
+        
+        # 大套件分发到多个 worker 执行，由 chord 回调汇总结果
+        threshold = getattr(settings, 'TEST_SUITE_DISTRIBUTED_THRESHOLD', 0)
+        if threshold and len(all_tasks) >= threshold:
+            return _dispatch_distributed_execution(execution, all_tasks, max_concurrent, durations)
+        
         # 使用asyncio执行并发测试
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            loop.run_until_complete(
-                _execute_tasks_concurrently(execution, all_tasks, max_concurrent)
-            )
-        finally:
-            loop.close()
-        
-        # 更新执行记录为已完成
-        execution.refresh_from_db()
-        execution.status = 'completed' if execution.status != 'cancelled' else 'cancelled'
-        execution.completed_at = timezone.now()
-        execution.save(update_fields=['status', 'completed_at', 'updated_at'])
-        
-        logger.info(f"测试套件执行完成: {suite.name}, "
-                   f"通过: {execution.passed_count}, "
-                   f"失败: {execution.failed_count}, "
-                   f"错误: {execution.error_count}, "
-                   f"跳过: {execution.skipped_count}")
-        
-        return {
-            'execution_id': execution.id,
-            'suite_name': suite.name,
-            'status': execution.status,
-            'total': execution.total_count,
-            'passed': execution.passed_count,
-            'failed': execution.failed_count,
-            'skipped': execution.skipped_count,
-            'error': execution.error_count,
-            'pass_rate': execution.pass_rate,
-            'duration': execution.duration
-        }
+        _run_in_new_loop(_execute_tasks_concurrently(execution, all_tasks, max_concurrent))
+        
+        return _complete_execution(execution)
         
     except TestExecution.DoesNotExist:
         error_msg = f"测试执行记录不存在: {execution_id}"
@@ -141,9 +154,267 @@ def execute_test_suite(self, execution_id):
         return {'error': error_msg}
 
 
+def _complete_execution(execution):
+    """
+    将执行记录标记为已完成（已取消的保持取消状态），返回执行结果摘要
+    """
+    execution.refresh_from_db()
+    execution.status = 'completed' if execution.status != 'cancelled' else 'cancelled'
+    execution.completed_at = timezone.now()
+    execution.actual_makespan = execution.duration
+    execution.save(update_fields=['status', 'completed_at', 'actual_makespan', 'updated_at'])
+    
+    suite = execution.suite
+    logger.info(f"测试套件执行完成: {suite.name}, "
+               f"通过: {execution.passed_count}, "
+               f"失败: {execution.failed_count}, "
+               f"错误: {execution.error_count}, "
+               f"跳过: {execution.skipped_count}")
+    
+    return {
+        'execution_id': execution.id,
+        'suite_name': suite.name,
+        'status': execution.status,
+        'total': execution.total_count,
+        'passed': execution.passed_count,
+        'failed': execution.failed_count,
+        'skipped': execution.skipped_count,
+        'error': execution.error_count,
+        'pass_rate': execution.pass_rate,
+        'duration': execution.duration,
+        'estimated_makespan': execution.estimated_makespan,
+        'actual_makespan': execution.actual_makespan
+    }
+
+
+def _schedule_tasks(execution, tasks_list, max_concurrent):
+    """
+    按历史执行耗时调度任务，并记录预计总耗时
+    
+    Returns:
+        (调度后的任务列表, 对应的估算耗时)；未启用最长优先调度或估算失败时估算耗时为 None
+    """
+    try:
+        durations = estimate_task_durations(tasks_list)
+    except Exception as e:
+        logger.warning(f"估算任务耗时失败，按默认顺序执行: {e}")
+        return tasks_list, None
+    
+    execution.baseline_makespan = estimate_makespan(durations, max_concurrent)
+    if getattr(settings, 'TEST_SUITE_LPT_SCHEDULING', True):
+        order = longest_first(durations)
+        tasks_list = [tasks_list[index] for index in order]
+        durations = [durations[index] for index in order]
+        execution.estimated_makespan = estimate_makespan(durations, max_concurrent)
+    else:
+        execution.estimated_makespan = execution.baseline_makespan
+        durations = None
+    execution.save(update_fields=['estimated_makespan', 'baseline_makespan', 'updated_at'])
+    
+    logger.info(f"调度预估总耗时: {execution.estimated_makespan:.1f}秒 "
+               f"(默认顺序: {execution.baseline_makespan:.1f}秒)")
+    return tasks_list, durations
+
+
+def _build_execution_lanes(items, max_concurrent, shard_size, durations=None):
+    """
+    将待执行任务划分为执行通道
+    
+    通道数不超过套件并发数；每个通道按顺序执行其分片，
+    因此整个集群中同时执行的任务数不会超过套件并发数
+    
+    Args:
+        items: 待执行任务列表（保持调度顺序）
+        max_concurrent: 套件最大并发数
+        shard_size: 每个分片（一个 Celery 任务）包含的任务数
+        durations: 各任务的估算耗时；提供时按 LPT 均衡各通道负载，否则轮流分配
+    
+    Returns:
+        通道列表，每个通道是分片列表
+    """
+    lane_count = max(1, min(max_concurrent, len(items)))
+    shard_size = max(1, shard_size)
+    if durations is not None:
+        lanes = [[items[index] for index in lane] for lane in assign_lanes(durations, lane_count)]
+    else:
+        lanes = [items[index::lane_count] for index in range(lane_count)]
+    return [
+        [lane[start:start + shard_size] for start in range(0, len(lane), shard_size)]
+        for lane in lanes if lane
+    ]
+
+
+def _dispatch_distributed_execution(execution, tasks_list, max_concurrent, durations=None):
+    """
+    分布式执行：每个通道是分片任务组成的 chain，所有通道组成 chord，
+    分片任务由任意空闲 worker 执行，全部完成后由 finalize_test_execution 汇总
+    """
+    items = [
+        ['case', task_obj.id] if isinstance(task_obj, TestCaseResult) else ['script', task_obj.id]
+        for task_obj in tasks_list
+    ]
+    lanes = _build_execution_lanes(
+        items, max_concurrent, getattr(settings, 'TEST_SUITE_SHARD_SIZE', 1), durations
+    )
+    header = group([
+        chain(*[execute_execution_shard.si(execution.id, shard) for shard in lane])
+        for lane in lanes
+    ])
+    # 分片失败（超时被终止、worker 丢失等）时 chord 回调不会执行，由错误回调将执行标记为失败
+    callback = finalize_test_execution.si(execution.id).on_error(fail_test_execution.s(execution.id))
+    chord(header)(callback)
+    
+    shard_count = sum(len(lane) for lane in lanes)
+    logger.info(f"测试套件分布式执行: {len(items)} 个任务, {len(lanes)} 个通道, {shard_count} 个分片")
+    return {
+        'execution_id': execution.id,
+        'status': 'running',
+        'distributed': True,
+        'lanes': len(lanes),
+        'shards': shard_count
+    }
+
+
+@shared_task(name='testcases.execute_execution_shard')
+def execute_execution_shard(execution_id, items):
+    """
+    执行一个分片中的任务（分布式执行模式），分片内任务依次执行
+    
+    Args:
+        execution_id: TestExecution实例的ID
+        items: [类型, ID] 列表，类型为 'case'（TestCaseResult）或 'script'（ScriptExecution）
+    
+    单个任务失败只记录到对应结果，不向上抛出，保证 chord 回调一定执行
+    """
+    try:
+        execution = TestExecution.objects.get(id=execution_id)
+        case_ids = [item_id for kind, item_id in items if kind == 'case']
+        script_ids = [item_id for kind, item_id in items if kind == 'script']
+        results = TestCaseResult.objects.select_related('testcase').in_bulk(case_ids)
+        scripts = ScriptExecution.objects.select_related('script').in_bulk(script_ids)
+        tasks_list = [
+            results.get(item_id) if kind == 'case' else scripts.get(item_id)
+            for kind, item_id in items
+        ]
+        tasks_list = [task_obj for task_obj in tasks_list if task_obj is not None]
+        
+        _run_in_new_loop(_execute_tasks_concurrently(execution, tasks_list, 1))
+        return len(tasks_list)
+    
+    except Exception as e:
+        logger.error(f"执行测试分片失败: execution={execution_id}, items={items}, 错误: {e}", exc_info=True)
+        return 0
+
+
+def _recount_execution(execution_id):
+    """
+    按结果记录重新统计执行计数（分布式执行的汇总，不受分片重试影响）
+    """
+    counts = {'pass': 0, 'fail': 0, 'skip': 0, 'error': 0}
+    rows = list(
+        TestCaseResult.objects.filter(execution_id=execution_id)
+        .values('status').annotate(count=Count('id'))
+    ) + list(
+        ScriptExecution.objects.filter(test_execution_id=execution_id)
+        .values('status').annotate(count=Count('id'))
+    )
+    for row in rows:
+        # 等待中/执行中/已取消的记录不计入
+        if row['status'] in counts:
+            counts[row['status']] += row['count']
+    
+    TestExecution.objects.filter(id=execution_id).update(
+        passed_count=counts['pass'],
+        failed_count=counts['fail'],
+        skipped_count=counts['skip'],
+        error_count=counts['error'],
+        updated_at=timezone.now()
+    )
+
+
+@shared_task(name='testcases.finalize_test_execution')
+def finalize_test_execution(execution_id):
+    """
+    分布式执行的 chord 回调：汇总各分片结果并完成执行记录
+    """
+    try:
+        _recount_execution(execution_id)
+        execution = TestExecution.objects.select_related('suite').get(id=execution_id)
+        return _complete_execution(execution)
+    except TestExecution.DoesNotExist:
+        error_msg = f"测试执行记录不存在: {execution_id}"
+        logger.error(error_msg)
+        return {'error': error_msg}
+
+
+
+def _abort_execution(execution_id, reason):
+    """
+    将未完成的执行标记为失败：未结束的用例/脚本记为错误，重新统计后完成执行记录
+    """
+    now = timezone.now()
+    TestCaseResult.objects.filter(
+        execution_id=execution_id, status__in=['pending', 'running']
+    ).update(status='error', error_message=reason, completed_at=now)
+    ScriptExecution.objects.filter(
+        test_execution_id=execution_id, status__in=['pending', 'running']
+    ).update(status='error', error_message=reason, completed_at=now)
+    _recount_execution(execution_id)
+    
+    execution = TestExecution.objects.get(id=execution_id)
+    if execution.status in ['pending', 'running']:
+        execution.status = 'failed'
+        execution.completed_at = now
+        execution.actual_makespan = execution.duration
+        execution.save(update_fields=['status', 'completed_at', 'actual_makespan', 'updated_at'])
+    logger.error(f"测试执行 {execution_id} 已标记为失败: {reason}")
+
+
+@shared_task(name='testcases.fail_test_execution')
+def fail_test_execution(request, exc, traceback, execution_id):
+    """
+    分布式执行的错误回调：有分片失败导致 chord 回调无法执行时，将执行标记为失败
+    """
+    try:
+        _abort_execution(execution_id, f"分布式执行分片失败: {exc}")
+    except TestExecution.DoesNotExist:
+        logger.error(f"测试执行记录不存在: {execution_id}")
+
+
+@shared_task(name='testcases.sweep_stuck_executions')
+def sweep_stuck_executions():
+    """
+    清理卡住的执行（由 celery beat 定时执行）
+    
+    - 所有用例/脚本均已结束但执行仍为执行中（汇总回调丢失）：正常完成
+    - 执行时间超过 TEST_SUITE_MAX_DURATION：标记为失败
+    """
+    now = timezone.now()
+    grace = timedelta(seconds=getattr(settings, 'TEST_EXECUTION_SWEEP_GRACE', 600))
+    max_duration = timedelta(seconds=getattr(settings, 'TEST_SUITE_MAX_DURATION', 86400))
+    finished, aborted = 0, 0
+    
+    for execution in TestExecution.objects.filter(status='running').select_related('suite'):
+        unfinished = (
+            TestCaseResult.objects.filter(execution=execution, status__in=['pending', 'running']).exists()
+            or ScriptExecution.objects.filter(test_execution=execution, status__in=['pending', 'running']).exists()
+        )
+        if not unfinished and execution.updated_at < now - grace:
+            _recount_execution(execution.id)
+            _complete_execution(execution)
+            finished += 1
+        elif execution.started_at and execution.started_at < now - max_duration:
+            _abort_execution(execution.id, f"执行超过最长时间 {max_duration.total_seconds():.0f} 秒")
+            aborted += 1
+    
+    if finished or aborted:
+        logger.info(f"清理卡住的测试执行: 完成 {finished} 个, 标记失败 {aborted} 个")
+    return {'finished': finished, 'aborted': aborted}
+
+
 def execute_single_testcase(result: TestCaseResult):
     """
-    执行单个测试用例 - 通过对话API驱动测试执行
+    执行单个测试用例 - 在当前进程内通过 Agent Loop 驱动测试执行
     
     Args:
         result: TestCaseResult实例
@@ -157,12 +428,7 @@ def execute_single_testcase(result: TestCaseResult):
     
     try:
         # 在新的事件循环中运行异步执行
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            loop.run_until_complete(_execute_testcase_via_chat_api(result))
-        finally:
-            loop.close()
+        _run_in_new_loop(_execute_testcase_via_agent_loop(result))
         
         logger.info(f"测试用例执行成功: {result.testcase.name}")
         
@@ -195,16 +461,23 @@ async def _execute_tasks_concurrently(execution, tasks_list, max_concurrent):
     # 使用信号量控制并发数
     semaphore = asyncio.Semaphore(max_concurrent)
     
+    # 脚本子进程在专用执行池中运行，池大小与套件并发数一致
+    script_pool = ScriptExecutionPool(max_workers=max_concurrent)
+    
+    # 监听取消信号：收到后跳过未开始的任务并中断正在执行的任务
+    watcher = CancellationWatcher(execution.id)
+    
     async def execute_with_semaphore(task_obj):
         """带信号量控制的执行函数"""
         async with semaphore:
-            # 检查是否已取消
-            current_execution = await sync_to_async(TestExecution.objects.get)(id=execution.id)
-            if current_execution.status == 'cancelled':
+            # 检查是否已取消（由取消信号推送，无需查询数据库）
+            if watcher.cancelled.is_set():
                 task_name = getattr(task_obj, 'testcase', getattr(task_obj, 'script', task_obj)).name
                 logger.info(f"测试执行已取消，跳过任务: {task_name}")
                 return
             
+            # 登记为正在执行，收到取消信号时中断
+            watcher.register(asyncio.current_task())
             try:
                 # 更新状态为执行中
                 task_obj.status = 'running'
@@ -214,11 +487,11 @@ async def _execute_tasks_concurrently(execution, tasks_list, max_concurrent):
                 # 根据任务类型调用不同的执行逻辑
                 if isinstance(task_obj, TestCaseResult):
                     # 执行测试用例
-                    await _execute_testcase_via_chat_api(task_obj)
+                    await _execute_testcase_via_agent_loop(task_obj)
                     task_name = task_obj.testcase.name
                 elif isinstance(task_obj, ScriptExecution):
                     # 执行自动化脚本
-                    await _execute_script_task(task_obj)
+                    await _execute_script_task(task_obj, script_pool)
                     task_name = task_obj.script.name
                 else:
                     raise ValueError(f"未知的任务类型: {type(task_obj)}")
@@ -240,6 +513,17 @@ async def _execute_tasks_concurrently(execution, tasks_list, max_concurrent):
                 # 更新统计（使用原子操作避免竞态）
                 await sync_to_async(_update_execution_counts)(execution, normalized_status)
                 
+            except asyncio.CancelledError:
+                # 执行被取消：中断正在执行的任务，不计入统计
+                task_name = getattr(task_obj, 'testcase', getattr(task_obj, 'script', task_obj)).name
+                logger.info(f"测试执行已取消，中断任务: {task_name}")
+                
+                task_obj.status = 'skip' if isinstance(task_obj, TestCaseResult) else 'cancelled'
+                task_obj.completed_at = timezone.now()
+                if task_obj.started_at:
+                    task_obj.execution_time = (task_obj.completed_at - task_obj.started_at).total_seconds()
+                await sync_to_async(task_obj.save)()
+                
             except Exception as e:
                 task_name = "Unknown"
                 if hasattr(task_obj, 'testcase'):
@@ -267,24 +551,19 @@ async def _execute_tasks_concurrently(execution, tasks_list, max_concurrent):
     async_tasks = [execute_with_semaphore(task) for task in tasks_list]
     
     # 并发执行所有任务
-    await asyncio.gather(*async_tasks, return_exceptions=True)
+    try:
+        async with watcher:
+            await asyncio.gather(*async_tasks, return_exceptions=True)
+    finally:
+        script_pool.shutdown(wait=False)
 
 
-@sync_to_async
-def _execute_script_task(script_execution):
+async def _execute_script_task(script_execution, pool: ScriptExecutionPool):
     """
-    同步执行脚本任务的包装器
+    在脚本执行池中执行脚本任务，并保存执行记录
     """
-    from .script_executor import ScriptExecutor
-    
     script = script_execution.script
     
-    # 创建执行器
-    executor = ScriptExecutor(
-        timeout_seconds=script.timeout_seconds,
-        browser_type='chromium'
-    )
-    
     try:
         # 判断是否使用 pytest
         use_pytest = (
@@ -293,9 +572,11 @@ def _execute_script_task(script_execution):
             and 'def test_' in script.script_content
         )
         
-        # 执行脚本
-        result = executor.execute_script(
+        # 执行脚本（子进程在执行池线程中运行，不阻塞事件循环和其他任务）
+        result = await pool.run(
             script_content=script.script_content,
+            timeout_seconds=script.timeout_seconds,
+            browser_type='chromium',
             use_pytest=use_pytest,
             headless=script.headless,
             record_video=False # 暂时不开启录屏，或者从配置获取
@@ -315,42 +596,33 @@ def _execute_script_task(script_execution):
         
         script_execution.screenshots = result['screenshots']
         script_execution.videos = result.get('videos', [])
-        script_execution.save()
-        
-        # 清理临时目录
-        executor.cleanup()
+        await sync_to_async(script_execution.save)()
         
     except Exception as e:
         script_execution.status = 'error'
         script_execution.error_message = str(e)
         script_execution.completed_at = timezone.now()
-        script_execution.save()
-        executor.cleanup()
+        await sync_to_async(script_execution.save)()
         raise
 
 
 def _update_execution_counts(execution, status):
     """
     原子更新执行统计
-    使用select_for_update避免并发写入冲突
+    使用 F() 表达式在数据库中自增，不锁定执行记录
     """
-    with transaction.atomic():
-        # 锁定当前执行记录
-        exec_obj = TestExecution.objects.select_for_update().get(id=execution.id)
-        
-        if status == 'pass':
-            exec_obj.passed_count += 1
-        elif status == 'fail':
-            exec_obj.failed_count += 1
-        elif status == 'skip':
-            exec_obj.skipped_count += 1
-        elif status == 'error':
-            exec_obj.error_count += 1
-        
-        exec_obj.save(update_fields=[
-            'passed_count', 'failed_count', 'skipped_count',
-            'error_count', 'updated_at'
-        ])
+    field = {
+        'pass': 'passed_count',
+        'fail': 'failed_count',
+        'skip': 'skipped_count',
+        'error': 'error_count',
+    }.get(status)
+    if not field:
+        return
+    TestExecution.objects.filter(id=execution.id).update(
+        **{field: F(field) + 1},
+        updated_at=timezone.now()
+    )
 
 
 @sync_to_async
@@ -501,8 +773,8 @@ def _extract_test_result_json(response_text: str) -> dict | None:
     
     return None
 
-async def _execute_testcase_via_chat_api(result: TestCaseResult):
-    """通过 Agent Loop SSE API 执行测试用例"""
+async def _execute_testcase_via_agent_loop(result: TestCaseResult):
+    """通过 Agent Loop 执行测试用例（进程内调用）"""
     # 使用thread_sensitive=False避免死锁
     execution = await sync_to_async(lambda: result.execution, thread_sensitive=False)()
     testcase = await sync_to_async(lambda: result.testcase, thread_sensitive=False)()
@@ -521,6 +793,7 @@ async def _execute_testcase_via_chat_api(result: TestCaseResult):
     
     execution_log = []
     screenshots = []
+    session_id = None
     
     try:
         # 1. 获取测试用例执行提示词
@@ -557,154 +830,124 @@ async def _execute_testcase_via_chat_api(result: TestCaseResult):
         logger.info(f"格式化后的提示词长度: {len(formatted_prompt)} 字符")
         execution_log.append(f"✓ 准备执行 {len(steps)} 个测试步骤")
         
-        # 5. 构造 Agent Loop API 请求
-        api_url = f"{settings.BASE_URL}/api/orchestrator/agent-loop/" if hasattr(settings, 'BASE_URL') else "http://localhost:8000/api/orchestrator/agent-loop/"
-        
+        # 5. 在当前事件循环中执行 Agent Loop（无需 HTTP 回环、JWT 与 SSE 编解码）
         # 生成唯一的会话ID
         session_id = f"test_exec_{execution.id}_{testcase.id}_{result.id}_{uuid.uuid4().hex[:8]}"
         
-        request_data = {
-            "message": formatted_prompt,
-            "session_id": session_id,
-            "project_id": str(project.id),
-            "prompt_id": str(prompt.id),
-            "use_knowledge_base": False,
-            "generate_playwright_script": generate_playwright_script,
-            "test_case_id": testcase.id
-        }
-        
-        logger.info(f"调用 Agent Loop API: {api_url}")
-        logger.info(f"会话ID: {session_id}")
+        logger.info(f"执行 Agent Loop，会话ID: {session_id}")
         execution_log.append(f"✓ 开始与AI测试引擎通信...")
         
-        # 6. 生成认证令牌并调用 Agent Loop SSE API
-        def generate_token():
-            refresh = RefreshToken.for_user(executor)
-            return str(refresh.access_token)
-        
-        access_token = await sync_to_async(generate_token)()
-        
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json',
-            'Accept': 'text/event-stream'
+        # 收集 Agent Loop 事件
+        state = {
+            'final_response': "",
+            'current_step_response': "",  # 当前步骤的响应内容
+            'step_count': 0,
         }
         
-        # 收集 SSE 流式响应
-        final_response = ""
-        current_step_response = ""  # 当前步骤的响应内容
-        step_count = 0
-        
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            async with client.stream(
-                'POST',
-                api_url,
-                json=request_data,
-                headers=headers
-            ) as response:
-                response.raise_for_status()
-                
-                async for line in response.aiter_lines():
-                    if not line or not line.startswith('data: '):
-                        continue
-                    
-                    try:
-                        data_str = line[6:]  # 去掉 'data: ' 前缀
-                        if data_str == '[DONE]':
-                            break
-                        
-                        data = json.loads(data_str)
-                        event_type = data.get('type', '')
-                        
-                        if event_type == 'step_start':
-                            step_count += 1
-                            current_step_response = ""  # 重置当前步骤响应
-                            execution_log.append(f"\n🔄 AI执行步骤 {step_count}")
-                        
-                        elif event_type == 'stream':
-                            # 流式响应：每个事件包含一小段文本
-                            stream_data = data.get('data', '')
-                            if stream_data:
-                                final_response += stream_data
-                                current_step_response += stream_data
-                        
-                        elif event_type == 'content':
-                            content = data.get('content', '')
-                            if content:
-                                final_response += content
-                        
-                        elif event_type == 'message':
-                            # Agent Loop 的 message 事件包含 AI 的响应（思考过程）
-                            msg_data = data.get('data', '')
-                            if msg_data:
-                                final_response += msg_data
-                                # 显示 AI 的说明（前150字符）
-                                short_msg = msg_data[:150].replace('\n', ' ').strip()
-                                if len(msg_data) > 150:
-                                    short_msg += '...'
-                                if short_msg:
-                                    execution_log.append(f"   💬 {short_msg}")
-                        
-                        elif event_type == 'tool_call':
-                            tool_name = data.get('name', data.get('tool', ''))
-                            tool_args = data.get('arguments', data.get('args', ''))
-                            if tool_name:
-                                execution_log.append(f"   🔧 调用工具: {tool_name}")
-                            if tool_args and isinstance(tool_args, str) and len(tool_args) > 0:
-                                # 只显示参数的前100个字符
-                                short_args = tool_args[:100] + '...' if len(tool_args) > 100 else tool_args
-                                execution_log.append(f"      参数: {short_args}")
-                        
-                        elif event_type == 'tool_start':
-                            # 工具开始执行
-                            tool_name = data.get('name', data.get('tool', ''))
-                            if tool_name:
-                                execution_log.append(f"   🔧 调用工具: {tool_name}")
-                        
-                        elif event_type == 'tool_result':
-                            # 工具执行结果
-                            result_summary = data.get('summary', '')
-                            if result_summary:
-                                # 只显示结果摘要的前150字符
-                                short_result = result_summary[:150].replace('\n', ' ')
-                                if len(result_summary) > 150:
-                                    short_result += '...'
-                                execution_log.append(f"   🔧 工具结果: {short_result}")
-                        
-                        elif event_type == 'stream_end':
-                            # 流式响应结束，输出当前步骤的响应摘要
-                            if current_step_response.strip():
-                                summary = current_step_response.strip()[:200].replace('\n', ' ')
-                                if len(current_step_response.strip()) > 200:
-                                    summary += '...'
-                                execution_log.append(f"   📝 {summary}")
-                        
-                        elif event_type == 'step_end' or event_type == 'step_complete':
-                            # 步骤完全结束信号，tool_result已显示工具结果，此处不再重复
-                            pass
-                        
-                        elif event_type == 'final':
-                            final_response = data.get('content', final_response)
-                        
-                        elif event_type == 'ai':
-                            # AI消息事件，检查是否是最终响应
-                            content = data.get('content', '')
-                            agent_type = data.get('agent_type', '')
-                            if agent_type == 'final' and content:
-                                # 这是最终AI响应，包含测试结果JSON
-                                final_response = content
-                                logger.info(f"收到最终AI响应, 长度: {len(content)}")
-                            elif content:
-                                # 普通AI响应，累加到final_response
-                                final_response += content
-                        
-                        elif event_type == 'error':
-                            error_msg = data.get('message', '未知错误')
-                            execution_log.append(f"   ❌ 错误: {error_msg}")
-                            raise Exception(error_msg)
-                    
-                    except json.JSONDecodeError:
-                        continue
+        def handle_event(data: Dict[str, Any]):
+            event_type = data.get('type', '')
+            
+            if event_type == 'step_start':
+                state['step_count'] += 1
+                state['current_step_response'] = ""  # 重置当前步骤响应
+                execution_log.append(f"\n🔄 AI执行步骤 {state['step_count']}")
+
+            elif event_type == 'stream':
+                # 流式响应：每个事件包含一小段文本
+                stream_data = data.get('data', '')
+                if stream_data:
+                    state['final_response'] += stream_data
+                    state['current_step_response'] += stream_data
+
+            elif event_type == 'content':
+                content = data.get('content', '')
+                if content:
+                    state['final_response'] += content
+
+            elif event_type == 'message':
+                # Agent Loop 的 message 事件包含 AI 的响应（思考过程）
+                msg_data = data.get('data', '')
+                if msg_data:
+                    state['final_response'] += msg_data
+                    # 显示 AI 的说明（前150字符）
+                    short_msg = msg_data[:150].replace('\n', ' ').strip()
+                    if len(msg_data) > 150:
+                        short_msg += '...'
+                    if short_msg:
+                        execution_log.append(f"   💬 {short_msg}")
+
+            elif event_type == 'tool_call':
+                tool_name = data.get('name', data.get('tool', ''))
+                tool_args = data.get('arguments', data.get('args', ''))
+                if tool_name:
+                    execution_log.append(f"   🔧 调用工具: {tool_name}")
+                if tool_args and isinstance(tool_args, str) and len(tool_args) > 0:
+                    # 只显示参数的前100个字符
+                    short_args = tool_args[:100] + '...' if len(tool_args) > 100 else tool_args
+                    execution_log.append(f"      参数: {short_args}")
+
+            elif event_type == 'tool_start':
+                # 工具开始执行
+                tool_name = data.get('name', data.get('tool', ''))
+                if tool_name:
+                    execution_log.append(f"   🔧 调用工具: {tool_name}")
+
+            elif event_type == 'tool_result':
+                # 工具执行结果
+                result_summary = data.get('summary', '')
+                if result_summary:
+                    # 只显示结果摘要的前150字符
+                    short_result = result_summary[:150].replace('\n', ' ')
+                    if len(result_summary) > 150:
+                        short_result += '...'
+                    execution_log.append(f"   🔧 工具结果: {short_result}")
+
+            elif event_type == 'stream_end':
+                # 流式响应结束，输出当前步骤的响应摘要
+                step_response = state['current_step_response'].strip()
+                if step_response:
+                    summary = step_response[:200].replace('\n', ' ')
+                    if len(step_response) > 200:
+                        summary += '...'
+                    execution_log.append(f"   📝 {summary}")
+
+            elif event_type == 'step_end' or event_type == 'step_complete':
+                # 步骤完全结束信号，tool_result已显示工具结果，此处不再重复
+                pass
+
+            elif event_type == 'final':
+                state['final_response'] = data.get('content', state['final_response'])
+
+            elif event_type == 'ai':
+                # AI消息事件，检查是否是最终响应
+                content = data.get('content', '')
+                agent_type = data.get('agent_type', '')
+                if agent_type == 'final' and content:
+                    # 这是最终AI响应，包含测试结果JSON
+                    state['final_response'] = content
+                    logger.info(f"收到最终AI响应, 长度: {len(content)}")
+                elif content:
+                    # 普通AI响应，累加到final_response
+                    state['final_response'] += content
+
+            elif event_type == 'error':
+                error_msg = data.get('message', '未知错误')
+                execution_log.append(f"   ❌ 错误: {error_msg}")
+                raise Exception(error_msg)
+        
+        await run_agent_loop(
+            executor,
+            project,
+            formatted_prompt,
+            session_id=session_id,
+            prompt_id=prompt.id,
+            use_knowledge_base=False,
+            generate_playwright_script=generate_playwright_script,
+            test_case_id=testcase.id,
+            on_event=handle_event,
+        )
+        final_response = state['final_response']
+        step_count = state['step_count']
         
         logger.info(f"Agent Loop 执行完成，共 {step_count} 个步骤")
         
@@ -773,24 +1016,9 @@ async def _execute_testcase_via_chat_api(result: TestCaseResult):
             result.status = 'pass'
             execution_log.append("\n✓ 所有步骤执行完成")
         
-        # 清理MCP会话
-        try:
-            from mcp_tools.persistent_client import mcp_session_manager
-            await mcp_session_manager.cleanup_user_session(
-                user_id=str(executor.id),
-                project_id=str(project.id),
-                session_id=session_id
-            )
-            logger.info(f"已清理MCP会话: {session_id}")
-            execution_log.append(f"✓ 已清理浏览器会话资源")
-        except Exception as e:
-            logger.warning(f"清理MCP会话失败: {e}")
-        
-    except httpx.HTTPError as e:
-        error_msg = f"调用 Agent Loop API 失败: {str(e)}"
-        execution_log.append(f"\n✗ {error_msg}")
-        logger.error(error_msg, exc_info=True)
-        raise Exception(error_msg)
+    except asyncio.CancelledError:
+        execution_log.append("\n✗ 测试执行已取消，执行被中断")
+        raise
     
     except Exception as e:
         error_msg = f"执行过程异常: {str(e)}"
@@ -799,6 +1027,20 @@ async def _execute_testcase_via_chat_api(result: TestCaseResult):
         raise
     
     finally:
+        # 清理MCP会话（执行完成、失败或被取消中断时都需要释放浏览器会话）
+        if session_id:
+            try:
+                from mcp_tools.persistent_client import mcp_session_manager
+                await mcp_session_manager.cleanup_user_session(
+                    user_id=str(executor.id),
+                    project_id=str(project.id),
+                    session_id=session_id
+                )
+                logger.info(f"已清理MCP会话: {session_id}")
+                execution_log.append(f"✓ 已清理浏览器会话资源")
+            except Exception as e:
+                logger.warning(f"清理MCP会话失败: {e}")
+        
         result.execution_log = "\n".join(execution_log)
         result.screenshots = screenshots
         result.completed_at = timezone.now()
@@ -821,6 +1063,9 @@ def cancel_test_execution(execution_id):
         execution = TestExecution.objects.get(id=execution_id)
         
         if execution.status in ['pending', 'running']:
+            # 通知执行中的 worker 中断正在执行的任务
+            set_cancel_signal(execution_id)
+            
             execution.status = 'cancelled'
             execution.completed_at = timezone.now()
             execution.save(update_fields=['status', 'completed_at', 'updated_at'])
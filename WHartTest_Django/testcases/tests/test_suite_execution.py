@@ -1,8 +1,27 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from django.contrib.auth.models import User
 from projects.models import Project
-from testcases.models import TestSuite, TestCase as TestCaseModel, AutomationScript, TestExecution, TestCaseModule
+from testcases.models import (
+    TestSuite, TestCase as TestCaseModel, AutomationScript, TestExecution, TestCaseModule,
+    TestCaseResult, ScriptExecution
+)
 from testcases.serializers import TestSuiteSerializer, TestExecutionCreateSerializer
+from testcases.script_executor import ScriptExecutionPool
+from testcases.scheduling import assign_lanes, estimate_makespan, estimate_task_durations, longest_first
+from testcases.cancellation import set_cancel_signal
+from testcases.tasks import (
+    _build_execution_lanes, _execute_tasks_concurrently, _run_in_new_loop, _update_execution_counts,
+    fail_test_execution,
+    finalize_test_execution, sweep_stuck_executions
+)
 from rest_framework.exceptions import ValidationError
 
 class TestSuiteExecutionTests(TestCase):
@@ -76,4 +95,226 @@ class TestSuiteExecutionTests(TestCase):
         context = {'project_id': self.project.id, 'request': None}
         serializer = TestSuiteSerializer(data=data, context=context)
         self.assertFalse(serializer.is_valid())
-        self.assertIn('non_field_errors', serializer.errors)
\ No newline at end of file
+        self.assertIn('non_field_errors', serializer.errors)
+
+
+class ScriptExecutionPoolTests(TestCase):
+    def test_pool_runs_scripts_concurrently_up_to_limit(self):
+        """测试脚本执行池按并发上限同时执行脚本"""
+        lock = threading.Lock()
+        running = {'current': 0, 'peak': 0}
+
+        def fake_execute_script(executor, script_content, **kwargs):
+            with lock:
+                running['current'] += 1
+                running['peak'] = max(running['peak'], running['current'])
+            time.sleep(0.1)
+            with lock:
+                running['current'] -= 1
+            return {'success': True, 'script': script_content}
+
+        async def run_suite():
+            with ScriptExecutionPool(max_workers=3) as pool:
+                return await asyncio.gather(*(pool.run(f'script {i}') for i in range(6)))
+
+        with patch('testcases.script_executor.ScriptExecutor.execute_script', new=fake_execute_script):
+            results = async_to_sync(run_suite)()
+
+        self.assertEqual([result['script'] for result in results], [f'script {i}' for i in range(6)])
+        self.assertEqual(running['peak'], 3)
+
+
+class RunInNewLoopTests(TestCase):
+    def test_pending_background_tasks_cancelled_before_loop_closes(self):
+        """测试事件循环关闭前取消遗留的后台任务，而不是随循环一起销毁"""
+        cancelled = []
+
+        async def background():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def main():
+            asyncio.get_running_loop().create_task(background())
+            await asyncio.sleep(0)
+            return 'done'
+
+        self.assertEqual(_run_in_new_loop(main()), 'done')
+        self.assertEqual(cancelled, [True])
+
+
+class DistributedSuiteExecutionTests(TestCase):
+    def test_lanes_respect_suite_concurrency(self):
+        """测试通道数不超过套件并发数，分片按配置大小切分"""
+        lanes = _build_execution_lanes(list(range(7)), max_concurrent=3, shard_size=2)
+
+        self.assertEqual(lanes, [[[0, 3], [6]], [[1, 4]], [[2, 5]]])
+        self.assertEqual(_build_execution_lanes([1, 2], max_concurrent=5, shard_size=1), [[[1]], [[2]]])
+
+    def test_finalize_recounts_from_results(self):
+        """测试汇总回调按结果记录重新统计并完成执行"""
+        user = User.objects.create_user(username='fanout', password='password')
+        project = Project.objects.create(name='Fanout Project', creator=user)
+        module = TestCaseModule.objects.create(project=project, name='Module', creator=user)
+        suite = TestSuite.objects.create(project=project, name='Suite', creator=user)
+        execution = TestExecution.objects.create(suite=suite, executor=user, status='running', total_count=4)
+        for index, result_status in enumerate(['pass', 'pass', 'fail']):
+            testcase = TestCaseModel.objects.create(project=project, module=module, name=f'Case {index}', creator=user)
+            TestCaseResult.objects.create(execution=execution, testcase=testcase, status=result_status)
+        script = AutomationScript.objects.create(
+            test_case=testcase, name='Script', script_content='print(1)', creator=user, source='ai_generated'
+        )
+        ScriptExecution.objects.create(script=script, test_execution=execution, status='error')
+        # 分片重试可能导致增量计数重复，汇总以结果记录为准
+        TestExecution.objects.filter(id=execution.id).update(passed_count=5)
+
+        summary = finalize_test_execution(execution.id)
+
+        execution.refresh_from_db()
+        self.assertEqual(execution.status, 'completed')
+        self.assertEqual(
+            (execution.passed_count, execution.failed_count, execution.error_count, execution.skipped_count),
+            (2, 1, 1, 0)
+        )
+        self.assertEqual(summary['passed'], 2)
+
+    def _create_execution(self, statuses):
+        user = User.objects.create_user(username='stuck', password='password')
+        project = Project.objects.create(name='Stuck Project', creator=user)
+        module = TestCaseModule.objects.create(project=project, name='Module', creator=user)
+        suite = TestSuite.objects.create(project=project, name='Suite', creator=user)
+        execution = TestExecution.objects.create(
+            suite=suite, executor=user, status='running', started_at=timezone.now(), total_count=len(statuses)
+        )
+        for index, result_status in enumerate(statuses):
+            testcase = TestCaseModel.objects.create(project=project, module=module, name=f'Case {index}', creator=user)
+            TestCaseResult.objects.create(execution=execution, testcase=testcase, status=result_status)
+        return execution
+
+    def test_errback_marks_execution_failed(self):
+        """测试分片失败时错误回调将执行标记为失败，未结束的任务记为错误"""
+        execution = self._create_execution(['pass', 'running', 'pending'])
+
+        fail_test_execution(None, RuntimeError('TimeLimitExceeded'), None, execution.id)
+
+        execution.refresh_from_db()
+        self.assertEqual(execution.status, 'failed')
+        self.assertEqual((execution.passed_count, execution.error_count), (1, 2))
+        self.assertIsNotNone(execution.completed_at)
+
+    def test_sweep_finishes_and_aborts_stuck_executions(self):
+        """测试定时清理：任务均已结束的执行正常完成，超时的执行标记为失败"""
+        finished = self._create_execution(['pass', 'fail'])
+        TestExecution.objects.filter(id=finished.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        stuck = TestExecution.objects.create(
+            suite=finished.suite, executor=finished.executor, status='running',
+            started_at=timezone.now() - timedelta(days=2)
+        )
+
+        self.assertEqual(sweep_stuck_executions(), {'finished': 1, 'aborted': 1})
+
+        finished.refresh_from_db()
+        stuck.refresh_from_db()
+        self.assertEqual((finished.status, finished.passed_count, finished.failed_count), ('completed', 1, 1))
+        self.assertEqual(stuck.status, 'failed')
+
+
+class SuiteSchedulingTests(TestCase):
+    def test_longest_first_reduces_makespan(self):
+        """测试最长优先顺序避免长任务最后启动"""
+        durations = [1, 1, 1, 1, 4]
+
+        self.assertEqual(estimate_makespan(durations, 2), 6)
+        ordered = [durations[index] for index in longest_first(durations)]
+        self.assertEqual(ordered, [4, 1, 1, 1, 1])
+        self.assertEqual(estimate_makespan(ordered, 2), 4)
+        self.assertEqual(assign_lanes(durations, 2), [[4], [0, 1, 2, 3]])
+
+    def test_estimate_durations_from_history(self):
+        """测试按用例历史耗时中位数估算，无历史的任务使用已知估算的中位数"""
+        user = User.objects.create_user(username='scheduler', password='password')
+        project = Project.objects.create(name='Scheduling Project', creator=user)
+        module = TestCaseModule.objects.create(project=project, name='Module', creator=user)
+        suite = TestSuite.objects.create(project=project, name='Suite', creator=user)
+        slow, fast, unknown = [
+            TestCaseModel.objects.create(project=project, module=module, name=name, creator=user)
+            for name in ('slow', 'fast', 'unknown')
+        ]
+        for testcase, execution_time in [(slow, 100), (slow, 120), (slow, 300), (fast, 10)]:
+            TestCaseResult.objects.create(
+                execution=TestExecution.objects.create(suite=suite, executor=user),
+                testcase=testcase, status='pass', execution_time=execution_time
+            )
+
+        current = TestExecution.objects.create(suite=suite, executor=user)
+        tasks_list = [
+            TestCaseResult.objects.create(execution=current, testcase=testcase, status='pending')
+            for testcase in (fast, unknown, slow)
+        ]
+
+        self.assertEqual(estimate_task_durations(tasks_list, history=3), [10, 65, 120])
+
+        # 频繁执行的用例不占用其他用例的历史名额，错误记录不参与估算
+        recent = timezone.now()
+        for offset in range(10):
+            TestCaseResult.objects.create(
+                execution=TestExecution.objects.create(suite=suite, executor=user),
+                testcase=fast, status='pass', execution_time=20, completed_at=recent - timedelta(minutes=offset)
+            )
+        TestCaseResult.objects.create(
+            execution=TestExecution.objects.create(suite=suite, executor=user),
+            testcase=slow, status='error', execution_time=1, completed_at=recent
+        )
+
+        self.assertEqual(estimate_task_durations(tasks_list, history=3), [20, 70, 120])
+
+
+@override_settings(TEST_EXECUTION_SIGNAL_CACHE='default', TEST_EXECUTION_CANCEL_CHECK_INTERVAL=0.05)
+class ExecutionCancellationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cancel', password='password')
+        project = Project.objects.create(name='Cancel Project', creator=self.user)
+        module = TestCaseModule.objects.create(project=project, name='Module', creator=self.user)
+        testcase = TestCaseModel.objects.create(project=project, module=module, name='Case', creator=self.user)
+        suite = TestSuite.objects.create(project=project, name='Suite', creator=self.user)
+        self.execution = TestExecution.objects.create(suite=suite, executor=self.user, status='running')
+        self.scripts = [
+            ScriptExecution.objects.create(
+                script=AutomationScript.objects.create(
+                    test_case=testcase, name=f'Script {index}', script_content='print(1)',
+                    creator=self.user, source='ai_generated'
+                ),
+                test_execution=self.execution,
+                status='pending'
+            )
+            for index in range(2)
+        ]
+
+    def test_counts_increment_atomically(self):
+        """测试统计计数使用 F() 自增"""
+        _update_execution_counts(self.execution, 'pass')
+        _update_execution_counts(self.execution, 'pass')
+        _update_execution_counts(self.execution, 'error')
+
+        self.execution.refresh_from_db()
+        self.assertEqual((self.execution.passed_count, self.execution.error_count), (2, 1))
+
+    def test_cancel_signal_interrupts_running_task(self):
+        """测试取消信号中断正在执行的任务并跳过未开始的任务"""
+        async def long_running_script(script_execution, pool):
+            set_cancel_signal(self.execution.id)
+            await asyncio.sleep(10)
+
+        started = time.monotonic()
+        with patch('testcases.tasks._execute_script_task', new=long_running_script):
+            async_to_sync(_execute_tasks_concurrently)(self.execution, self.scripts, 1)
+
+        self.assertLess(time.monotonic() - started, 5)
+        statuses = [
+            ScriptExecution.objects.get(id=script_execution.id).status for script_execution in self.scripts
+        ]
+        self.assertEqual(statuses, ['cancelled', 'pending'])
+        self.execution.refresh_from_db()
+        self.assertEqual(self.execution.error_count, 0)
@@ -792,6 +792,7 @@ class TestExecutionViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], url_path='cancel')
     def cancel(self, request, project_pk=None, pk=None):
         """取消测试执行"""
+        from .cancellation import set_cancel_signal
         from .tasks import cancel_test_execution
         from celery import current_app
         
@@ -802,9 +803,12 @@ class TestExecutionViewSet(viewsets.ModelViewSet):
                 'error': f'无法取消状态为 {execution.get_status_display()} 的执行'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # 尝试撤销Celery任务
+        # 推送取消信号：执行中的 worker 收到后中断正在执行的用例/脚本并跳过其余任务
+        set_cancel_signal(execution.id)
+        
+        # 撤销尚未开始的Celery任务（已开始的任务由取消信号中断，保证结果记录被正确更新）
         if execution.celery_task_id:
-            current_app.control.revoke(execution.celery_task_id, terminate=True)
+            current_app.control.revoke(execution.celery_task_id)
         
         # 调用取消任务
         cancel_test_execution.delay(execution.id)
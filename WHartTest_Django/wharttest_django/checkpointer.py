@@ -4,12 +4,31 @@ LangGraph Checkpointer 工厂模块
 根据 DATABASE_TYPE 环境变量自动选择合适的 Checkpointer：
 - sqlite: 使用 SqliteSaver/AsyncSqliteSaver（默认，本地开发）
 - postgres: 使用 PostgresSaver/AsyncPostgresSaver（生产环境）
+
+PostgreSQL 模式下 Checkpointer 由进程级连接池支撑，setup() 每个进程只执行一次：
+- 同步连接池线程安全，整个进程共享
+- 异步连接池绑定事件循环，由服务的长期事件循环（uvicorn）持有；
+  其他临时事件循环（如 async_to_sync）退回按次建立连接
 """
+import asyncio
+import logging
 import os
+import threading
 from contextlib import asynccontextmanager, contextmanager
-from typing import Optional
+from typing import Any, Dict, Optional
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
+# 连接池与 setup 状态（进程级）
+_sync_pool = None
+_sync_saver = None
+_sync_lock = threading.RLock()
+_async_pool_state = None  # (loop, pool, ready)；ready 为创建完成后返回 saver 的 Future
+_setup_done = False
+# checkpoints 表存在后不会消失，确认存在后不再查询
+_checkpoints_table_exists = False
+
 
 def get_database_type() -> str:
     """获取数据库类型配置（每次调用时读取，确保环境变量已加载）"""
@@ -35,6 +54,181 @@ def get_sqlite_path() -> str:
     return os.path.join(str(settings.BASE_DIR), "chat_history.sqlite")
 
 
+def _pool_enabled() -> bool:
+    return getattr(settings, 'LANGGRAPH_CHECKPOINTER_POOL_ENABLED', True)
+
+
+def _pool_kwargs() -> Dict[str, Any]:
+    """连接池参数，连接配置与 PostgresSaver.from_conn_string 保持一致"""
+    from psycopg.rows import dict_row
+
+    return {
+        'conninfo': get_db_connection_string(),
+        'min_size': getattr(settings, 'LANGGRAPH_CHECKPOINTER_POOL_MIN_SIZE', 1),
+        'max_size': getattr(settings, 'LANGGRAPH_CHECKPOINTER_POOL_MAX_SIZE', 10),
+        'timeout': getattr(settings, 'LANGGRAPH_CHECKPOINTER_POOL_TIMEOUT', 30),
+        'kwargs': {'autocommit': True, 'prepare_threshold': 0, 'row_factory': dict_row},
+        'open': False,
+    }
+
+
+async def _ensure_async_setup(checkpointer):
+    """每个进程只执行一次 setup()（建表/迁移检查），setup 本身可重入"""
+    global _setup_done, _checkpoints_table_exists
+    if not _setup_done:
+        await checkpointer.setup()
+        _setup_done = _checkpoints_table_exists = True
+
+
+def _ensure_sync_setup(checkpointer):
+    global _setup_done, _checkpoints_table_exists
+    if not _setup_done:
+        checkpointer.setup()
+        _setup_done = _checkpoints_table_exists = True
+
+
+async def _get_pooled_async_checkpointer():
+    """
+    获取当前事件循环的连接池 Checkpointer
+    连接池已被另一个仍在运行的事件循环持有时返回 None
+    """
+    global _async_pool_state
+
+    loop = asyncio.get_running_loop()
+    state = _async_pool_state
+    if state is not None:
+        owner_loop, pool, ready = state
+        if owner_loop is loop:
+            # 同一事件循环的并发协程等待首个协程创建完成，不重复创建连接池
+            return await asyncio.shield(ready)
+        if not owner_loop.is_closed():
+            return None
+        # 原事件循环已关闭，其连接池无法再 await close()，丢弃引用后由当前事件循环接管；
+        # 遗留连接随连接池对象回收时关闭
+        _async_pool_state = None
+        if pool is not None:
+            logger.info("LangGraph checkpointer async pool discarded: owner event loop closed")
+
+    # 在第一次 await 之前发布创建中的状态
+    ready = loop.create_future()
+    _async_pool_state = (loop, None, ready)
+    try:
+        pool, saver = await _open_async_pool()
+    except BaseException as e:
+        _async_pool_state = None
+        if isinstance(e, asyncio.CancelledError):
+            ready.cancel()
+        else:
+            ready.set_exception(e)
+            # 没有并发协程等待时避免 "exception was never retrieved" 警告
+            ready.exception()
+        raise
+
+    _async_pool_state = (loop, pool, ready)
+    ready.set_result(saver)
+    return saver
+
+
+def release_loop_checkpointer(loop: asyncio.AbstractEventLoop) -> bool:
+    """
+    关闭指定事件循环持有的异步连接池，返回是否关闭
+
+    在 loop.close() 之前、循环未运行时调用（如 Celery 任务中新建的事件循环）
+    """
+    global _async_pool_state
+    state = _async_pool_state
+    if state is None or state[0] is not loop or state[1] is None:
+        return False
+    _async_pool_state = None
+    if not loop.is_closed():
+        loop.run_until_complete(state[1].close())
+    logger.info("LangGraph checkpointer async pool closed with its event loop")
+    return True
+
+
+async def _open_async_pool():
+    from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+    from psycopg_pool import AsyncConnectionPool
+
+    pool = AsyncConnectionPool(name='langgraph-checkpointer-async', **_pool_kwargs())
+    await pool.open()
+    try:
+        saver = AsyncPostgresSaver(conn=pool)
+        await _ensure_async_setup(saver)
+    except BaseException:
+        await pool.close()
+        raise
+    logger.info(f"LangGraph checkpointer async pool opened: max_size={pool.max_size}")
+    return pool, saver
+
+
+def _get_sync_pool():
+    """获取进程共享的同步连接池（线程安全）"""
+    global _sync_pool
+    if _sync_pool is None:
+        with _sync_lock:
+            if _sync_pool is None:
+                from psycopg_pool import ConnectionPool
+
+                pool = ConnectionPool(name='langgraph-checkpointer-sync', **_pool_kwargs())
+                pool.open()
+                _sync_pool = pool
+                logger.info(f"LangGraph checkpointer sync pool opened: max_size={pool.max_size}")
+    return _sync_pool
+
+
+def _get_pooled_sync_checkpointer():
+    """获取进程共享的同步连接池 Checkpointer"""
+    global _sync_saver
+    if _sync_saver is not None:
+        return _sync_saver
+
+    with _sync_lock:
+        if _sync_saver is None:
+            from langgraph.checkpoint.postgres import PostgresSaver
+
+            saver = PostgresSaver(conn=_get_sync_pool())
+            _ensure_sync_setup(saver)
+            _sync_saver = saver
+    return _sync_saver
+
+
+@contextmanager
+def _postgres_connection():
+    """
+    获取 PostgreSQL 连接（autocommit + dict_row），优先从同步连接池借用
+    多条语句需要原子执行时使用 conn.transaction()
+    """
+    if _pool_enabled():
+        with _get_sync_pool().connection() as conn:
+            yield conn
+    else:
+        import psycopg
+        from psycopg.rows import dict_row
+
+        with psycopg.connect(
+            get_db_connection_string(), autocommit=True, prepare_threshold=0, row_factory=dict_row
+        ) as conn:
+            yield conn
+
+
+def _postgres_checkpoints_table_exists(conn) -> bool:
+    """检查 checkpoints 表是否存在（确认存在后缓存结果）"""
+    global _checkpoints_table_exists
+    if not _checkpoints_table_exists:
+        row = conn.execute("SELECT to_regclass('checkpoints') IS NOT NULL AS table_exists").fetchone()
+        _checkpoints_table_exists = bool(row and row['table_exists'])
+    return _checkpoints_table_exists
+
+
+def get_checkpointer_pool_stats() -> Dict[str, Optional[Dict[str, int]]]:
+    """连接池统计信息（psycopg_pool get_stats），未创建的连接池为 None"""
+    return {
+        'sync': _sync_pool.get_stats() if _sync_pool is not None else None,
+        'async': _async_pool_state[1].get_stats() if _async_pool_state and _async_pool_state[1] is not None else None,
+    }
+
+
 @asynccontextmanager
 async def get_async_checkpointer():
     """
@@ -47,9 +241,14 @@ async def get_async_checkpointer():
     conn_string = get_db_connection_string()
     
     if get_database_type() == 'postgres':
+        checkpointer = await _get_pooled_async_checkpointer() if _pool_enabled() else None
+        if checkpointer is not None:
+            yield checkpointer
+            return
+
         from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
         async with AsyncPostgresSaver.from_conn_string(conn_string) as checkpointer:
-            await checkpointer.setup()
+            await _ensure_async_setup(checkpointer)
             yield checkpointer
     else:
         from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
@@ -69,9 +268,13 @@ def get_sync_checkpointer():
     conn_string = get_db_connection_string()
     
     if get_database_type() == 'postgres':
+        if _pool_enabled():
+            yield _get_pooled_sync_checkpointer()
+            return
+
         from langgraph.checkpoint.postgres import PostgresSaver
         with PostgresSaver.from_conn_string(conn_string) as checkpointer:
-            checkpointer.setup()
+            _ensure_sync_setup(checkpointer)
             yield checkpointer
     else:
         from langgraph.checkpoint.sqlite import SqliteSaver
@@ -85,65 +288,32 @@ def delete_checkpoints_by_thread_id(thread_id: str) -> int:
     
     返回删除的记录数
     """
-    if get_database_type() == 'postgres':
-        import psycopg2
-        conn_string = get_db_connection_string()
-        try:
-            conn = psycopg2.connect(conn_string)
-            try:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM checkpoints WHERE thread_id = %s", (thread_id,))
-                deleted_count = cursor.rowcount
-                conn.commit()
-                return deleted_count
-            finally:
-                conn.close()
-        except psycopg2.errors.UndefinedTable:
-            return 0
-        except Exception:
-            return 0
-    else:
-        import sqlite3
-        db_path = get_sqlite_path()
-        if not os.path.exists(db_path):
-            return 0
-        conn = sqlite3.connect(db_path)
-        try:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
-            deleted_count = cursor.rowcount
-            conn.commit()
-            return deleted_count
-        finally:
-            conn.close()
+    return delete_checkpoints_batch([thread_id])
 
 
 def delete_checkpoints_batch(thread_ids: list) -> int:
     """
-    批量删除多个 thread_id 的 checkpoints
+    批量删除多个 thread_id 的 checkpoints（连同 blobs/writes，在同一事务中完成）
     
-    返回删除的总记录数
+    返回删除的 checkpoints 记录数
     """
     if not thread_ids:
         return 0
+    thread_ids = list(thread_ids)
     
     if get_database_type() == 'postgres':
-        import psycopg2
-        conn_string = get_db_connection_string()
         try:
-            conn = psycopg2.connect(conn_string)
-            try:
-                cursor = conn.cursor()
-                # PostgreSQL 使用 ANY 语法
-                cursor.execute("DELETE FROM checkpoints WHERE thread_id = ANY(%s)", (thread_ids,))
-                deleted_count = cursor.rowcount
-                conn.commit()
-                return deleted_count
-            finally:
-                conn.close()
-        except psycopg2.errors.UndefinedTable:
-            return 0
-        except Exception:
+            with _postgres_connection() as conn:
+                if not _postgres_checkpoints_table_exists(conn):
+                    return 0
+                with conn.transaction():
+                    # PostgreSQL 使用 ANY 语法
+                    conn.execute("DELETE FROM checkpoint_writes WHERE thread_id = ANY(%s)", (thread_ids,))
+                    conn.execute("DELETE FROM checkpoint_blobs WHERE thread_id = ANY(%s)", (thread_ids,))
+                    cursor = conn.execute("DELETE FROM checkpoints WHERE thread_id = ANY(%s)", (thread_ids,))
+                    return cursor.rowcount
+        except Exception as e:
+            logger.warning(f"Failed to delete checkpoints for {len(thread_ids)} threads: {e}")
             return 0
     else:
         import sqlite3
@@ -155,6 +325,7 @@ def delete_checkpoints_batch(thread_ids: list) -> int:
             cursor = conn.cursor()
             # SQLite 使用 IN 语法
             placeholders = ','.join('?' * len(thread_ids))
+            cursor.execute(f"DELETE FROM writes WHERE thread_id IN ({placeholders})", thread_ids)
             cursor.execute(f"DELETE FROM checkpoints WHERE thread_id IN ({placeholders})", thread_ids)
             deleted_count = cursor.rowcount
             conn.commit()
@@ -168,17 +339,11 @@ def check_history_exists() -> bool:
     检查聊天历史存储是否存在（SQLite 文件或 PostgreSQL 表）
     """
     if get_database_type() == 'postgres':
-        import psycopg2
-        conn_string = get_db_connection_string()
+        if _checkpoints_table_exists:
+            return True
         try:
-            conn = psycopg2.connect(conn_string)
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'checkpoints')")
-                result = cursor.fetchone()
-                return result[0] if result else False
-            finally:
-                conn.close()
+            with _postgres_connection() as conn:
+                return _postgres_checkpoints_table_exists(conn)
         except Exception:
             return False
     else:
@@ -193,20 +358,15 @@ def get_thread_ids_by_prefix(prefix: str) -> list:
     返回 thread_id 列表
     """
     if get_database_type() == 'postgres':
-        import psycopg2
-        conn_string = get_db_connection_string()
         try:
-            conn = psycopg2.connect(conn_string)
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id LIKE %s", (prefix + '%',))
-                rows = cursor.fetchall()
-                return [row[0] for row in rows]
-            finally:
-                conn.close()
-        except psycopg2.errors.UndefinedTable:
-            # checkpoints 表不存在，返回空列表
-            return []
+            with _postgres_connection() as conn:
+                if not _postgres_checkpoints_table_exists(conn):
+                    # checkpoints 表不存在，返回空列表
+                    return []
+                rows = conn.execute(
+                    "SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id LIKE %s", (prefix + '%',)
+                ).fetchall()
+                return [row['thread_id'] for row in rows]
         except Exception:
             return []
     else:
@@ -224,6 +384,95 @@ def get_thread_ids_by_prefix(prefix: str) -> list:
             conn.close()
 
 
+def _msgpack_array_length(blob_type: str, head) -> Optional[int]:
+    """从 msgpack 序列化的消息列表头部字节读取列表长度，无法识别时返回 None"""
+    if blob_type == 'empty':
+        return 0
+    if blob_type != 'msgpack' or not head:
+        return None
+    head = bytes(head)
+    marker = head[0]
+    if 0x90 <= marker <= 0x9f:
+        return marker & 0x0f
+    if marker == 0xdc and len(head) >= 3:
+        return int.from_bytes(head[1:3], 'big')
+    if marker == 0xdd and len(head) >= 5:
+        return int.from_bytes(head[1:5], 'big')
+    return None
+
+
+def _assign_message_timestamps(checkpoint_counts) -> Dict[int, str]:
+    """按时间顺序遍历 (ts, 消息数)，为每条新增消息分配其首次出现的 checkpoint 时间戳"""
+    timestamps = {}
+    processed_message_count = 0
+    for ts, message_count in checkpoint_counts:
+        if message_count is not None and message_count > processed_message_count:
+            if ts:
+                for i in range(processed_message_count, message_count):
+                    timestamps[i] = ts
+            processed_message_count = message_count
+    return timestamps
+
+
+def _message_timestamps_from_checkpoints(thread_id: str) -> Dict[int, str]:
+    """通过 Checkpointer 遍历全部 checkpoint 计算消息时间戳（SQLite 及降级路径）"""
+    with get_sync_checkpointer() as memory:
+        checkpoint_counts = []
+        for checkpoint_tuple in memory.list(config={"configurable": {"thread_id": thread_id}}):
+            checkpoint_data = checkpoint_tuple.checkpoint or {}
+            messages = checkpoint_data.get('channel_values', {}).get('messages')
+            if messages is not None:
+                checkpoint_counts.append((checkpoint_data.get('ts'), len(messages)))
+    # list() 按从新到旧返回
+    return _assign_message_timestamps(reversed(checkpoint_counts))
+
+
+def get_message_timestamps(thread_id: str) -> Dict[int, str]:
+    """
+    获取会话中每条消息首次出现时所在 checkpoint 的时间戳（消息下标 → ISO 时间字符串）
+
+    PostgreSQL 下只读取 checkpoint 的 ts/版本号以及 messages blob 的头部字节（列表长度），
+    不反序列化每个历史版本的完整消息列表
+    """
+    if get_database_type() != 'postgres':
+        return _message_timestamps_from_checkpoints(thread_id)
+
+    try:
+        with _postgres_connection() as conn:
+            if not _postgres_checkpoints_table_exists(conn):
+                return {}
+            checkpoint_rows = conn.execute("""
+                SELECT checkpoint->>'ts' AS ts, checkpoint->'channel_versions'->>'messages' AS version
+                FROM checkpoints
+                WHERE thread_id = %s AND checkpoint_ns = ''
+                ORDER BY checkpoint_id
+            """, (thread_id,)).fetchall()
+            blob_rows = conn.execute("""
+                SELECT version, type, substring(blob from 1 for 5) AS head
+                FROM checkpoint_blobs
+                WHERE thread_id = %s AND checkpoint_ns = '' AND channel = 'messages'
+            """, (thread_id,)).fetchall()
+
+            counts = {row['version']: _msgpack_array_length(row['type'], row['head']) for row in blob_rows}
+            unknown_versions = [version for version, count in counts.items() if count is None]
+            if unknown_versions:
+                # 非 msgpack 格式的版本需要完整反序列化
+                with get_sync_checkpointer() as checkpointer:
+                    serde = checkpointer.serde
+                for row in conn.execute("""
+                    SELECT version, type, blob FROM checkpoint_blobs
+                    WHERE thread_id = %s AND checkpoint_ns = '' AND channel = 'messages' AND version = ANY(%s)
+                """, (thread_id, unknown_versions)).fetchall():
+                    counts[row['version']] = len(serde.loads_typed((row['type'], bytes(row['blob']))))
+    except Exception as e:
+        logger.warning(f"Failed to read message timestamps for {thread_id}, falling back to full scan: {e}")
+        return _message_timestamps_from_checkpoints(thread_id)
+
+    return _assign_message_timestamps(
+        (row['ts'], counts.get(row['version'])) for row in checkpoint_rows
+    )
+
+
 def rollback_checkpoints_to_count(thread_id: str, keep_count: int) -> int:
     """
     回滚对话历史，只保留前 keep_count 条消息
@@ -313,33 +562,26 @@ def _rollback_by_modifying_blobs(thread_id: str, keep_count: int, original_count
     当没有合适的历史 checkpoint 时使用此方法
     """
     if get_database_type() == 'postgres':
-        import psycopg2
-        conn_string = get_db_connection_string()
-
         # 先获取 serde（需要在 checkpointer 上下文中）
         with get_sync_checkpointer() as checkpointer:
             serde = checkpointer.serde
 
         try:
-            conn = psycopg2.connect(conn_string)
-            try:
-                cursor = conn.cursor()
-
+            with _postgres_connection() as conn, conn.transaction():
                 # 获取最新的 messages blob（包括 type 列）
-                cursor.execute("""
+                row = conn.execute("""
                     SELECT version, type, blob
                     FROM checkpoint_blobs
                     WHERE thread_id = %s AND channel = 'messages'
                     ORDER BY version DESC
                     LIMIT 1
-                """, (thread_id,))
-                row = cursor.fetchone()
+                """, (thread_id,)).fetchone()
 
                 if not row:
                     logger.warning(f"[rollback] No messages blob found")
                     return 0
 
-                version, blob_type, blob = row
+                version, blob_type, blob = row['version'], row['type'], row['blob']
                 if isinstance(blob, memoryview):
                     blob = bytes(blob)
 
@@ -358,37 +600,39 @@ def _rollback_by_modifying_blobs(thread_id: str, keep_count: int, original_count
                 logger.info(f"[rollback] Re-serialized to {len(truncated_messages)} messages, blob_type={new_blob_type}")
 
                 # 更新 blob
-                cursor.execute("""
+                conn.execute("""
                     UPDATE checkpoint_blobs
                     SET blob = %s, type = %s
                     WHERE thread_id = %s AND channel = 'messages' AND version = %s
                 """, (new_blob, new_blob_type, thread_id, version))
 
                 # 删除其他版本的 messages blobs
-                cursor.execute("""
+                conn.execute("""
                     DELETE FROM checkpoint_blobs
                     WHERE thread_id = %s AND channel = 'messages' AND version != %s
                 """, (thread_id, version))
 
-                # 只保留最新的 checkpoint
-                cursor.execute("""
-                    DELETE FROM checkpoints
+                # 只保留最新的 checkpoint（及其 writes）
+                latest = conn.execute("""
+                    SELECT checkpoint_id FROM checkpoints
                     WHERE thread_id = %s
-                    AND checkpoint_id NOT IN (
-                        SELECT checkpoint_id FROM checkpoints
-                        WHERE thread_id = %s
-                        ORDER BY checkpoint_id DESC
-                        LIMIT 1
-                    )
-                """, (thread_id, thread_id))
-
-                conn.commit()
-                deleted_count = original_count - keep_count
-                logger.info(f"[rollback] Successfully truncated messages, deleted {deleted_count}")
-                return deleted_count
-
-            finally:
-                conn.close()
+                    ORDER BY checkpoint_id DESC
+                    LIMIT 1
+                """, (thread_id,)).fetchone()
+                if latest:
+                    conn.execute("""
+                        DELETE FROM checkpoint_writes
+                        WHERE thread_id = %s AND checkpoint_id != %s
+                    """, (thread_id, latest['checkpoint_id']))
+                    conn.execute("""
+                        DELETE FROM checkpoints
+                        WHERE thread_id = %s AND checkpoint_id != %s
+                    """, (thread_id, latest['checkpoint_id']))
+
+            deleted_count = original_count - keep_count
+            logger.info(f"[rollback] Successfully truncated messages, deleted {deleted_count}")
+            return deleted_count
+
         except Exception as e:
             logger.error(f"[rollback] _rollback_by_modifying_blobs error: {e}", exc_info=True)
             return 0
@@ -399,18 +643,16 @@ def _rollback_by_modifying_blobs(thread_id: str, keep_count: int, original_count
 
 
 def _delete_checkpoints_after(thread_id: str, keep_checkpoint_id: str, logger) -> int:
-    """删除指定 checkpoint 之后的所有 checkpoints"""
+    """删除指定 checkpoint 之后的所有 checkpoints（及其 writes）"""
     if get_database_type() == 'postgres':
-        import psycopg2
-        conn_string = get_db_connection_string()
-
         try:
-            conn = psycopg2.connect(conn_string)
-            try:
-                cursor = conn.cursor()
-
+            with _postgres_connection() as conn, conn.transaction():
                 # 删除比目标 checkpoint 更新的 checkpoints
-                cursor.execute("""
+                conn.execute("""
+                    DELETE FROM checkpoint_writes
+                    WHERE thread_id = %s AND checkpoint_id > %s
+                """, (thread_id, keep_checkpoint_id))
+                cursor = conn.execute("""
                     DELETE FROM checkpoints
                     WHERE thread_id = %s AND checkpoint_id > %s
                 """, (thread_id, keep_checkpoint_id))
@@ -419,11 +661,8 @@ def _delete_checkpoints_after(thread_id: str, keep_checkpoint_id: str, logger) -
                 # 删除对应的 blobs (根据 checkpoints 中的 channel_versions)
                 # 由于 blobs 可能被多个 checkpoints 引用，这里简单起见不删除
 
-                conn.commit()
-                logger.info(f"[rollback] Deleted {deleted} checkpoints after {keep_checkpoint_id}")
-                return deleted
-            finally:
-                conn.close()
+            logger.info(f"[rollback] Deleted {deleted} checkpoints after {keep_checkpoint_id}")
+            return deleted
         except Exception as e:
             logger.error(f"[rollback] _delete_checkpoints_after error: {e}", exc_info=True)
             return 0
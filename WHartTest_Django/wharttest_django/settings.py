@@ -193,6 +193,36 @@ else:
             }
         }
 
+# LangGraph Checkpointer 连接池（仅 postgres 模式）
+# 对话历史读写复用进程级连接池，避免每次请求建立连接并执行 setup()
+LANGGRAPH_CHECKPOINTER_POOL_ENABLED = os.environ.get('LANGGRAPH_CHECKPOINTER_POOL_ENABLED', 'True') == 'True'
+LANGGRAPH_CHECKPOINTER_POOL_MIN_SIZE = int(os.environ.get('LANGGRAPH_CHECKPOINTER_POOL_MIN_SIZE', '1'))
+LANGGRAPH_CHECKPOINTER_POOL_MAX_SIZE = int(os.environ.get('LANGGRAPH_CHECKPOINTER_POOL_MAX_SIZE', '10'))
+LANGGRAPH_CHECKPOINTER_POOL_TIMEOUT = int(os.environ.get('LANGGRAPH_CHECKPOINTER_POOL_TIMEOUT', '30'))  # 获取连接超时(秒)
+
+# SSE 流式输出：LLM 令牌按时间/字节窗口合并为一帧发送
+SSE_FLUSH_INTERVAL_MS = int(os.environ.get('SSE_FLUSH_INTERVAL_MS', '30'))
+SSE_FLUSH_BYTES = int(os.environ.get('SSE_FLUSH_BYTES', '256'))
+
+# LLM 客户端：每个服务商（API 地址）同时进行中的请求上限，0 表示不限制
+LLM_PROVIDER_MAX_CONCURRENCY = int(os.environ.get('LLM_PROVIDER_MAX_CONCURRENCY', '8'))
+
+# 上下文 Token 计数缓存条数（按编码器 + 消息内容哈希），0 表示不缓存
+CONTEXT_TOKEN_CACHE_SIZE = int(os.environ.get('CONTEXT_TOKEN_CACHE_SIZE', '10000'))
+
+# Agent Loop 工具调用：同一步骤中的多个工具调用并发执行
+AGENT_TOOL_MAX_CONCURRENCY = int(os.environ.get('AGENT_TOOL_MAX_CONCURRENCY', '4'))
+# 有状态工具（名称通配符，逗号分隔）按原顺序依次执行，如浏览器操作类 MCP 工具
+AGENT_SEQUENTIAL_TOOLS = [
+    pattern.strip() for pattern in os.environ.get('AGENT_SEQUENTIAL_TOOLS', 'browser_*,playwright_*').split(',')
+    if pattern.strip()
+]
+# Agent Loop 任务/步骤/Blackboard 缓冲写入：按间隔(秒)或步骤条数批量保存，任务结束时立即保存
+AGENT_JOURNAL_FLUSH_INTERVAL = float(os.environ.get('AGENT_JOURNAL_FLUSH_INTERVAL', '2'))
+AGENT_JOURNAL_MAX_PENDING_STEPS = int(os.environ.get('AGENT_JOURNAL_MAX_PENDING_STEPS', '20'))
+# 进程内执行 Agent Loop（如 Celery 任务）结束时等待后台工具摘要完成的最长时间(秒)，超时未完成的摘要被取消
+AGENT_TOOL_SUMMARY_DRAIN_TIMEOUT = float(os.environ.get('AGENT_TOOL_SUMMARY_DRAIN_TIMEOUT', '30'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -538,6 +568,75 @@ CELERY_TASK_SOFT_TIME_LIMIT = 25 * 60  # 软超时时间(秒) - 25分钟
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # Worker预取任务数量
 CELERY_WORKER_MAX_TASKS_PER_CHILD = 1000  # Worker执行多少任务后重启
 
+# 跨进程信号缓存（测试执行取消信号、知识库检索版本号：Web 进程与 Celery worker 共享）
+# 默认使用 Celery broker 所在的 Redis；非 Redis 地址时退化为进程内缓存（仅适用于单进程开发环境）
+SIGNAL_CACHE_URL = os.environ.get('SIGNAL_CACHE_URL', CELERY_BROKER_URL)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'signals': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': SIGNAL_CACHE_URL,
+    } if SIGNAL_CACHE_URL.startswith(('redis://', 'rediss://')) else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'signals',
+    },
+}
+TEST_EXECUTION_SIGNAL_CACHE = 'signals'
+# 执行中检查取消信号的间隔（秒）
+TEST_EXECUTION_CANCEL_CHECK_INTERVAL = float(os.environ.get('TEST_EXECUTION_CANCEL_CHECK_INTERVAL', '1'))
+
+# 知识库文档处理任务队列
+# 设置后文档入库任务路由到独立队列，由专用 worker 以有限并发消费，避免批量上传挤占其他任务
+# 健康检查等轻量任务不路由到该队列，避免排在长时间入库任务之后
+# 未设置时使用默认队列（本地开发只需启动一个 worker）
+KNOWLEDGE_TASK_QUEUE = os.environ.get('KNOWLEDGE_TASK_QUEUE', '')
+if KNOWLEDGE_TASK_QUEUE:
+    CELERY_TASK_ROUTES = {
+        'knowledge.process_document': {'queue': KNOWLEDGE_TASK_QUEUE},
+    }
+
+# 测试套件调度：按历史执行耗时最长优先（LPT）启动用例/脚本
+TEST_SUITE_LPT_SCHEDULING = os.environ.get('TEST_SUITE_LPT_SCHEDULING', 'True') == 'True'
+# 估算耗时参考的最近执行次数，以及没有任何历史记录时的估算值（秒）
+TEST_SUITE_DURATION_HISTORY = int(os.environ.get('TEST_SUITE_DURATION_HISTORY', '10'))
+TEST_SUITE_DEFAULT_TASK_DURATION = float(os.environ.get('TEST_SUITE_DEFAULT_TASK_DURATION', '60'))
+
+# 测试套件分布式执行
+# 套件任务数（用例 + 脚本）达到阈值时，按分片分发到多个 worker 执行，由 chord 回调汇总结果；0 表示不启用
+# 同时执行的分片数不超过套件的最大并发数
+TEST_SUITE_DISTRIBUTED_THRESHOLD = int(os.environ.get('TEST_SUITE_DISTRIBUTED_THRESHOLD', '0'))
+# 每个分片（一个 Celery 任务）包含的用例/脚本数，单个分片受 CELERY_TASK_TIME_LIMIT 限制
+TEST_SUITE_SHARD_SIZE = int(os.environ.get('TEST_SUITE_SHARD_SIZE', '1'))
+# 测试套件最长执行时间（秒）：超过后由定时清理任务标记为失败
+TEST_SUITE_MAX_DURATION = int(os.environ.get('TEST_SUITE_MAX_DURATION', '86400'))
+if TEST_SUITE_DISTRIBUTED_THRESHOLD:
+    # chord 计数键随结果一起过期，过期后汇总回调不会执行，须覆盖最长执行时间
+    CELERY_RESULT_EXPIRES = max(CELERY_RESULT_EXPIRES, TEST_SUITE_MAX_DURATION)
+# 卡住执行的清理间隔（秒），以及所有任务结束后等待汇总回调的宽限时间（秒）
+TEST_EXECUTION_SWEEP_INTERVAL = int(os.environ.get('TEST_EXECUTION_SWEEP_INTERVAL', '600'))
+TEST_EXECUTION_SWEEP_GRACE = int(os.environ.get('TEST_EXECUTION_SWEEP_GRACE', '600'))
+
+# 知识库模型服务健康检查（由 celery beat 定时执行，结果在知识库 system_status 接口中展示）
+KNOWLEDGE_HEALTH_CHECK_INTERVAL = int(os.environ.get('KNOWLEDGE_HEALTH_CHECK_INTERVAL', '300'))
+# 对话会话登记补齐（扫描 checkpoints 中未登记 ChatSession 的会话）
+CHAT_SESSION_RECONCILE_INTERVAL = int(os.environ.get('CHAT_SESSION_RECONCILE_INTERVAL', '3600'))
+CELERY_BEAT_SCHEDULE = {
+    'knowledge-health-check': {
+        'task': 'knowledge.health_check',
+        'schedule': KNOWLEDGE_HEALTH_CHECK_INTERVAL,
+    },
+    'chat-session-reconcile': {
+        'task': 'langgraph_integration.reconcile_chat_sessions',
+        'schedule': CHAT_SESSION_RECONCILE_INTERVAL,
+    },
+    'testcases-sweep-stuck-executions': {
+        'task': 'testcases.sweep_stuck_executions',
+        'schedule': TEST_EXECUTION_SWEEP_INTERVAL,
+    },
+}
+
 # Celery日志配置
 CELERY_WORKER_LOG_FORMAT = '[%(asctime)s: %(levelname)s/%(processName)s] %(message)s'
 CELERY_WORKER_TASK_LOG_FORMAT = '[%(asctime)s: %(levelname)s/%(processName)s][%(task_name)s(%(task_id)s)] %(message)s'
@@ -546,3 +645,22 @@ CELERY_WORKER_TASK_LOG_FORMAT = '[%(asctime)s: %(levelname)s/%(processName)s][%(
 # 在Docker环境中应设置为 http://backend:8000
 # 在本地开发环境中可以使用 http://localhost:8000
 BASE_URL = os.environ.get('DJANGO_BASE_URL', 'http://localhost:8000')
+
+# 知识库嵌入配置
+# 批量嵌入：每个 HTTP 请求打包的文本数量、并发批次数、失败批次重试次数
+KNOWLEDGE_EMBEDDING_BATCH_SIZE = int(os.environ.get('KNOWLEDGE_EMBEDDING_BATCH_SIZE', '32'))
+KNOWLEDGE_EMBEDDING_MAX_WORKERS = int(os.environ.get('KNOWLEDGE_EMBEDDING_MAX_WORKERS', '4'))
+KNOWLEDGE_EMBEDDING_MAX_RETRIES = int(os.environ.get('KNOWLEDGE_EMBEDDING_MAX_RETRIES', '2'))
+# 流式入库窗口：每个窗口内的分块一起向量化、写入 Qdrant 并保存，限制大文档的峰值内存
+KNOWLEDGE_INGEST_WINDOW_SIZE = int(os.environ.get('KNOWLEDGE_INGEST_WINDOW_SIZE', '128'))
+# 跨知识库联合检索的最大并发数
+KNOWLEDGE_SEARCH_MAX_WORKERS = int(os.environ.get('KNOWLEDGE_SEARCH_MAX_WORKERS', '8'))
+# 混合检索使用 Qdrant Query API 批量检索，仅为最终结果读取 payload（需 Qdrant >= 1.10，不支持时自动降级为分别检索）
+KNOWLEDGE_QDRANT_SERVER_FUSION = os.environ.get('KNOWLEDGE_QDRANT_SERVER_FUSION', 'True') == 'True'
+# 检索缓存：查询向量缓存（LRU+TTL）与检索结果缓存（短TTL，文档变化时失效），TTL单位为秒
+KNOWLEDGE_QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('KNOWLEDGE_QUERY_EMBEDDING_CACHE_SIZE', '1024'))
+KNOWLEDGE_QUERY_EMBEDDING_CACHE_TTL = int(os.environ.get('KNOWLEDGE_QUERY_EMBEDDING_CACHE_TTL', '3600'))
+KNOWLEDGE_SEARCH_RESULT_CACHE_SIZE = int(os.environ.get('KNOWLEDGE_SEARCH_RESULT_CACHE_SIZE', '256'))
+KNOWLEDGE_SEARCH_RESULT_CACHE_TTL = int(os.environ.get('KNOWLEDGE_SEARCH_RESULT_CACHE_TTL', '60'))
+# 知识库版本号所在的缓存（文档变化时递增，检索结果缓存键包含版本号，需在进程间共享）
+KNOWLEDGE_SEARCH_VERSION_CACHE = 'signals'
@@ -0,0 +1,119 @@
+"""
+SSE 流式输出工具
+- encode_sse：SSE 帧编码（优先使用 orjson）
+- SSETokenCoalescer：按时间/字节窗口合并 LLM 令牌，减少帧数与序列化开销
+- iter_with_flush_ticks：在上游无新数据时按合并窗口产生刷新信号
+聊天流式接口与 Agent Loop 流式接口共用
+"""
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 为 requirements.txt 中的依赖
+    orjson = None
+
+
+def encode_sse(data_dict: Dict[str, Any]) -> str:
+    """
+    创建SSE格式的数据，中文字符按 UTF-8 原样输出
+    """
+    if orjson is not None:
+        try:
+            return f"data: {orjson.dumps(data_dict, option=orjson.OPT_NON_STR_KEYS).decode()}\n\n"
+        except TypeError:
+            # orjson 不支持的类型（如超过 64 位的整数）交给标准库处理，保持原有的异常行为
+            pass
+    return f"data: {json.dumps(data_dict, ensure_ascii=False)}\n\n"
+
+
+class SSETokenCoalescer:
+    """
+    令牌合并器：缓冲同一类型的文本片段，达到字节阈值或时间窗口后合并为一帧
+
+    调用方在输出其他类型的事件前必须先调用 flush()，以保证事件顺序
+    """
+
+    def __init__(self, event_type: str, flush_interval: Optional[float] = None,
+                 flush_bytes: Optional[int] = None, clock: Callable[[], float] = time.monotonic,
+                 encode: Callable[[Dict[str, Any]], Any] = encode_sse):
+        self.event_type = event_type
+        self.encode = encode
+        self.flush_interval = (
+            flush_interval if flush_interval is not None
+            else getattr(settings, 'SSE_FLUSH_INTERVAL_MS', 30) / 1000
+        )
+        self.flush_bytes = flush_bytes if flush_bytes is not None else getattr(settings, 'SSE_FLUSH_BYTES', 256)
+        self._clock = clock
+        self._parts = []
+        self._size = 0
+        self._started_at = None
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._parts)
+
+    def add(self, text: str):
+        """缓冲文本片段，需要刷新时返回合并后的事件（默认编码为 SSE 帧）"""
+        if not text:
+            return None
+        if not self._parts:
+            self._started_at = self._clock()
+        self._parts.append(text)
+        self._size += len(text.encode('utf-8'))
+        if self._size >= self.flush_bytes or self._clock() - self._started_at >= self.flush_interval:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """输出缓冲区中的全部内容，缓冲区为空时返回 None"""
+        if not self._parts:
+            return None
+        text = ''.join(self._parts)
+        self._parts = []
+        self._size = 0
+        self._started_at = None
+        return self.encode({'type': self.event_type, 'data': text})
+
+    def time_until_flush(self) -> Optional[float]:
+        """距离时间窗口到期的秒数，缓冲区为空时返回 None"""
+        if not self._parts:
+            return None
+        return max(0.0, self._started_at + self.flush_interval - self._clock())
+
+
+FLUSH_TICK = object()
+
+
+async def iter_with_flush_ticks(source: AsyncIterator, coalescer: SSETokenCoalescer) -> AsyncIterator:
+    """
+    迭代异步数据源；合并器有待发送内容且时间窗口到期仍无新数据时产生 FLUSH_TICK
+
+    上游的 __anext__ 在等待期间不会被取消，只在本生成器关闭时取消
+    """
+    iterator = source.__aiter__()
+    pending_next = None
+    try:
+        while True:
+            if pending_next is None:
+                pending_next = asyncio.ensure_future(iterator.__anext__())
+            timeout = coalescer.time_until_flush()
+            if timeout is not None:
+                done, _ = await asyncio.wait({pending_next}, timeout=timeout)
+                if not done:
+                    yield FLUSH_TICK
+                    continue
+            try:
+                item = await pending_next
+            except StopAsyncIteration:
+                pending_next = None
+                return
+            pending_next = None
+            yield item
+    finally:
+        if pending_next is not None and not pending_next.done():
+            pending_next.cancel()